@@ -0,0 +1,89 @@
+"""Benchmark image size and encode time for each output encoding.
+
+Usage: python backend/benchmarks/bench_encoding.py [--repeat N] [--size PX]
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_encoding import compact_image, encode_image, image_format_supported  # noqa: E402
+from qr_matrix import get_qr_matrix  # noqa: E402
+from qr_render import decode_logo_data, get_preloaded_logo, parse_design, render_qr_canvas  # noqa: E402
+
+PAYLOAD = "https://qrplanet.example.com/r/r_4f2a9c1d"
+
+DESIGNS = {
+    "square b/w": {},
+    "square colour": {"foreground_color": "#1E3A8A", "background_color": "#F8FAFC"},
+    "rounded": {"pattern_style": "rounded"},
+    "circle colour": {"pattern_style": "circle", "foreground_color": "#7C3AED"},
+    "gradient": {"gradient_enabled": True, "gradient_color1": "#F58529", "gradient_color2": "#C13584"},
+    "logo": {"logo_data": get_preloaded_logo("instagram")},
+    "frame + text": {"frame_style": "rounded", "frame_text": "Scan me"},
+}
+
+
+def legacy_png(img):
+    """The original encoder: always 24-bit RGB (quality is ignored for PNG)"""
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", quality=95)
+    return buf.getvalue()
+
+
+ENCODINGS = {
+    "legacy rgb": legacy_png,
+    "png": lambda img: encode_image(img, "png"),
+    "png level 9": lambda img: encode_image(img, "png", compress_level=9),
+    "png optimize": lambda img: encode_image(img, "png", compress_level=9, optimize=True),
+    "webp lossless": lambda img: encode_image(img, "webp"),
+    "avif": lambda img: encode_image(img, "avif"),
+}
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def render(design, size):
+    options = parse_design(design)
+    matrix = get_qr_matrix(PAYLOAD, options["error_correction"])
+    logo = decode_logo_data(options["logo_data"]) if options["logo_data"] else None
+    return render_qr_canvas(matrix, options, logo, size=size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", type=int, default=None, help="output size in px (default: box_size 10)")
+    args = parser.parse_args()
+
+    encodings = {
+        name: fn for name, fn in ENCODINGS.items()
+        if name.split()[0] not in ("webp", "avif") or image_format_supported(name.split()[0])
+    }
+
+    print(f"{'design':<15} {'mode':>5} {'encoding':<14} {'bytes':>8} {'ms':>8} {'vs legacy':>9}")
+    for design_name, design in DESIGNS.items():
+        img = render(design, args.size)
+        mode = compact_image(img).mode
+        legacy_bytes = None
+        for encoding_name, encode in encodings.items():
+            elapsed, data = best_of(lambda: encode(img), args.repeat)
+            legacy_bytes = legacy_bytes or len(data)
+            print(
+                f"{design_name:<15} {mode:>5} {encoding_name:<14} {len(data):>8} {elapsed * 1000:>8.2f}"
+                f" {len(data) / legacy_bytes:>8.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
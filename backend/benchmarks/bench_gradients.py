@@ -0,0 +1,99 @@
+"""Benchmark the vectorized gradient engine against the legacy per-pixel loop.
+
+Usage: python backend/benchmarks/bench_gradients.py [--repeat N]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gradients import gradient_image  # noqa: E402
+
+# Canvas sizes produced by create_qr_image (box_size=10, border=4) for
+# QR versions 1, 3, 5 and 10
+BOX_SIZES = [290, 370, 450, 650]
+
+COLOR1 = "#F58529"
+COLOR2 = "#C13584"
+
+
+def legacy_gradient_image(size, color1, color2, gradient_type='linear', direction='horizontal'):
+    """The original ImageDraw implementation, kept for comparison"""
+    img = Image.new('RGB', size)
+    draw = ImageDraw.Draw(img)
+
+    if gradient_type == 'linear':
+        if direction == 'horizontal':
+            for x in range(size[0]):
+                ratio = x / size[0]
+                r = int(int(color1[1:3], 16) * (1 - ratio) + int(color2[1:3], 16) * ratio)
+                g = int(int(color1[3:5], 16) * (1 - ratio) + int(color2[3:5], 16) * ratio)
+                b = int(int(color1[5:7], 16) * (1 - ratio) + int(color2[5:7], 16) * ratio)
+                draw.line([(x, 0), (x, size[1])], fill=(r, g, b))
+        else:
+            for y in range(size[1]):
+                ratio = y / size[1]
+                r = int(int(color1[1:3], 16) * (1 - ratio) + int(color2[1:3], 16) * ratio)
+                g = int(int(color1[3:5], 16) * (1 - ratio) + int(color2[3:5], 16) * ratio)
+                b = int(int(color1[5:7], 16) * (1 - ratio) + int(color2[5:7], 16) * ratio)
+                draw.line([(0, y), (size[0], y)], fill=(r, g, b))
+    elif gradient_type == 'radial':
+        center_x, center_y = size[0] // 2, size[1] // 2
+        max_distance = ((center_x ** 2 + center_y ** 2) ** 0.5)
+        for y in range(size[1]):
+            for x in range(size[0]):
+                distance = ((x - center_x) ** 2 + (y - center_y) ** 2) ** 0.5
+                ratio = min(distance / max_distance, 1.0)
+                r = int(int(color1[1:3], 16) * (1 - ratio) + int(color2[1:3], 16) * ratio)
+                g = int(int(color1[3:5], 16) * (1 - ratio) + int(color2[3:5], 16) * ratio)
+                b = int(int(color1[5:7], 16) * (1 - ratio) + int(color2[5:7], 16) * ratio)
+                draw.point((x, y), fill=(r, g, b))
+
+    return img
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = [
+        ("linear", "horizontal"),
+        ("linear", "vertical"),
+        ("radial", "horizontal"),
+    ]
+
+    print(f"{'mode':<20} {'size':>9} {'legacy ms':>10} {'numpy ms':>10} {'speedup':>8} {'max diff':>8}")
+    for gradient_type, direction in cases:
+        for box in BOX_SIZES:
+            size = (box, box)
+            legacy_time, legacy = best_of(
+                lambda: legacy_gradient_image(size, COLOR1, COLOR2, gradient_type, direction), args.repeat
+            )
+            fast_time, fast = best_of(
+                lambda: gradient_image(size, COLOR1, COLOR2, gradient_type, direction), args.repeat
+            )
+            diff = np.abs(np.asarray(legacy, dtype=np.int16) - np.asarray(fast, dtype=np.int16)).max()
+            mode = gradient_type if gradient_type == "radial" else f"{gradient_type}/{direction}"
+            print(
+                f"{mode:<20} {box:>4}x{box:<4} {legacy_time * 1000:>10.2f} {fast_time * 1000:>10.2f}"
+                f" {legacy_time / fast_time:>7.1f}x {diff:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
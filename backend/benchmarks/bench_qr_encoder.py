@@ -0,0 +1,137 @@
+"""Check qr_encoder against qrcode and compare their speed.
+
+The corpus is deterministic: for every EC level, a byte-mode payload filling
+each of the 40 versions exactly, the same plus one byte (forcing the next
+version), and random numeric, alphanumeric, ASCII, UTF-8 and mixed payloads
+of lengths spread over the whole capacity range. Every case must give the
+same version, mask pattern and modules as qrcode (or fail the same way);
+any difference exits with status 1.
+
+Usage: python backend/benchmarks/bench_qr_encoder.py [--random N] [--seed N] [--repeat N]
+"""
+import argparse
+import random
+import statistics
+import string
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import qrcode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import qr_encoder  # noqa: E402
+from qr_matrix import ERROR_CORRECTION_LEVELS  # noqa: E402
+
+ALPHABETS = {
+    "numeric": string.digits,
+    "alphanumeric": qr_encoder.ALPHA_NUM.decode(),
+    "ascii": string.ascii_letters + string.digits + "-._~:/?#[]@!$&'()*+,;=% \n",
+    "utf8": "aéüß漢字😀 -",
+}
+
+# Timed payloads, roughly what the app encodes
+TIMED = {
+    "url": "https://qrplanet.example.com/r/r_4f2a9c1d",
+    "wifi": "WIFI:T:WPA;S:Cafe Guest Network;P:correct-horse-battery-staple;;",
+    "vcard (~400 B)": "BEGIN:VCARD\nVERSION:3.0\n" + "NOTE:" + "x" * 360 + "\nEND:VCARD",
+    "2 KB text": "Lorem ipsum dolor sit amet, " * 73,
+}
+
+
+def reference(payload, error_correction):
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECTION_LEVELS[error_correction], border=0)
+    qr.add_data(payload)
+    qr.best_fit()
+    mask_pattern = qr.best_mask_pattern()
+    qr.makeImpl(False, mask_pattern)
+    return qr.version, mask_pattern, np.array(qr.modules, dtype=bool)
+
+
+def build_corpus(random_cases, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for level in ERROR_CORRECTION_LEVELS:
+        limits = qr_encoder.BIT_LIMITS[level]
+        for version in range(1, 41):
+            # Byte mode: 4 mode bits plus the character count field
+            count_bits = qr_encoder.LENGTH_BITS[qr_encoder._size_class(version)][qr_encoder.MODE_BYTE]
+            capacity = (limits[version] - 4 - count_bits) // 8
+            payload = "".join(rng.choice(string.ascii_lowercase) for _ in range(capacity))
+            corpus.append((payload, level))
+            corpus.append((payload + "z", level))
+    for _ in range(random_cases):
+        level = rng.choice(list(ERROR_CORRECTION_LEVELS))
+        length = int(rng.choice([rng.randint(0, 40), rng.randint(0, 400), rng.randint(0, 3000)]))
+        kind = rng.choice(list(ALPHABETS) + ["mixed"])
+        if kind == "mixed":
+            parts = []
+            while sum(map(len, parts)) < length:
+                alphabet = ALPHABETS[rng.choice(list(ALPHABETS))]
+                parts.append("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 60))))
+            payload = "".join(parts)[:length]
+        else:
+            payload = "".join(rng.choice(ALPHABETS[kind]) for _ in range(length))
+        corpus.append((payload, level))
+    return corpus
+
+
+def outcome(encode, payload, level):
+    try:
+        return encode(payload, level)
+    except ValueError as e:
+        return type(e)
+
+
+def verify(corpus):
+    mismatches = 0
+    versions = set()
+    for payload, level in corpus:
+        expected = outcome(reference, payload, level)
+        actual = outcome(qr_encoder.encode, payload, level)
+        if isinstance(expected, tuple) and isinstance(actual, tuple):
+            same = expected[:2] == actual[:2] and np.array_equal(expected[2], actual[2])
+            versions.add((expected[0], level))
+        else:
+            same = expected is actual
+        if not same:
+            mismatches += 1
+            got = actual[:2] if isinstance(actual, tuple) else actual
+            want = expected[:2] if isinstance(expected, tuple) else expected
+            print(f"MISMATCH ec={level} len={len(payload)} {payload[:30]!r}: expected {want}, got {got}")
+    print(f"Checked {len(corpus)} payloads ({len(versions)} version/EC combinations): {mismatches} mismatches")
+    return mismatches
+
+
+def timed(encode, payload, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(payload, "H" if len(payload) < 1000 else "L")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--random", type=int, default=2000, help="random payloads on top of the version sweep")
+    parser.add_argument("--seed", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    mismatches = verify(build_corpus(args.random, args.seed))
+
+    print(f"\n{'payload':<16} {'qrcode ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for name, payload in TIMED.items():
+        before = timed(reference, payload, args.repeat)
+        after = timed(qr_encoder.encode, payload, args.repeat)
+        print(f"{name:<16} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
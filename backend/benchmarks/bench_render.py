@@ -0,0 +1,235 @@
+"""Benchmark create_qr_image across the design matrix.
+
+Each case is a payload/design combination rendered end to end (encode,
+modules, gradient, logo, frame, PNG encode). The suite sweeps one axis at a
+time from a plain baseline: payload length x error correction, every
+pattern_style, gradient linear/radial, logo on/off, and every frame style
+with and without text. --full renders the whole cross product instead.
+
+Latency is reported as p50/p95 over --repeat runs with warm caches (use
+--cold to clear the render caches before every run). Peak memory is the
+tracemalloc peak of one separate run. Results can be written as JSON and
+compared against a previous run to catch regressions:
+
+Usage: python backend/benchmarks/bench_render.py [--repeat N] [--cold] [--full] [--filter TEXT]
+                                                 [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import PIL
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from logos import logo_cache  # noqa: E402
+from qr_matrix import clear_matrix_cache  # noqa: E402
+from qr_raster import STAMP_STYLES, stamp_tiles  # noqa: E402
+from qr_render import (  # noqa: E402
+    clear_frame_overlay_cache, create_qr_image, get_frame_text_layout, get_preloaded_logo, get_watermark_overlay
+)
+
+PAYLOADS = {
+    "url": "https://qrplanet.example.com/r/r_4f2a9c1d",
+    "long url": "https://shop.example.com/products/limited-edition-ceramic-pour-over-coffee-set"
+                "?utm_source=print&utm_medium=qr&utm_campaign=autumn_catalogue_2024&utm_content=page_17_hero",
+    "wifi": "WIFI:T:WPA;S:Cafe Guest Network;P:correct-horse-battery-staple;;",
+    "vcard": "\n".join([
+        "BEGIN:VCARD",
+        "VERSION:3.0",
+        "N:Lindqvist;Annika;Maria;Dr.;PhD",
+        "FN:Dr. Annika Maria Lindqvist",
+        "ORG:Nordic Instruments International AB;Research and Development",
+        "TITLE:Head of Optical Systems Engineering",
+        "TEL;TYPE=WORK,VOICE:+46 8 555 012 345",
+        "TEL;TYPE=CELL:+46 70 555 67 89",
+        "EMAIL;TYPE=INTERNET:annika.lindqvist@nordic-instruments.example.com",
+        "ADR;TYPE=WORK:;Building 4, Floor 3;Teknikringen 112;Stockholm;;114 28;Sweden",
+        "URL:https://www.nordic-instruments.example.com/people/annika-lindqvist",
+        "NOTE:Available for conference talks on adaptive optics and precision metrology.",
+        "END:VCARD",
+    ]),
+}
+
+ERROR_CORRECTIONS = ["L", "M", "Q", "H"]
+PATTERN_STYLES = ["square"] + sorted(STAMP_STYLES)
+GRADIENTS = {
+    "none": {},
+    "linear": {"gradient_enabled": True, "gradient_type": "linear",
+               "gradient_color1": "#F58529", "gradient_color2": "#C13584"},
+    "radial": {"gradient_enabled": True, "gradient_type": "radial",
+               "gradient_color1": "#F58529", "gradient_color2": "#C13584"},
+}
+LOGOS = {
+    "none": {},
+    "logo": {"logo_type": "preloaded", "logo_data": get_preloaded_logo("instagram")},
+}
+FRAMES = {"none": {}}
+for _style in ("square", "rounded", "circle"):
+    FRAMES[_style] = {"frame_style": _style}
+    FRAMES[f"{_style}+text"] = {"frame_style": _style, "frame_text": "Scan me"}
+
+BASELINE = {"payload": "url", "ec": "H", "pattern": "square", "gradient": "none", "logo": "none", "frame": "none"}
+
+
+def make_case(params):
+    design = {"error_correction": params["ec"], "pattern_style": params["pattern"]}
+    for axis, table in (("gradient", GRADIENTS), ("logo", LOGOS), ("frame", FRAMES)):
+        design.update(table[params[axis]])
+    name = " ".join(f"{axis}={value}" for axis, value in params.items() if value != BASELINE[axis]) or "baseline"
+    return {"name": name, "params": params, "payload": PAYLOADS[params["payload"]], "design": design}
+
+
+def build_cases(full):
+    axes = {
+        "payload": list(PAYLOADS),
+        "ec": ERROR_CORRECTIONS,
+        "pattern": PATTERN_STYLES,
+        "gradient": list(GRADIENTS),
+        "logo": list(LOGOS),
+        "frame": list(FRAMES),
+    }
+    if full:
+        combos = [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+    else:
+        # Payload and error correction together decide the QR version, so sweep
+        # them as a grid; every other axis is varied alone from the baseline
+        combos = [{**BASELINE, "payload": p, "ec": ec} for p in PAYLOADS for ec in ERROR_CORRECTIONS]
+        for axis in ("pattern", "gradient", "logo", "frame"):
+            combos += [{**BASELINE, axis: value} for value in axes[axis] if value != BASELINE[axis]]
+    return [make_case(params) for params in combos]
+
+
+def clear_render_caches():
+    clear_matrix_cache()
+    stamp_tiles.cache_clear()
+    clear_frame_overlay_cache()
+    get_frame_text_layout.cache_clear()
+    get_watermark_overlay.cache_clear()
+    logo_cache.clear()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def run_case(case, repeat, cold):
+    render = lambda: create_qr_image(case["payload"], case["design"])  # noqa: E731
+    data = render()  # warm-up, and the output size
+
+    timings = []
+    for _ in range(repeat):
+        if cold:
+            clear_render_caches()
+        start = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - start)
+
+    if cold:
+        clear_render_caches()
+    tracemalloc.start()
+    render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": case["name"],
+        "params": case["params"],
+        "p50_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        "bytes": len(data),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print p50/bytes changes against a previous run; return the number of regressions"""
+    baseline = {case["name"]: case for case in json.loads(Path(baseline_path).read_text())["cases"]}
+    regressions = 0
+    print(f"\n{'case':<48} {'p50 before':>10} {'p50 after':>10} {'change':>8} {'bytes':>8}")
+    for case in results:
+        before = baseline.get(case["name"])
+        if before is None:
+            continue
+        change = case["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        bytes_change = case["bytes"] - before["bytes"]
+        print(
+            f"{case['name']:<48} {before['p50_ms']:>10.2f} {case['p50_ms']:>10.2f} {change:>+8.0%}"
+            f" {bytes_change:>+8}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--cold", action="store_true", help="clear render caches before every run")
+    parser.add_argument("--full", action="store_true", help="full cross product of all axes")
+    parser.add_argument("--filter", default=None, help="only cases whose name contains this text")
+    parser.add_argument("--output", default=None, help="write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    cases = build_cases(args.full)
+    if args.filter:
+        cases = [case for case in cases if args.filter in case["name"]]
+
+    results = []
+    print(f"{'case':<48} {'p50 ms':>8} {'p95 ms':>8} {'peak KiB':>9} {'bytes':>8}")
+    for case in cases:
+        result = run_case(case, args.repeat, args.cold)
+        results.append(result)
+        print(
+            f"{result['name']:<48} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}"
+            f" {result['peak_kib']:>9.1f} {result['bytes']:>8}"
+        )
+
+    if args.output:
+        report = {
+            "meta": {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "pillow": PIL.__version__,
+                "numpy": np.__version__,
+                "repeat": args.repeat,
+                "cold": args.cold,
+            },
+            "cases": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
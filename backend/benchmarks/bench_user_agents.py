@@ -0,0 +1,77 @@
+"""Measure the user-agent classifier's throughput on real UA strings.
+
+The corpus is the one tests/test_user_agents.py checks the classifier
+against. Throughput is measured for the previous substring checks, the
+classifier with its cache bypassed, and the cached classifier, over the
+corpus repeated --repeat times.
+
+Usage: python backend/benchmarks/bench_user_agents.py [--repeat N]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(BACKEND.parent))
+
+from tests.test_user_agents import CORPUS  # noqa: E402
+from user_agents import _classify, classify_user_agent  # noqa: E402
+
+def legacy_classify(user_agent):
+    """The substring checks scan handlers used before user_agents.py"""
+    device = "desktop"
+    if any(x in user_agent.lower() for x in ["mobile", "android", "iphone", "ipad"]):
+        device = "mobile"
+    elif "tablet" in user_agent.lower():
+        device = "tablet"
+
+    browser = "unknown"
+    if "chrome" in user_agent.lower():
+        browser = "Chrome"
+    elif "firefox" in user_agent.lower():
+        browser = "Firefox"
+    elif "safari" in user_agent.lower():
+        browser = "Safari"
+    elif "edge" in user_agent.lower():
+        browser = "Edge"
+
+    os_type = "unknown"
+    if "windows" in user_agent.lower():
+        os_type = "Windows"
+    elif "mac" in user_agent.lower():
+        os_type = "macOS"
+    elif "linux" in user_agent.lower():
+        os_type = "Linux"
+    elif "android" in user_agent.lower():
+        os_type = "Android"
+    elif "ios" in user_agent.lower() or "iphone" in user_agent.lower():
+        os_type = "iOS"
+    return device, browser, os_type
+
+
+def throughput(classify, uas):
+    start = time.perf_counter()
+    for ua in uas:
+        classify(ua)
+    return len(uas) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    uas = [ua for ua, *_ in CORPUS] * args.repeat
+    print(f"\n{'classifier':<24} {'UAs/s':>12}")
+    for name, classify in (
+        ("substring checks", legacy_classify),
+        ("uncached", _classify.__wrapped__),
+        ("cached", classify_user_agent),
+    ):
+        print(f"{name:<24} {throughput(classify, uas):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
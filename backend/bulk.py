@@ -0,0 +1,231 @@
+"""Helpers for bulk QR generation: row parsing and a streaming ZIP writer.
+
+Rows come in as CSV (header: name, qr_type, content, design; content and
+design cells hold JSON objects) or NDJSON (one JSON object per line). They
+are parsed as the upload streams in, so the raw body is never held whole.
+The archive is produced with zipfile on an unseekable sink that the response
+drains after every entry, so only one image is buffered at a time.
+"""
+import asyncio
+import codecs
+import csv
+import io
+import json
+import re
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+BULK_COLUMNS = ("name", "qr_type", "content", "design")
+
+
+class BulkInputError(ValueError):
+    """Raised for malformed bulk input; the message names the offending row"""
+
+
+class BulkInputTooLarge(BulkInputError):
+    """Raised when the upload exceeds the byte limit"""
+
+
+def _json_cell(value: Any, row_number: int, column: str) -> Optional[Dict[str, Any]]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, dict):
+        return value
+    try:
+        parsed = json.loads(value)
+    except (TypeError, ValueError) as e:
+        raise BulkInputError(f"Row {row_number}: {column} is not valid JSON ({e})")
+    if not isinstance(parsed, dict):
+        raise BulkInputError(f"Row {row_number}: {column} must be a JSON object")
+    return parsed
+
+
+def _normalize_row(raw: Dict[str, Any], row_number: int) -> Dict[str, Any]:
+    if not raw.get("name") or not raw.get("qr_type"):
+        raise BulkInputError(f"Row {row_number}: name and qr_type are required")
+    content = _json_cell(raw.get("content"), row_number, "content")
+    if content is None:
+        raise BulkInputError(f"Row {row_number}: content is required")
+    return {
+        "name": str(raw["name"]),
+        "qr_type": str(raw["qr_type"]),
+        "content": content,
+        "design": _json_cell(raw.get("design"), row_number, "design") or {},
+    }
+
+
+class _Lines:
+    """Iterator over queued lines that, unlike a generator, can be refilled
+    after it runs dry (csv readers resume from it)"""
+
+    def __init__(self):
+        self.queue: Deque[str] = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.queue:
+            raise StopIteration
+        return self.queue.popleft()
+
+
+class BulkRowParser:
+    """Incremental row parser: feed() it chunks of the upload and get back the
+    rows completed so far, then close() for the rest.
+
+    Rows are dicts with name, qr_type, content and design.
+    """
+
+    def __init__(self, input_format: str, max_rows: int):
+        if input_format not in ("csv", "ndjson"):
+            raise BulkInputError(f"Unsupported bulk input format: {input_format}")
+        self.input_format = input_format
+        self.max_rows = max_rows
+        self.rows = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        # Text after the last complete line
+        self._partial = ""
+        self._lines = _Lines()
+        # CSV: lines of a record whose quoted field spans a line break
+        self._record: List[str] = []
+        self._quotes = 0
+        self._reader: Optional[csv.DictReader] = None
+        self._line_number = 0
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
+        return self._parse(self._decode(chunk, final=False), final=False)
+
+    def close(self) -> List[Dict[str, Any]]:
+        return self._parse(self._decode(b"", final=True), final=True)
+
+    def _decode(self, chunk: bytes, final: bool) -> str:
+        try:
+            return self._decoder.decode(chunk, final)
+        except UnicodeDecodeError:
+            raise BulkInputError("Bulk input must be UTF-8")
+
+    def _parse(self, text: str, final: bool) -> List[Dict[str, Any]]:
+        *complete, tail = (self._partial + text).split("\n")
+        lines = [line + "\n" for line in complete]
+        if final:
+            self._partial = ""
+            if tail:
+                lines.append(tail)
+        else:
+            self._partial = tail
+
+        if self.input_format == "ndjson":
+            raw_rows = self._ndjson_rows(lines)
+        else:
+            raw_rows = self._csv_rows(lines, final)
+
+        rows = []
+        for row_number, raw in raw_rows:
+            if self.rows >= self.max_rows:
+                raise BulkInputError(f"At most {self.max_rows} rows per request")
+            rows.append(_normalize_row(raw, row_number))
+            self.rows += 1
+        return rows
+
+    def _csv_rows(self, lines: List[str], final: bool):
+        for line in lines:
+            self._record.append(line)
+            self._quotes += line.count('"')
+            # An odd number of quotes so far means a quoted field continues on the next line
+            if self._quotes % 2 == 0:
+                self._lines.queue.extend(self._record)
+                self._record, self._quotes = [], 0
+        if final:
+            self._lines.queue.extend(self._record)
+            self._record = []
+        if not self._lines.queue:
+            return
+
+        if self._reader is None:
+            self._reader = csv.DictReader(self._lines)
+            missing = {"name", "qr_type", "content"} - set(self._reader.fieldnames or ())
+            if missing:
+                raise BulkInputError(f"CSV header is missing: {', '.join(sorted(missing))}")
+        for raw in self._reader:
+            yield self._reader.line_num, raw
+
+    def _ndjson_rows(self, lines: List[str]):
+        for line in lines:
+            self._line_number += 1
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                raise BulkInputError(f"Row {self._line_number}: invalid JSON ({e})")
+            if not isinstance(raw, dict):
+                raise BulkInputError(f"Row {self._line_number}: expected a JSON object")
+            yield self._line_number, raw
+
+
+async def iter_bulk_rows(chunks: AsyncIterator[bytes], input_format: str, max_rows: int,
+                         max_bytes: int) -> AsyncIterator[Dict[str, Any]]:
+    """Rows of a streamed CSV or NDJSON upload, yielded as soon as each is complete"""
+    parser = BulkRowParser(input_format, max_rows)
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise BulkInputTooLarge(f"Bulk input is larger than {max_bytes} bytes")
+        for row in parser.feed(chunk):
+            yield row
+    for row in parser.close():
+        yield row
+    if parser.rows == 0:
+        raise BulkInputError("No rows in bulk input")
+
+
+def archive_name(index: int, name: str, extension: str) -> str:
+    """Unique, filesystem-safe entry name for row `index`"""
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._")[:60] or "qr"
+    return f"{index + 1:05d}_{safe}.{extension}"
+
+
+class ZipStream(io.RawIOBase):
+    """Write-only sink for zipfile; drain() hands back what was written since"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def map_unordered(
+    fn: Callable[[int], Awaitable[Any]],
+    count: int,
+    concurrency: int,
+) -> AsyncIterator[Tuple[int, Any, Optional[BaseException]]]:
+    """Run fn(0..count-1) with bounded concurrency, yielding (index, result, error) as each finishes"""
+    pending = {}
+    next_index = 0
+    try:
+        while pending or next_index < count:
+            while next_index < count and len(pending) < concurrency:
+                pending[asyncio.ensure_future(fn(next_index))] = next_index
+                next_index += 1
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                error = task.exception()
+                yield index, None if error else task.result(), error
+    finally:
+        # Client went away mid-stream: stop scheduling and drop in-flight work
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,370 @@
+"""Realtime event transport between API workers.
+
+A scan handled by one worker has to reach dashboards connected to any
+worker. Events published on a bus are batched per tick: each tick the batch
+is delivered to this worker's own connections and sent to the other workers
+as one message. Received batches are delivered the same way, so every worker
+sees every event once, whichever worker published it.
+
+Backends:
+- EventBus: in-process only, for a single worker.
+- UnixSocketBus: workers on one host; each binds a datagram socket in a
+  shared directory and sends its batches to every other socket there.
+- MongoEventBus: workers on any host; batches are inserted into a capped
+  collection that every worker tails.
+
+Delivery is best effort, like the sockets it feeds: a peer that cannot keep
+up or a Mongo outage loses events (counted in stats()), never blocks the
+publisher.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from bson import Timestamp
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+# deliver(events): hand a batch to this worker's connections
+Deliver = Callable[[List[Dict[str, Any]]], None]
+
+
+class EventBus:
+    """In-process bus: batches events per tick for this worker only"""
+
+    backend = "memory"
+
+    def __init__(self, tick: float = 0.05):
+        self.tick = tick
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._deliver: Optional[Deliver] = None
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.published = 0
+        self.batches = 0
+        self.received = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._deliver is not None
+
+    async def start(self, deliver: Deliver) -> None:
+        await self._open()
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush()
+        self._deliver = None
+        await self._close()
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Queue an event for the next tick; never waits on I/O"""
+        self.published += 1
+        self._pending.append(event)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.tick, self._flush)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "published": self.published,
+            "batches": self.batches,
+            "received": self.received,
+            "dropped": self.dropped,
+        }
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch or self._deliver is None:
+            return
+        self.batches += 1
+        self._deliver(batch)
+        try:
+            self._send(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.warning(f"Realtime bus ({self.backend}) send failed: {e}")
+
+    def _receive(self, events: List[Dict[str, Any]]) -> None:
+        """A batch published by another worker"""
+        if self._deliver is None or not events:
+            return
+        self.received += len(events)
+        self._deliver(events)
+
+    # ----- transport hooks -----
+
+    async def _open(self) -> None:
+        pass
+
+    async def _close(self) -> None:
+        pass
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        pass
+
+
+class UnixSocketBus(EventBus):
+    """Workers on one host, one datagram socket each in a shared directory"""
+
+    backend = "unix"
+
+    # Well under the default socket buffers; larger batches are split
+    MAX_DATAGRAM = 64 * 1024
+    # How long the list of peer sockets is reused before rescanning the directory
+    PEER_REFRESH = 1.0
+
+    def __init__(self, directory, tick: float = 0.05, max_outbox: int = 256):
+        super().__init__(tick)
+        self.directory = Path(directory)
+        self.path = self.directory / f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock"
+        self.max_outbox = max_outbox
+        self._sock: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+        # (peer, datagram, event count) waiting for room in the send buffer
+        self._outbox: Deque[Tuple[str, bytes, int]] = deque()
+        self._waiting_writable = False
+
+    async def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(str(self.path))
+        self._sock.setblocking(False)
+        # Queued datagrams count against the sender's buffer until read;
+        # ask for room for several ticks (the kernel may cap it lower)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+        logger.info(f"Realtime bus listening on {self.path}")
+
+    async def _close(self) -> None:
+        if self._sock is None:
+            return
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self._sock.fileno())
+        if self._waiting_writable:
+            loop.remove_writer(self._sock.fileno())
+            self._waiting_writable = False
+        self.dropped += sum(count for _, _, count in self._outbox)
+        self._outbox.clear()
+        self._sock.close()
+        self._sock = None
+        self.path.unlink(missing_ok=True)
+
+    def _on_readable(self) -> None:
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(self.MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                events = json.loads(data)
+            except ValueError:
+                logger.warning("Skipping unreadable realtime bus datagram")
+                continue
+            self._receive(events)
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        peers = self._current_peers()
+        if not peers:
+            return
+        datagrams = self._encode(batch)
+        for peer in peers:
+            for datagram, count in datagrams:
+                if len(self._outbox) >= self.max_outbox:
+                    # Peers are not reading fast enough; the oldest datagram goes
+                    self.dropped += self._outbox.popleft()[2]
+                self._outbox.append((peer, datagram, count))
+        self._drain()
+
+    def _drain(self) -> None:
+        while self._outbox and self._sock is not None:
+            peer, datagram, count = self._outbox[0]
+            try:
+                self._sock.sendto(datagram, peer)
+            except BlockingIOError:
+                # Send buffer full: resume once the peers have read some
+                if not self._waiting_writable:
+                    asyncio.get_running_loop().add_writer(self._sock.fileno(), self._drain)
+                    self._waiting_writable = True
+                return
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that exited without cleaning up
+                Path(peer).unlink(missing_ok=True)
+                self._peers_at = 0.0
+                self._outbox = deque(item for item in self._outbox if item[0] != peer)
+                continue
+            except OSError as e:
+                self.dropped += count
+                logger.warning(f"Realtime bus send to {peer} failed: {e}")
+            self._outbox.popleft()
+        if self._waiting_writable and self._sock is not None:
+            asyncio.get_running_loop().remove_writer(self._sock.fileno())
+            self._waiting_writable = False
+
+    def _current_peers(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at > self.PEER_REFRESH:
+            own = str(self.path)
+            self._peers = [str(p) for p in self.directory.glob("*.sock") if str(p) != own]
+            self._peers_at = now
+        return self._peers
+
+    def _encode(self, batch: List[Dict[str, Any]]):
+        """(datagram, event count) pairs, each under MAX_DATAGRAM"""
+        datagrams = []
+        chunk: List[str] = []
+        size = 2
+        for event in batch:
+            encoded = json.dumps(event, default=str)
+            if len(encoded) + 2 > self.MAX_DATAGRAM:
+                # Peers read MAX_DATAGRAM bytes at most, so it would arrive truncated
+                self.dropped += 1
+                logger.warning(f"Realtime bus skipping a {len(encoded)}-byte event, over the datagram limit")
+                continue
+            if chunk and size + len(encoded) + 1 > self.MAX_DATAGRAM:
+                datagrams.append((f"[{','.join(chunk)}]".encode(), len(chunk)))
+                chunk, size = [], 2
+            chunk.append(encoded)
+            size += len(encoded) + 1
+        if chunk:
+            datagrams.append((f"[{','.join(chunk)}]".encode(), len(chunk)))
+        return datagrams
+
+
+class MongoEventBus(EventBus):
+    """Workers on any host, sharing a capped collection they all tail.
+
+    A capped collection keeps insertion order and supports tailable cursors
+    on a standalone server as well as a replica set (change streams need the
+    latter). Each tick inserts one document holding the batch, stamped by
+    the server with an increasing timestamp: the tail resumes after the last
+    one it saw rather than reading the collection from the start again.
+    """
+
+    backend = "mongo"
+
+    MAX_EVENTS_PER_DOCUMENT = 1000
+
+    def __init__(self, db, collection: str = "realtime_events", size: int = 16 * 1024 * 1024,
+                 tick: float = 0.05, max_outbox: int = 1000, retry_interval: float = 2.0):
+        super().__init__(tick)
+        self.db = db
+        self.collection_name = collection
+        self.size = size
+        self.max_outbox = max_outbox
+        self.retry_interval = retry_interval
+        self._outbox: Deque[Dict[str, Any]] = deque()
+        self._outbox_ready = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        # ts of the last document read; the tail starts after it
+        self._after: Optional[Timestamp] = None
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    async def _open(self) -> None:
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size)
+        except CollectionInvalid:
+            # Created by another worker
+            pass
+        self._outbox_ready = asyncio.Event()
+        self._after = None
+        self._tasks = [asyncio.create_task(self._write()), asyncio.create_task(self._tail())]
+
+    async def _close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._outbox:
+            # The last batches, so other workers' dashboards see them
+            try:
+                await asyncio.wait_for(self.collection.insert_many(list(self._outbox), ordered=True), self.retry_interval)
+            except Exception as e:
+                logger.warning(f"Realtime bus could not send its last {len(self._outbox)} batches: {e}")
+            self._outbox.clear()
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        for start in range(0, len(batch), self.MAX_EVENTS_PER_DOCUMENT):
+            if len(self._outbox) >= self.max_outbox:
+                # Mongo is not keeping up; the oldest batch is least useful
+                self.dropped += len(self._outbox.popleft()["events"])
+            self._outbox.append(self._document(batch[start:start + self.MAX_EVENTS_PER_DOCUMENT]))
+        self._outbox_ready.set()
+
+    async def _write(self) -> None:
+        while True:
+            await self._outbox_ready.wait()
+            self._outbox_ready.clear()
+            while self._outbox:
+                documents = list(self._outbox)
+                try:
+                    await self.collection.insert_many(documents, ordered=True)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Realtime bus write failed, retrying in {self.retry_interval}s: {e}")
+                    await asyncio.sleep(self.retry_interval)
+                    continue
+                for _ in documents:
+                    self._outbox.popleft()
+
+    async def _tail(self) -> None:
+        while True:
+            try:
+                await self._follow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Realtime bus cursor failed, reopening in {self.retry_interval}s: {e}")
+                await asyncio.sleep(self.retry_interval)
+
+    def _document(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # The server replaces an empty top-level Timestamp with its own clock,
+        # which (unlike _ids from different hosts) orders the inserts
+        return {"origin": self.origin, "ts": Timestamp(0, 0), "events": events}
+
+    async def _follow(self) -> None:
+        if self._after is None:
+            # Start after a marker of our own, which also makes sure the
+            # collection is not empty (a tailable cursor on one dies at once)
+            marker = (await self.collection.insert_one(self._document([]))).inserted_id
+            self._after = (await self.collection.find_one({"_id": marker}, {"ts": 1}))["ts"]
+        # A reopened cursor resumes where the last one stopped, so only events
+        # the capped collection has already dropped are lost meanwhile
+        cursor = self.collection.find({"ts": {"$gt": self._after}}, cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for document in cursor:
+                self._after = document["ts"]
+                if document.get("origin") != self.origin:
+                    self._receive(document.get("events") or [])
+            # The await timed out with nothing new; an empty round trip is cheap
+            await asyncio.sleep(0.01)
+
+
+def create_event_bus(backend: str, db=None, tick: float = 0.05, directory=None,
+                     collection: str = "realtime_events", size: int = 16 * 1024 * 1024) -> EventBus:
+    """The bus for a REALTIME_BUS setting: memory, unix or mongo"""
+    if backend == "memory":
+        return EventBus(tick)
+    if backend == "unix":
+        return UnixSocketBus(directory, tick)
+    if backend == "mongo":
+        return MongoEventBus(db, collection, size, tick)
+    raise ValueError(f"Unknown realtime bus backend: {backend}")
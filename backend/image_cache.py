@@ -0,0 +1,109 @@
+"""In-process cache for rendered QR images.
+
+Entries are content-addressed: the key is a hash of everything that affects
+the rendered bytes, so a changed design or payload naturally misses. Entries
+are also tagged (qr_id, user_id) so write paths can drop stale renders
+explicitly and release their memory early.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def make_cache_key(payload: str, design: Optional[Dict[str, Any]], watermark: bool, **extra: Any) -> str:
+    """Canonical SHA-256 key for a rendered image"""
+    canonical = json.dumps(
+        {"payload": payload, "design": design or {}, "watermark": bool(watermark), **extra},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """LRU cache of rendered image bytes bounded by a total byte budget"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._entry_tags: Dict[str, tuple] = {}
+        self._tags: Dict[str, set] = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes, tags: Iterable[str] = ()) -> None:
+        size = len(data)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = data
+        self.current_bytes += size
+        entry_tags = tuple(tag for tag in tags if tag)
+        self._entry_tags[key] = entry_tags
+        for tag in entry_tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, tag: str) -> int:
+        """Drop every entry carrying the given tag (qr_id or user_id)"""
+        keys = self._tags.get(tag)
+        if not keys:
+            return 0
+        removed = 0
+        for key in list(keys):
+            if key in self._entries:
+                self._remove(key)
+                removed += 1
+        self.invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._entry_tags.clear()
+        self._tags.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: str) -> None:
+        data = self._entries.pop(key)
+        self.current_bytes -= len(data)
+        for tag in self._entry_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
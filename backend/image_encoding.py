@@ -0,0 +1,112 @@
+"""Compact encoding of rendered QR images.
+
+Most renders are flat: two colours, or a handful of antialiasing shades
+between them. Those are written as 1-bit or palette PNGs, which are several
+times smaller than 24-bit RGB; only images with more than 256 colours
+(gradients, photo logos) stay RGB. WebP and AVIF are available where the
+installed Pillow supports them.
+"""
+import io
+import os
+from typing import Optional
+
+import numpy as np
+from PIL import Image, features
+
+PNG_COMPRESS_LEVEL = int(os.environ.get("QR_PNG_COMPRESS_LEVEL", 6))
+PNG_OPTIMIZE = os.environ.get("QR_PNG_OPTIMIZE", "false").lower() in ("1", "true", "yes")
+
+# AVIF is lossy and slow at its default speed (6): hundreds of ms per QR.
+# Lossless WebP is usually smaller for flat QR images anyway.
+AVIF_QUALITY = int(os.environ.get("QR_AVIF_QUALITY", 90))
+AVIF_SPEED = int(os.environ.get("QR_AVIF_SPEED", 8))
+
+IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+MAX_PALETTE_COLORS = 256
+
+# Above this many pixels, mapping a multi-colour image onto its palette costs
+# more time than the smaller file is worth; two-colour images are always mapped
+MAX_PALETTE_MAP_PIXELS = 1024 * 1024
+
+
+def image_format_supported(image_format: str) -> bool:
+    if image_format == "png":
+        return True
+    return image_format in IMAGE_MEDIA_TYPES and bool(features.check(image_format))
+
+
+def _rgb_keys(img: Image.Image) -> np.ndarray:
+    """One uint32 per pixel identifying its RGB colour (R | G << 8 | B << 16 | 0xFF << 24)"""
+    return np.asarray(img.convert("RGBX")).view("<u4")[..., 0]
+
+
+def compact_image(img: Image.Image) -> Image.Image:
+    """Losslessly convert a flat RGB image to mode '1' or 'P'; others are returned as-is"""
+    if img.mode != "RGB":
+        return img
+    colors = img.getcolors(MAX_PALETTE_COLORS)
+    if colors is None:
+        return img
+    palette = [color for _, color in colors]
+
+    if set(palette) <= {(0, 0, 0), (255, 255, 255)}:
+        # Pure black and white: 1-bit greyscale, no palette chunk
+        return Image.fromarray(np.asarray(img.getchannel("R")) >= 128)
+
+    if len(palette) > 2 and img.size[0] * img.size[1] > MAX_PALETTE_MAP_PIXELS:
+        return img
+
+    if len(palette) == 2:
+        # Two colours differ in at least one channel, which is enough to tell them apart
+        channel = next(i for i in range(3) if palette[0][i] != palette[1][i])
+        indices = (np.asarray(img.getchannel(channel)) == palette[1][channel]).view(np.uint8)
+    else:
+        keys = np.array([r | g << 8 | b << 16 | 0xFF << 24 for r, g, b in palette], dtype=np.uint32)
+        order = np.argsort(keys)
+        indices = order[np.searchsorted(keys[order], _rgb_keys(img))].astype(np.uint8)
+
+    # Pillow picks the bit depth (1/2/4/8) from the palette length
+    paletted = Image.fromarray(indices, "P")
+    paletted.putpalette(bytes(v for color in palette for v in color))
+    return paletted
+
+
+def _save_png(img: Image.Image, compress_level: int, optimize: bool) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=compress_level, optimize=optimize)
+    return buf.getvalue()
+
+
+def encode_image(
+    img: Image.Image,
+    image_format: str = "png",
+    compress_level: Optional[int] = None,
+    optimize: Optional[bool] = None,
+) -> bytes:
+    """Encode a rendered image as PNG (compacted), lossless WebP or AVIF"""
+    if image_format == "png":
+        compress_level = PNG_COMPRESS_LEVEL if compress_level is None else compress_level
+        optimize = PNG_OPTIMIZE if optimize is None else optimize
+        compact = compact_image(img)
+        data = _save_png(compact, compress_level, optimize)
+        if compact.mode == "P" and len(compact.getpalette()) > 16 * 3:
+            # 8-bit palette rows are stored unfiltered, so framed or text-heavy
+            # images can compress worse than filtered RGB; keep the smaller
+            rgb_data = _save_png(img, compress_level, optimize)
+            if len(rgb_data) < len(data):
+                data = rgb_data
+        return data
+
+    buf = io.BytesIO()
+    if image_format == "webp":
+        img.save(buf, format="WEBP", lossless=True)
+    elif image_format == "avif":
+        img.save(buf, format="AVIF", quality=AVIF_QUALITY, speed=AVIF_SPEED, subsampling="4:4:4")
+    else:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    return buf.getvalue()
@@ -0,0 +1,173 @@
+"""Content-addressed blob store for uploaded logos.
+
+Logo bytes are stored once under their SHA-256 (the logo_id) and designs
+reference them by logo_id instead of carrying base64 data URLs, which kept
+every qr_codes read and image URL hundreds of KB heavy. Two backends:
+
+    LOGO_STORE=disk    files under LOGO_STORE_DIR (default backend/data/logos)
+    LOGO_STORE=gridfs  a GridFS bucket named "logos" in the app database
+"""
+import asyncio
+import base64
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from logos import InvalidLogo, logo_key, register_logo
+from qr_render import PRELOADED_LOGO_NAMES, get_preloaded_logo_ref
+
+LOGO_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_logo_id(value: Any) -> bool:
+    return isinstance(value, str) and bool(LOGO_ID_PATTERN.match(value))
+
+
+class LogoStore(ABC):
+    """Backend interface: blobs are immutable and keyed by their SHA-256"""
+
+    @abstractmethod
+    async def put(self, data: bytes) -> str:
+        """Store a blob (a no-op if it exists) and return its logo_id"""
+
+    @abstractmethod
+    async def get(self, logo_id: str) -> Optional[bytes]:
+        """Blob bytes, or None for an unknown or malformed logo_id"""
+
+
+class DiskLogoStore(LogoStore):
+    """Blobs as files, fanned out by the first two hex digits of the hash"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _path(self, logo_id: str) -> Path:
+        return self.root / logo_id[:2] / logo_id
+
+    def _write(self, logo_id: str, data: bytes) -> None:
+        path = self._path(logo_id)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _read(self, logo_id: str) -> Optional[bytes]:
+        try:
+            return self._path(logo_id).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    async def put(self, data: bytes) -> str:
+        logo_id = logo_key(data)
+        await asyncio.to_thread(self._write, logo_id, data)
+        return logo_id
+
+    async def get(self, logo_id: str) -> Optional[bytes]:
+        if not is_logo_id(logo_id):
+            return None
+        return await asyncio.to_thread(self._read, logo_id)
+
+
+class GridFSLogoStore(LogoStore):
+    """Blobs in a GridFS bucket, with the logo_id as the file name"""
+
+    def __init__(self, db, bucket_name: str = "logos"):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+
+    async def put(self, data: bytes) -> str:
+        logo_id = logo_key(data)
+        existing = await self.bucket.find({"filename": logo_id}).to_list(length=1)
+        if not existing:
+            await self.bucket.upload_from_stream(logo_id, data)
+        return logo_id
+
+    async def get(self, logo_id: str) -> Optional[bytes]:
+        from gridfs.errors import NoFile
+        if not is_logo_id(logo_id):
+            return None
+        try:
+            stream = await self.bucket.open_download_stream_by_name(logo_id)
+        except NoFile:
+            return None
+        return await stream.read()
+
+
+def create_logo_store(db) -> LogoStore:
+    backend = os.environ.get("LOGO_STORE", "disk")
+    if backend == "gridfs":
+        return GridFSLogoStore(db)
+    if backend == "disk":
+        root = os.environ.get("LOGO_STORE_DIR") or Path(__file__).parent / "data" / "logos"
+        return DiskLogoStore(root)
+    raise ValueError(f"Unknown LOGO_STORE backend: {backend}")
+
+
+# ========== DESIGN HELPERS ==========
+
+async def store_design_logo(design: Optional[Dict[str, Any]], store: LogoStore) -> Optional[Dict[str, Any]]:
+    """Copy of a design with its logo moved out to the store.
+
+    Inline custom logos (data URLs) become a logo_id; preloaded logos are
+    referenced by name only; designs without a logo lose stale logo fields.
+    Raises logos.InvalidLogo for undecodable logo data.
+    """
+    if not design:
+        return design
+    design = dict(design)
+    logo_data = design.pop("logo_data", None)
+    # Render-time only, see resolve_design_logo
+    design.pop("logo_key", None)
+    logo_type = design.get("logo_type")
+
+    if logo_type == "none":
+        design.pop("logo_id", None)
+    elif logo_type == "preloaded" and design.get("template_logo") in PRELOADED_LOGO_NAMES:
+        # Rendered from the bundled set, nothing to store
+        design.pop("logo_id", None)
+    elif isinstance(logo_data, str) and logo_data:
+        try:
+            # Data URL, or bare base64 as some clients send it
+            logo_bytes = base64.b64decode(logo_data.split(",", 1)[-1])
+        except ValueError as e:
+            raise InvalidLogo(f"Invalid logo data: {e}") from e
+        register_logo(logo_bytes)
+        design["logo_id"] = await store.put(logo_bytes)
+    return design
+
+
+async def resolve_design_logo(design: Optional[Dict[str, Any]], store: LogoStore) -> Optional[Dict[str, Any]]:
+    """Copy of a design with logo_data (and logo_key, its content hash, which
+    render workers cache it by) filled in for the renderer"""
+    if not design:
+        return design
+    if "logo_key" in design:
+        # Only ever set here: a client-supplied key could alias another logo's cache entries
+        design = {key: value for key, value in design.items() if key != "logo_key"}
+    if design.get("logo_data") or design.get("logo_type") == "none":
+        return design
+
+    if design.get("logo_type") == "preloaded" and design.get("template_logo") in PRELOADED_LOGO_NAMES:
+        logo_ref = get_preloaded_logo_ref(design["template_logo"])
+        if logo_ref is not None:
+            key, logo_bytes = logo_ref
+            return {**design, "logo_data": logo_bytes, "logo_key": key}
+        return design
+
+    if design.get("logo_id"):
+        logo_bytes = await store.get(design["logo_id"])
+        if logo_bytes is not None:
+            # Blobs are stored under the SHA-256 of their bytes
+            return {**design, "logo_data": logo_bytes, "logo_key": design["logo_id"]}
+    return design
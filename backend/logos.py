@@ -0,0 +1,172 @@
+"""Logo preprocessing: decode once, keep pre-scaled logo plates.
+
+Logos are identified by the SHA-256 of their encoded bytes; callers that
+already know it (a stored logo's logo_id) pass it as the key, so renders
+skip hashing. Each process decodes and normalizes a logo to RGBA once, and
+for every logo size the renderer asks for, composites the LANCZOS thumbnail
+onto its white backing plate once. Renders then only paste a ready plate.
+Decoded logos and plates share one LRU bounded by their pixel memory.
+"""
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Union
+
+from PIL import Image
+
+LOGO_CACHE_BYTES = int(os.environ.get("LOGO_CACHE_BYTES", 48 * 1024 * 1024))
+
+# Largest logo edge kept after decoding; renders never need more (a 20%
+# logo on the largest canvas) and it bounds the cost of huge uploads
+MAX_LOGO_SOURCE_SIZE = 1024
+
+# White plate behind the logo, relative to the logo size
+LOGO_PLATE_SCALE = 1.2
+
+
+class InvalidLogo(ValueError):
+    """Raised when logo bytes cannot be decoded as an image"""
+
+
+def logo_key(data: bytes) -> str:
+    """Content hash identifying a logo"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_logo(data: bytes) -> Image.Image:
+    """Decode logo bytes into an RGBA image no larger than MAX_LOGO_SOURCE_SIZE"""
+    try:
+        logo = Image.open(io.BytesIO(data))
+        logo.load()
+    except Exception as e:
+        raise InvalidLogo(f"Invalid logo image: {e}") from e
+
+    if logo.mode != "RGBA":
+        # Palette/LA/RGB logos get real alpha and smooth scaling like RGBA ones
+        logo = logo.convert("RGBA")
+    if max(logo.size) > MAX_LOGO_SOURCE_SIZE:
+        logo.thumbnail((MAX_LOGO_SOURCE_SIZE, MAX_LOGO_SOURCE_SIZE), Image.Resampling.LANCZOS)
+    return logo
+
+
+def logo_media_type(data: bytes) -> str:
+    """MIME type of encoded logo bytes, sniffed from the image header"""
+    try:
+        return Image.MIME.get(Image.open(io.BytesIO(data)).format, "application/octet-stream")
+    except Exception:
+        return "application/octet-stream"
+
+
+def build_logo_plate(logo: Image.Image, max_size: int) -> Image.Image:
+    """Logo scaled to fit max_size, centred on a white plate 1.2x its size"""
+    logo = logo.copy()
+    logo.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+    plate_size = int(logo.size[0] * LOGO_PLATE_SCALE), int(logo.size[1] * LOGO_PLATE_SCALE)
+    plate = Image.new("RGB", plate_size, "white")
+    position = ((plate_size[0] - logo.size[0]) // 2, (plate_size[1] - logo.size[1]) // 2)
+    plate.paste(logo, position, logo)
+    return plate
+
+
+def _image_bytes(image: Image.Image) -> int:
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+class LogoCache:
+    """LRU of decoded logos and pre-scaled plates bounded by pixel memory.
+
+    Entries are keyed (content hash, plate size); the decoded source uses a
+    plate size of None. Returned images are shared: never draw on them.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, Optional[int]], Image.Image]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def source(self, data: bytes, key: Optional[str] = None) -> Image.Image:
+        """Decoded, normalized logo"""
+        key = key or logo_key(data)
+        logo = self._get((key, None))
+        if logo is None:
+            logo = normalize_logo(data)
+            self._put((key, None), logo)
+        return logo
+
+    def plate(self, data: bytes, max_size: int, key: Optional[str] = None) -> Image.Image:
+        """White-backed logo plate for a logo fitting in max_size x max_size"""
+        key = key or logo_key(data)
+        plate = self._get((key, max_size))
+        if plate is None:
+            plate = build_logo_plate(self.source(data, key), max_size)
+            self._put((key, max_size), plate)
+        return plate
+
+    def discard(self, data: Union[bytes, str]) -> int:
+        """Drop a logo's source and plates, by bytes or content hash"""
+        key = data if isinstance(data, str) else logo_key(data)
+        removed = [entry for entry in self._entries if entry[0] == key]
+        for entry in removed:
+            self._remove(entry)
+        return len(removed)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _get(self, entry: Tuple[str, Optional[int]]) -> Optional[Image.Image]:
+        image = self._entries.get(entry)
+        if image is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(entry)
+        self.hits += 1
+        return image
+
+    def _put(self, entry: Tuple[str, Optional[int]], image: Image.Image) -> None:
+        size = _image_bytes(image)
+        if size > self.max_bytes:
+            return
+        if entry in self._entries:
+            self._remove(entry)
+        self._entries[entry] = image
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, entry: Tuple[str, Optional[int]]) -> None:
+        self.current_bytes -= _image_bytes(self._entries.pop(entry))
+
+
+logo_cache = LogoCache(LOGO_CACHE_BYTES)
+
+
+def get_logo_plate(data: bytes, max_size: int, key: Optional[str] = None) -> Image.Image:
+    """Pre-scaled logo plate from the process-wide logo cache"""
+    return logo_cache.plate(data, max_size, key)
+
+
+def register_logo(data: bytes, key: Optional[str] = None) -> str:
+    """Validate and preprocess a logo in this process, returning its content hash"""
+    key = key or logo_key(data)
+    logo_cache.source(data, key)
+    return key
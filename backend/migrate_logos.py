@@ -0,0 +1,71 @@
+"""One-off migration: move inline logos out of qr_codes documents.
+
+Every design still carrying a base64 `logo_data` is rewritten the same way
+new saves are (see logo_store.store_design_logo): custom logos go to the
+logo store and are referenced by `logo_id`, preloaded ones by name only.
+
+Usage (from backend/, same env as the server):
+    python migrate_logos.py [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from logo_store import create_logo_store, store_design_logo
+from logos import InvalidLogo
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("migrate_logos")
+
+
+async def migrate(db, dry_run: bool = False) -> dict:
+    store = create_logo_store(db)
+    counts = {"scanned": 0, "migrated": 0, "invalid": 0}
+
+    cursor = db.qr_codes.find(
+        {"design.logo_data": {"$exists": True}},
+        {"_id": 0, "qr_id": 1, "design": 1}
+    )
+    async for qr in cursor:
+        counts["scanned"] += 1
+        if dry_run:
+            continue
+        try:
+            design = await store_design_logo(qr["design"], store)
+        except InvalidLogo as e:
+            # Undecodable data never rendered anyway; leave the document for a look
+            counts["invalid"] += 1
+            logger.warning(f"{qr['qr_id']}: {e}")
+            continue
+
+        # Only touch documents whose design is unchanged since we read it
+        await db.qr_codes.update_one(
+            {"qr_id": qr["qr_id"], "design": qr["design"]},
+            {"$set": {"design": design}}
+        )
+        counts["migrated"] += 1
+
+    return counts
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only count documents with inline logos")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        counts = await migrate(client[os.environ['DB_NAME']], dry_run=args.dry_run)
+    finally:
+        client.close()
+    logger.info(f"{'Dry run: ' if args.dry_run else ''}{counts}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
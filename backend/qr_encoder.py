@@ -0,0 +1,475 @@
+"""NumPy QR encoder, bit-identical to qrcode's make(fit=True).
+
+qrcode grows the version by trial, builds the matrix in nested lists and
+scores the eight masks with pure-Python penalty loops, which costs
+milliseconds per symbol for large payloads. This encoder picks the version
+from a capacity table, runs Reed-Solomon for all blocks at once on
+log/antilog tables and scores the eight masked candidates as one stacked
+array. Segmentation, padding, module placement and the penalty rules follow
+qrcode exactly (including scoring masks with blank format areas), so the
+version, mask and modules always match it; tests/test_qr_encoder.py checks
+that across versions, EC levels and modes, and bench_qr_encoder.py over a
+large random corpus.
+"""
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+
+# Error correction codewords per block and number of blocks, versions 1-40
+# (ISO/IEC 18004 table 9)
+ECC_CODEWORDS_PER_BLOCK = {
+    "L": (7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28,
+          28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    "M": (10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+          26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    "Q": (13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30,
+          28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    "H": (17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28,
+          30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+}
+NUM_EC_BLOCKS = {
+    "L": (1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8,
+          8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    "M": (1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+          17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    "Q": (1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20,
+          23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    "H": (1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25,
+          25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+}
+
+# EC level indicator in the format information
+EC_FORMAT_BITS = {"L": 1, "M": 0, "Q": 3, "H": 2}
+
+MODE_NUMBER = 1
+MODE_ALPHA_NUM = 2
+MODE_BYTE = 4
+
+# Character count field widths for versions 1-9, 10-26 and 27-40
+LENGTH_BITS = (
+    {MODE_NUMBER: 10, MODE_ALPHA_NUM: 9, MODE_BYTE: 8},
+    {MODE_NUMBER: 12, MODE_ALPHA_NUM: 11, MODE_BYTE: 16},
+    {MODE_NUMBER: 14, MODE_ALPHA_NUM: 13, MODE_BYTE: 16},
+)
+
+ALPHA_NUM = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+ALPHA_NUM_VALUES = {c: i for i, c in enumerate(ALPHA_NUM)}
+
+# Same segmentation as qrcode.util.optimal_data_chunks(data, minimum=20),
+# which is what QRCode.add_data() uses by default
+SEGMENT_MINIMUM = 20
+_NUM = rb"\d"
+_ALPHA = b"[" + re.escape(ALPHA_NUM) + b"]"
+_NUM_WHOLE = re.compile(b"^" + _NUM + b"+$")
+_ALPHA_WHOLE = re.compile(b"^" + _ALPHA + b"+$")
+_NUM_RUN = re.compile(_NUM + b"{%d,}" % SEGMENT_MINIMUM)
+_ALPHA_RUN = re.compile(_ALPHA + b"{%d,}" % SEGMENT_MINIMUM)
+
+PAD_BYTES = (0xEC, 0x11)
+
+G15 = 0b10100110111
+G18 = 0b1111100100101
+G15_MASK = 0b101010000010010
+
+# Finder-like 1:1:3:1:1 patterns with four light modules on one side
+FINDER_PATTERNS = np.array([
+    [1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0],
+    [0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1],
+], dtype=bool)
+
+
+def _size_class(version: int) -> int:
+    return 0 if version < 10 else 1 if version < 27 else 2
+
+
+def _total_codewords(version: int) -> int:
+    modules = (16 * version + 128) * version + 64
+    if version >= 2:
+        aligns = version // 7 + 2
+        modules -= (25 * aligns - 10) * aligns - 55
+        if version >= 7:
+            modules -= 36
+    return modules // 8
+
+
+# Data capacity in bits per EC level, indexed by version (index 0 unused)
+BIT_LIMITS = {
+    level: [0] + [
+        8 * (_total_codewords(v) - ECC_CODEWORDS_PER_BLOCK[level][v - 1] * NUM_EC_BLOCKS[level][v - 1])
+        for v in range(1, 41)
+    ]
+    for level in ECC_CODEWORDS_PER_BLOCK
+}
+
+# ----- GF(256) -----
+
+_EXP = [0] * 256
+for _i in range(8):
+    _EXP[_i] = 1 << _i
+for _i in range(8, 256):
+    _EXP[_i] = _EXP[_i - 4] ^ _EXP[_i - 5] ^ _EXP[_i - 6] ^ _EXP[_i - 8]
+_LOG = [0] * 256
+for _i in range(255):
+    _LOG[_EXP[_i]] = _i
+GF_EXP = np.array(_EXP[:255] * 2, dtype=np.uint8)
+GF_LOG = np.array(_LOG, dtype=np.int32)
+
+
+@lru_cache(maxsize=None)
+def _generator_table(ecc: int) -> np.ndarray:
+    """(256, ecc) table; row f holds f times the generator polynomial's
+    coefficients after its leading 1"""
+    gen = [1]
+    for i in range(ecc):
+        # gen * (x - a^i)
+        shifted = gen + [0]
+        for j, coef in enumerate(gen):
+            if coef:
+                shifted[j + 1] ^= _EXP[(_LOG[coef] + i) % 255]
+        gen = shifted
+    logs = GF_LOG[np.array(gen[1:])]
+    table = np.zeros((256, ecc), dtype=np.uint8)
+    table[1:] = GF_EXP[GF_LOG[1:, None] + logs[None, :]]
+    return table
+
+
+def _ec_codewords(blocks: np.ndarray, ecc: int) -> np.ndarray:
+    """Remainders of every row of `blocks` (left-padded with zeros) divided
+    by the generator polynomial"""
+    table = _generator_table(ecc)
+    remainder = np.zeros((blocks.shape[0], ecc), dtype=np.uint8)
+    for column in blocks.T:
+        factor = column ^ remainder[:, 0]
+        remainder[:, :-1] = remainder[:, 1:]
+        remainder[:, -1] = 0
+        remainder ^= table[factor]
+    return remainder
+
+
+# ----- data encoding -----
+
+def _split(data: bytes, pattern):
+    # qrcode.util._optimal_split
+    while data:
+        match = pattern.search(data)
+        if not match:
+            break
+        start, end = match.start(), match.end()
+        if start:
+            yield False, data[:start]
+        yield True, data[start:end]
+        data = data[end:]
+    if data:
+        yield False, data
+
+
+def segment(data: bytes) -> List[Tuple[int, bytes]]:
+    """(mode, chunk) segments, split exactly like qrcode does"""
+    if len(data) <= SEGMENT_MINIMUM:
+        num, alpha = _NUM_WHOLE, _ALPHA_WHOLE
+    else:
+        num, alpha = _NUM_RUN, _ALPHA_RUN
+    segments = []
+    for is_num, chunk in _split(data, num):
+        if is_num:
+            segments.append((MODE_NUMBER, chunk))
+            continue
+        for is_alpha, sub_chunk in _split(chunk, alpha):
+            segments.append((MODE_ALPHA_NUM if is_alpha else MODE_BYTE, sub_chunk))
+    return segments
+
+
+def _payload_bits(mode: int, length: int) -> int:
+    if mode == MODE_NUMBER:
+        return 10 * (length // 3) + (0, 4, 7)[length % 3]
+    if mode == MODE_ALPHA_NUM:
+        return 11 * (length // 2) + 6 * (length % 2)
+    return 8 * length
+
+
+def choose_version(segments: List[Tuple[int, bytes]], error_correction: str) -> int:
+    """Smallest version that fits, searched the way QRCode.best_fit() does"""
+    limits = BIT_LIMITS[error_correction]
+    start = 1
+    while True:
+        size_class = _size_class(start)
+        needed = sum(
+            4 + LENGTH_BITS[size_class][mode] + _payload_bits(mode, len(chunk)) for mode, chunk in segments
+        )
+        version = bisect_left(limits, needed, start)
+        if version == 41:
+            # qrcode fails here with a ValueError too (from its version setter),
+            # which the image endpoints turn into a 400
+            raise ValueError(f"Data too long for a QR code ({needed} bits, at most {limits[40]})")
+        if _size_class(version) == size_class:
+            return version
+        start = version
+
+
+def _data_codewords(segments: List[Tuple[int, bytes]], version: int, error_correction: str) -> bytes:
+    value = 0
+    length = 0
+
+    def put(num: int, bits: int):
+        nonlocal value, length
+        value = (value << bits) | (num & ((1 << bits) - 1))
+        length += bits
+
+    size_class = _size_class(version)
+    for mode, chunk in segments:
+        put(mode, 4)
+        put(len(chunk), LENGTH_BITS[size_class][mode])
+        if mode == MODE_NUMBER:
+            for i in range(0, len(chunk), 3):
+                digits = chunk[i:i + 3]
+                put(int(digits), (0, 4, 7, 10)[len(digits)])
+        elif mode == MODE_ALPHA_NUM:
+            for i in range(0, len(chunk) - 1, 2):
+                put(ALPHA_NUM_VALUES[chunk[i]] * 45 + ALPHA_NUM_VALUES[chunk[i + 1]], 11)
+            if len(chunk) % 2:
+                put(ALPHA_NUM_VALUES[chunk[-1]], 6)
+        else:
+            put(int.from_bytes(chunk, "big"), 8 * len(chunk))
+
+    limit = BIT_LIMITS[error_correction][version]
+    if length > limit:
+        raise ValueError(f"Code length overflow. Data size ({length}) > size available ({limit})")
+    # Terminator, then zero bits up to a byte boundary
+    put(0, min(limit - length, 4))
+    if length % 8:
+        put(0, 8 - length % 8)
+    data = value.to_bytes(length // 8, "big") if length else b""
+    fill = (limit - length) // 8
+    return data + bytes(PAD_BYTES * (fill // 2 + 1))[:fill]
+
+
+def _codewords(data: bytes, version: int, error_correction: str) -> np.ndarray:
+    """Data and EC codewords split into blocks and interleaved"""
+    ecc = ECC_CODEWORDS_PER_BLOCK[error_correction][version - 1]
+    num_blocks = NUM_EC_BLOCKS[error_correction][version - 1]
+    total = _total_codewords(version)
+    short_blocks = num_blocks - total % num_blocks
+    short_data = total // num_blocks - ecc
+
+    # Short blocks come first; long ones carry one more data codeword
+    lengths = np.full(num_blocks, short_data)
+    lengths[short_blocks:] += 1
+    max_data = short_data + (short_blocks < num_blocks)
+    valid = np.arange(max_data)[None, :] < lengths[:, None]
+
+    codewords = np.frombuffer(data, dtype=np.uint8)
+    blocks = np.zeros((num_blocks, max_data), dtype=np.uint8)
+    blocks[valid] = codewords
+
+    # Leading zeros do not change the remainder, so divide right-aligned blocks
+    aligned = np.zeros_like(blocks)
+    aligned[:short_blocks, max_data - short_data:] = blocks[:short_blocks, :short_data]
+    aligned[short_blocks:] = blocks[short_blocks:]
+    ec = _ec_codewords(aligned, ecc)
+
+    return np.concatenate([blocks.T[valid.T], ec.T.ravel()])
+
+
+# ----- module placement -----
+
+def alignment_positions(version: int) -> List[int]:
+    if version == 1:
+        return []
+    count = version // 7 + 2
+    size = version * 4 + 17
+    step = 26 if version == 32 else -(-(version * 4 + 4) // (count * 2 - 2)) * 2
+    positions = [6]
+    for n in range(count - 1):
+        positions.insert(1, size - 7 - n * step)
+    return positions
+
+
+def _bch_type_info(data: int) -> int:
+    d = data << 10
+    while d.bit_length() >= G15.bit_length():
+        d ^= G15 << (d.bit_length() - G15.bit_length())
+    return ((data << 10) | d) ^ G15_MASK
+
+
+def _bch_type_number(data: int) -> int:
+    d = data << 12
+    while d.bit_length() >= G18.bit_length():
+        d ^= G18 << (d.bit_length() - G18.bit_length())
+    return (data << 12) | d
+
+
+def _format_cells(size: int):
+    """Coordinates of format bits 0-14 in the vertical and horizontal copies"""
+    vertical = [(i, 8) if i < 6 else (i + 1, 8) if i < 8 else (size - 15 + i, 8) for i in range(15)]
+    horizontal = [(8, size - i - 1) if i < 8 else (8, 7) if i == 8 else (8, 15 - i - 1) for i in range(15)]
+    return vertical, horizontal
+
+
+def _version_cells(size: int):
+    """Coordinates of version bits 0-17 in both copies"""
+    first = [(i // 3, i % 3 + size - 11) for i in range(18)]
+    return first, [(c, r) for r, c in first]
+
+
+@lru_cache(maxsize=None)
+def _layout(version: int):
+    """Function patterns with blank format/version areas (the test-mode
+    matrix qrcode scores), plus the data cells in placement order and the
+    eight mask values at those cells"""
+    size = version * 4 + 17
+    grid = np.full((size, size), -1, dtype=np.int8)
+
+    for row, col in ((0, 0), (size - 7, 0), (0, size - 7)):
+        for r in range(-1, 8):
+            if not 0 <= row + r < size:
+                continue
+            for c in range(-1, 8):
+                if not 0 <= col + c < size:
+                    continue
+                dark = (0 <= r <= 6 and c in (0, 6)) or (0 <= c <= 6 and r in (0, 6)) or (2 <= r <= 4 and 2 <= c <= 4)
+                grid[row + r, col + c] = dark
+
+    positions = alignment_positions(version)
+    for row in positions:
+        for col in positions:
+            if grid[row, col] != -1:
+                continue
+            for r in range(-2, 3):
+                for c in range(-2, 3):
+                    grid[row + r, col + c] = r in (-2, 2) or c in (-2, 2) or (r == 0 and c == 0)
+
+    for i in range(8, size - 8):
+        if grid[i, 6] == -1:
+            grid[i, 6] = i % 2 == 0
+        if grid[6, i] == -1:
+            grid[6, i] = i % 2 == 0
+
+    vertical, horizontal = _format_cells(size)
+    for r, c in vertical + horizontal + [(size - 8, 8)]:
+        grid[r, c] = 0
+    if version >= 7:
+        first, second = _version_cells(size)
+        for r, c in first + second:
+            grid[r, c] = 0
+
+    # Zigzag through the remaining cells in two-column strips, as qrcode's map_data
+    free = grid == -1
+    rows, cols = [], []
+    inc = -1
+    row = size - 1
+    for col in range(size - 1, 0, -2):
+        if col <= 6:
+            col -= 1
+        while True:
+            for c in (col, col - 1):
+                if free[row, c]:
+                    rows.append(row)
+                    cols.append(c)
+            row += inc
+            if row < 0 or row >= size:
+                row -= inc
+                inc = -inc
+                break
+    rows = np.array(rows)
+    cols = np.array(cols)
+
+    i, j = rows, cols
+    masks = np.stack([
+        (i + j) % 2 == 0,
+        i % 2 == 0,
+        j % 3 == 0,
+        (i + j) % 3 == 0,
+        (i // 2 + j // 3) % 2 == 0,
+        (i * j) % 2 + (i * j) % 3 == 0,
+        ((i * j) % 2 + (i * j) % 3) % 2 == 0,
+        ((i * j) % 3 + (i + j) % 2) % 2 == 0,
+    ])
+
+    base = np.where(free, 0, grid).astype(bool)
+    for array in (base, rows, cols, masks):
+        array.flags.writeable = False
+    return base, rows, cols, masks
+
+
+# ----- mask scoring -----
+
+def _penalties(stack: np.ndarray) -> np.ndarray:
+    """qrcode's lost_point() for each of the stacked (k, n, n) matrices"""
+    k, n, _ = stack.shape
+    # Rows and columns of every candidate as one (2k, n, n) array of lines
+    lines = np.concatenate([stack, stack.transpose(0, 2, 1)])
+
+    # Level 1: runs of five or more same-coloured modules score length - 2
+    flat = lines.reshape(-1, n)
+    edges = np.ones((flat.shape[0], n + 1), dtype=bool)
+    edges[:, 1:n] = flat[:, 1:] != flat[:, :-1]
+    starts = np.flatnonzero(edges)
+    run_lengths = np.diff(starts)
+    starts = starts[:-1]
+    # Drop the step from one line's end marker to the next line's start
+    keep = (starts % (n + 1) != n) & (run_lengths >= 5)
+    candidate = (starts[keep] // (n + 1) // n) % k
+    level1 = np.bincount(candidate, weights=run_lengths[keep] - 2, minlength=k)
+
+    # Level 2: 3 per 2x2 block of one colour
+    top_left = stack[:, :-1, :-1]
+    uniform = (top_left == stack[:, 1:, :-1]) & (top_left == stack[:, :-1, 1:]) & (top_left == stack[:, 1:, 1:])
+    level2 = 3 * uniform.sum(axis=(1, 2))
+
+    # Level 3: 40 per finder-like pattern in any row or column
+    windows = n - 10
+    matches = 0
+    for pattern in FINDER_PATTERNS:
+        found = np.ones((2 * k, n, windows), dtype=bool)
+        for offset, dark in enumerate(pattern):
+            cells = lines[:, :, offset:offset + windows]
+            found &= cells if dark else ~cells
+        matches = matches + found.sum(axis=(1, 2))
+    level3 = 40 * (matches[:k] + matches[k:])
+
+    # Level 4: 10 per 5% of dark-module imbalance
+    dark = stack.sum(axis=(1, 2))
+    level4 = [int(abs(float(count) / (n ** 2) * 100 - 50) / 5) * 10 for count in dark]
+
+    return level1.astype(np.int64) + level2 + level3 + np.array(level4)
+
+
+# ----- entry point -----
+
+def encode(payload, error_correction: str = "H") -> Tuple[int, int, np.ndarray]:
+    """(version, mask pattern, (n, n) bool modules) for a payload, matching
+    qrcode.QRCode(error_correction=...).add_data(payload); make(fit=True)"""
+    data = payload if isinstance(payload, bytes) else str(payload).encode("utf-8")
+    segments = segment(data)
+    version = choose_version(segments, error_correction)
+    codewords = _codewords(_data_codewords(segments, version, error_correction), version, error_correction)
+
+    base, rows, cols, masks = _layout(version)
+    bits = np.zeros(len(rows), dtype=bool)
+    stream = np.unpackbits(codewords).astype(bool)
+    bits[:len(stream)] = stream
+
+    stack = np.repeat(base[None], 8, axis=0)
+    stack[:, rows, cols] = bits[None, :] ^ masks
+    mask_pattern = int(np.argmin(_penalties(stack)))
+
+    modules = stack[mask_pattern].copy()
+    size = modules.shape[0]
+    info = _bch_type_info((EC_FORMAT_BITS[error_correction] << 3) | mask_pattern)
+    vertical, horizontal = _format_cells(size)
+    for i in range(15):
+        dark = (info >> i) & 1 == 1
+        modules[vertical[i]] = dark
+        modules[horizontal[i]] = dark
+    modules[size - 8, 8] = True
+    if version >= 7:
+        number = _bch_type_number(version)
+        first, second = _version_cells(size)
+        for i in range(18):
+            dark = (number >> i) & 1 == 1
+            modules[first[i]] = dark
+            modules[second[i]] = dark
+    return version, mask_pattern, modules
@@ -0,0 +1,102 @@
+"""Cached QR module matrices.
+
+Encoding (version search, Reed-Solomon, scoring all eight masks) only
+depends on the payload and the error correction level, while editors mostly
+change colours, patterns and frames. Matrices are therefore cached on their
+own so design-only changes skip encoding entirely. Any renderer can start
+from get_qr_matrix() instead of running qrcode.QRCode.make() itself.
+
+Encoding uses the NumPy encoder in qr_encoder.py, which produces the same
+symbols as qrcode; QR_MATRIX_ENCODER=qrcode switches back to the library.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import qrcode
+
+import qr_encoder
+
+ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+QR_MATRIX_CACHE_SIZE = int(os.environ.get("QR_MATRIX_CACHE_SIZE", 1024))
+
+# "numpy" (qr_encoder) or "qrcode"
+QR_MATRIX_ENCODER = os.environ.get("QR_MATRIX_ENCODER", "numpy")
+
+
+@dataclass(frozen=True)
+class QRMatrix:
+    """An encoded QR symbol: version, EC level, mask and module grid"""
+    version: int
+    error_correction: str
+    mask_pattern: int
+    modules: np.ndarray  # (n, n) read-only bool array, no quiet zone
+
+    @property
+    def modules_count(self) -> int:
+        return self.modules.shape[0]
+
+    def with_border(self, border: int) -> np.ndarray:
+        """Module grid surrounded by a quiet zone of `border` modules"""
+        return np.pad(self.modules, border, constant_values=False)
+
+    def to_qrcode(self, box_size: int = 10, border: int = 4) -> qrcode.QRCode:
+        """A qrcode.QRCode pre-populated with this matrix, for the styled drawers"""
+        qr = qrcode.QRCode(
+            version=self.version,
+            error_correction=ERROR_CORRECTION_LEVELS[self.error_correction],
+            box_size=box_size,
+            border=border,
+            mask_pattern=self.mask_pattern,
+        )
+        qr.modules = self.modules.tolist()
+        qr.modules_count = self.modules_count
+        # Any non-None data_cache stops make_image()/get_matrix() from
+        # re-encoding the (empty) data list
+        qr.data_cache = ()
+        return qr
+
+
+def normalize_error_correction(level: str) -> str:
+    """Map unknown error correction levels to H, like the renderer always has"""
+    return level if level in ERROR_CORRECTION_LEVELS else "H"
+
+
+@lru_cache(maxsize=QR_MATRIX_CACHE_SIZE)
+def _encode(payload: str, error_correction: str) -> QRMatrix:
+    if QR_MATRIX_ENCODER == "numpy":
+        version, mask_pattern, modules = qr_encoder.encode(payload, error_correction)
+    else:
+        version, mask_pattern, modules = _encode_qrcode(payload, error_correction)
+    modules.flags.writeable = False
+    return QRMatrix(version, error_correction, mask_pattern, modules)
+
+
+def _encode_qrcode(payload: str, error_correction: str):
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECTION_LEVELS[error_correction], border=0)
+    qr.add_data(payload)
+    # Same steps as qr.make(fit=True), but keeping the chosen mask
+    qr.best_fit()
+    mask_pattern = qr.best_mask_pattern()
+    qr.makeImpl(False, mask_pattern)
+    return qr.version, mask_pattern, np.array(qr.modules, dtype=bool)
+
+
+def get_qr_matrix(payload: str, error_correction: str = "H") -> QRMatrix:
+    """Encoded module matrix for a payload, cached by (payload, EC level)"""
+    return _encode(payload, normalize_error_correction(error_correction))
+
+
+def matrix_cache_info():
+    return _encode.cache_info()
+
+
+def clear_matrix_cache() -> None:
+    _encode.cache_clear()
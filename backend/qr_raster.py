@@ -0,0 +1,195 @@
+"""Array-based rasterizers that draw straight from a QRMatrix.
+
+These replace qrcode's per-module ImageDraw calls with a handful of NumPy
+operations over the whole module grid.
+"""
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+
+from qr_matrix import QRMatrix
+
+
+def module_mask(matrix: QRMatrix, box_size: int, border: int) -> np.ndarray:
+    """Pixel-level boolean mask of dark modules, quiet zone included"""
+    grid = matrix.with_border(border)
+    return np.repeat(np.repeat(grid, box_size, axis=0), box_size, axis=1)
+
+
+def _square_colors(fill_color, back_color) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+    """Resolve colours to the RGB values qrcode's PilImage ends up with"""
+    if isinstance(back_color, str) and back_color.lower() == "transparent":
+        # PilImage draws on an empty RGBA canvas, which converts to black
+        return ImageColor.getcolor(fill_color, "RGBA")[:3], (0, 0, 0)
+    if isinstance(fill_color, str) and isinstance(back_color, str) \
+            and fill_color.lower() == "black" and back_color.lower() == "white":
+        return (0, 0, 0), (255, 255, 255)
+    return ImageColor.getcolor(fill_color, "RGB"), ImageColor.getcolor(back_color, "RGB")
+
+
+def render_square_modules(
+    matrix: QRMatrix,
+    box_size: int = 10,
+    border: int = 4,
+    fill_color="#000000",
+    back_color="#FFFFFF",
+) -> Image.Image:
+    """Render square modules as an RGB image by scaling the matrix directly.
+
+    Pixel-identical to qr.make_image(fill_color=..., back_color=...).convert('RGB').
+    """
+    fill_rgb, back_rgb = _square_colors(fill_color, back_color)
+    palette = np.array([back_rgb, fill_rgb], dtype=np.uint8)
+    # Map colours at module resolution, then scale up by box_size
+    pixels = palette[matrix.with_border(border).view(np.uint8)]
+    pixels = np.repeat(np.repeat(pixels, box_size, axis=0), box_size, axis=1)
+    return Image.fromarray(pixels, "RGB")
+
+
+# ========== STAMPED MODULE STYLES ==========
+
+# Same supersampling factor qrcode's styled drawers use for antialiasing
+ANTIALIASING_FACTOR = 4
+
+STAMP_STYLES = {
+    "rounded": "rounded",
+    "circle": "circle",
+    "dots": "circle",
+    "gapped": "gapped",
+}
+
+# Tile indices: 0 = empty, 1 = full square (finder "eyes"), then per-style
+# tiles. Rounded modules use 2 + a 4-bit N/E/S/W neighbour context.
+EMPTY_TILE = 0
+SQUARE_TILE = 1
+STYLE_TILE = 2
+
+
+def _rounded_tile(box_size: int, north: bool, east: bool, south: bool, west: bool) -> Image.Image:
+    """One rounded module, quadrant by quadrant like RoundedModuleDrawer"""
+    corner_width = int(box_size / 2)
+    square = Image.new("L", (corner_width, corner_width), 0)
+
+    fake_width = corner_width * ANTIALIASING_FACTOR
+    diameter = fake_width * 2
+    base = Image.new("L", (fake_width, fake_width), 255)
+    base_draw = ImageDraw.Draw(base)
+    base_draw.ellipse((0, 0, diameter, diameter), fill=0)
+    base_draw.rectangle((fake_width, 0, fake_width, fake_width), fill=0)
+    base_draw.rectangle((0, fake_width, fake_width, fake_width), fill=0)
+    nw_round = base.resize((corner_width, corner_width), Image.Resampling.LANCZOS)
+
+    nw = nw_round if not west and not north else square
+    ne = nw_round.transpose(Image.Transpose.FLIP_LEFT_RIGHT) if not north and not east else square
+    se = nw_round.transpose(Image.Transpose.ROTATE_180) if not east and not south else square
+    sw = nw_round.transpose(Image.Transpose.FLIP_TOP_BOTTOM) if not south and not west else square
+
+    tile = Image.new("L", (box_size, box_size), 255)
+    tile.paste(nw, (0, 0))
+    tile.paste(ne, (corner_width, 0))
+    tile.paste(se, (corner_width, corner_width))
+    tile.paste(sw, (0, corner_width))
+    return tile
+
+
+def _circle_tile(box_size: int) -> Image.Image:
+    fake_size = box_size * ANTIALIASING_FACTOR
+    circle = Image.new("L", (fake_size, fake_size), 255)
+    ImageDraw.Draw(circle).ellipse((0, 0, fake_size, fake_size), fill=0)
+    return circle.resize((box_size, box_size), Image.Resampling.LANCZOS)
+
+
+def _gapped_tile(box_size: int, origin: int) -> Image.Image:
+    # GappedSquareModuleDrawer draws at fractional coordinates which PIL
+    # truncates, so draw at a real module origin to get the same pixels
+    delta = (1 - 0.8) * box_size / 2
+    canvas = Image.new("L", (origin + box_size, origin + box_size), 255)
+    ImageDraw.Draw(canvas).rectangle(
+        (origin + delta, origin + delta, origin + box_size - 1 - delta, origin + box_size - 1 - delta),
+        fill=0,
+    )
+    return canvas.crop((origin, origin, origin + box_size, origin + box_size))
+
+
+@lru_cache(maxsize=128)
+def stamp_tiles(style: str, box_size: int, origin: int) -> np.ndarray:
+    """Pre-rendered coverage tiles (255 = dark) for a style and box size"""
+    tiles = [Image.new("L", (box_size, box_size), 255), Image.new("L", (box_size, box_size), 0)]
+    if style == "rounded":
+        for context in range(16):
+            tiles.append(_rounded_tile(
+                box_size, bool(context & 1), bool(context & 2), bool(context & 4), bool(context & 8)
+            ))
+    elif style == "circle":
+        tiles.append(_circle_tile(box_size))
+    elif style == "gapped":
+        tiles.append(_gapped_tile(box_size, origin))
+    else:
+        raise ValueError(f"Unknown stamp style: {style}")
+
+    stack = 255 - np.stack([np.asarray(tile, dtype=np.uint8) for tile in tiles])
+    stack.flags.writeable = False
+    return stack
+
+
+def tile_indices(matrix: QRMatrix, style: str) -> np.ndarray:
+    """Tile index for every module of the (borderless) matrix"""
+    modules = matrix.modules
+    count = matrix.modules_count
+    indices = np.full(modules.shape, STYLE_TILE, dtype=np.intp)
+
+    if style == "rounded":
+        padded = np.pad(modules, 1, constant_values=False)
+        north = padded[:-2, 1:-1]
+        east = padded[1:-1, 2:]
+        south = padded[2:, 1:-1]
+        west = padded[1:-1, :-2]
+        indices += north * 1 + east * 2 + south * 4 + west * 8
+
+    # Finder patterns ("eyes") are always drawn as plain squares
+    eyes = np.zeros(modules.shape, dtype=bool)
+    eyes[:7, :7] = True
+    eyes[:7, count - 7:] = True
+    eyes[count - 7:, :7] = True
+    indices[eyes] = SQUARE_TILE
+    indices[~modules] = EMPTY_TILE
+    return indices
+
+
+def stamp_coverage(matrix: QRMatrix, pattern_style: str, box_size: int = 10, border: int = 4) -> np.ndarray:
+    """Antialiased foreground coverage (255 = dark) for a stamped style"""
+    style = STAMP_STYLES[pattern_style]
+    tiles = stamp_tiles(style, box_size, border * box_size)
+    indices = np.pad(tile_indices(matrix, style), border, constant_values=EMPTY_TILE)
+
+    # Gather one tile per module, then interleave tile rows into image rows
+    size = indices.shape[0]
+    blocks = tiles[indices]  # (rows, cols, box, box)
+    return blocks.transpose(0, 2, 1, 3).reshape(size * box_size, size * box_size)
+
+
+def module_coverage(matrix: QRMatrix, pattern_style: str, box_size: int = 10, border: int = 4) -> np.ndarray:
+    """Foreground coverage (255 = dark) for any supported pattern style"""
+    if pattern_style in STAMP_STYLES:
+        return stamp_coverage(matrix, pattern_style, box_size, border)
+    return module_mask(matrix, box_size, border).view(np.uint8) * 255
+
+
+def render_stamped_modules(
+    matrix: QRMatrix,
+    pattern_style: str,
+    box_size: int = 10,
+    border: int = 4,
+    fill_color="#000000",
+    back_color="#FFFFFF",
+) -> Image.Image:
+    """Render a stamped style (rounded, circle, gapped) as an RGB image"""
+    coverage = Image.fromarray(stamp_coverage(matrix, pattern_style, box_size, border), "L")
+    fill_rgb, back_rgb = _square_colors(fill_color, back_color)
+    return Image.composite(
+        Image.new("RGB", coverage.size, fill_rgb),
+        Image.new("RGB", coverage.size, back_rgb),
+        coverage,
+    )
@@ -0,0 +1,440 @@
+"""QR image rendering pipeline.
+
+Everything here is pure CPU and free of database/app state so it can run
+inside render worker processes (see render_executor.py).
+"""
+from typing import Optional, Dict, Any, Tuple
+from pathlib import Path
+from functools import lru_cache
+from collections import OrderedDict
+import base64
+import logging
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from gradients import gradient_image
+from image_encoding import encode_image
+from logos import get_logo_plate, logo_key, register_logo
+from metrics import StageTimer
+from qr_matrix import get_qr_matrix
+from qr_raster import STAMP_STYLES, module_coverage, render_square_modules, render_stamped_modules
+
+logger = logging.getLogger(__name__)
+
+FRAME_FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+# Bump whenever a change to the pipeline (here or in the modules it uses)
+# alters the image rendered for the same QR code; stored renders of other
+# versions (rendered_store) are then neither served nor kept
+RENDER_VERSION = 1
+
+# ========== PRELOADED LOGOS ==========
+
+# Define available preloaded logos (match frontend)
+PRELOADED_LOGO_NAMES = [
+    "applemusic", "bitcoinsv", "carrd", "facebook", "gmail", 
+    "indeed", "instagram", "pinterest", "readthedocs", "reddit",
+    "spotify", "tiktok", "unitednations", "wechat", "whatsapp",
+    "wikiquote", "x", "youtube"
+]
+
+PRELOADED_LOGO_DIR = Path(__file__).parent / "static" / "assets" / "logos"
+
+# Cache for logo data
+LOGO_DATA_CACHE = {}
+
+def get_preloaded_logo(logo_name):
+    """Get base64 encoded logo data"""
+    if logo_name not in PRELOADED_LOGO_NAMES:
+        return None
+    
+    if logo_name in LOGO_DATA_CACHE:
+        return LOGO_DATA_CACHE[logo_name]
+    
+    try:
+        logo_path = PRELOADED_LOGO_DIR / f"{logo_name}.png"
+        
+        if logo_path.exists():
+            with open(logo_path, "rb") as f:
+                logo_bytes = f.read()
+            
+            # Convert to base64 data URL
+            logo_b64 = base64.b64encode(logo_bytes).decode('utf-8')
+            logo_data_url = f"data:image/png;base64,{logo_b64}"
+            
+            LOGO_DATA_CACHE[logo_name] = logo_data_url
+            return logo_data_url
+    except Exception as e:
+        logger.error(f"Error loading logo {logo_name}: {e}")
+    
+    return None
+
+@lru_cache(maxsize=None)
+def get_preloaded_logo_ref(logo_name) -> Optional[Tuple[str, bytes]]:
+    """(content hash, PNG bytes) of a preloaded logo, for the renderer"""
+    logo_data_url = get_preloaded_logo(logo_name)
+    if not logo_data_url:
+        return None
+    logo_bytes = decode_logo_data(logo_data_url)
+    return logo_key(logo_bytes), logo_bytes
+
+# ========== RENDERING ==========
+
+@lru_cache(maxsize=64)
+def get_frame_font(font_size: int):
+    """Load the frame text font once per size"""
+    try:
+        return ImageFont.truetype(FRAME_FONT_PATH, font_size)
+    except OSError as e:
+        logger.warning(f"Frame font {FRAME_FONT_PATH} unavailable ({e}), using the default font")
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=256)
+def get_frame_text_layout(font_size: int, frame_text: str):
+    """Font and measured (width, height) of a frame text, once per (size, text)"""
+    font = get_frame_font(font_size)
+    bbox = ImageDraw.Draw(Image.new('L', (1, 1))).textbbox((0, 0), frame_text, font=font)
+    return font, bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+def _draw_frame_text(draw, size, frame_width: int, frame_text: str) -> bool:
+    """Draw a frame text at the bottom centre; False if it could not be drawn"""
+    try:
+        font, text_width, text_height = get_frame_text_layout(frame_width // 2, frame_text)
+        
+        # Draw text at bottom center
+        text_x = (size[0] - text_width) // 2
+        text_y = size[1] - frame_width + (frame_width - text_height) // 2
+        
+        draw.text((text_x, text_y), frame_text, fill=255, font=font)
+        return True
+    except Exception as e:
+        # A broken frame text should not fail the whole image, but it must not vanish silently
+        logger.error(f"Error drawing frame text {frame_text!r} at {frame_width // 2}px: {e}")
+        return False
+
+def get_frame_width(width: int) -> int:
+    return int(width * 0.15)  # 15% frame
+
+# Stages timed within the frame stage, when an overlay's text is drawn
+FRAME_TEXT_STAGES = ("frame_text", "frame_text_failed")
+
+FRAME_OVERLAY_CACHE_SIZE = 32
+# (frame style, QR size, frame text) -> overlay mask, least recently used first
+_frame_overlays: "OrderedDict[Tuple[str, Tuple[int, int], str], Image.Image]" = OrderedDict()
+
+def clear_frame_overlay_cache() -> None:
+    _frame_overlays.clear()
+
+def get_frame_overlay(frame_style: str, qr_size, frame_text: str = '', timer: Optional[StageTimer] = None):
+    """Coverage mask (255 = frame colour) of a frame's shape and text around a QR of qr_size.
+
+    The mask is colour-independent, so one entry serves every frame colour.
+    Shared between renders: never draw on the returned image. Drawing the
+    text is timed on timer as the frame_text stage, or frame_text_failed if
+    it could not be drawn; such a mask is not cached, so the next render
+    tries (and reports) the text again.
+    """
+    key = (frame_style, tuple(qr_size), frame_text)
+    mask = _frame_overlays.get(key)
+    if mask is not None:
+        _frame_overlays.move_to_end(key)
+        return mask
+
+    frame_width = get_frame_width(qr_size[0])
+    size = (qr_size[0] + frame_width * 2, qr_size[1] + frame_width * 2)
+    mask = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(mask)
+    
+    if frame_style == 'square':
+        draw.rectangle([0, 0, size[0]-1, size[1]-1], outline=255, width=frame_width//2)
+    elif frame_style == 'rounded':
+        # Draw rounded rectangle frame
+        radius = frame_width
+        draw.rounded_rectangle([0, 0, size[0]-1, size[1]-1], radius=radius, outline=255, width=frame_width//2)
+    elif frame_style == 'circle':
+        # Draw circular frame
+        draw.ellipse([0, 0, size[0]-1, size[1]-1], outline=255, width=frame_width//2)
+    
+    if frame_text:
+        started = time.perf_counter()
+        drawn = _draw_frame_text(draw, size, frame_width, frame_text)
+        if timer is not None:
+            timer.add("frame_text" if drawn else "frame_text_failed", time.perf_counter() - started)
+        if not drawn:
+            return mask
+    
+    _frame_overlays[key] = mask
+    if len(_frame_overlays) > FRAME_OVERLAY_CACHE_SIZE:
+        _frame_overlays.popitem(last=False)
+    return mask
+
+def create_gradient_image(size, color1, color2, gradient_type='linear', direction='horizontal'):
+    """Create a gradient image"""
+    return gradient_image(size, color1, color2, gradient_type, direction)
+
+def get_foreground_mask(matrix, pattern_style='square', box_size=10, border=4):
+    """Foreground coverage of a QR code as an 'L' mask (255 = dark module)"""
+    return Image.fromarray(module_coverage(matrix, pattern_style, box_size, border), 'L')
+
+def add_frame_to_qr(img, frame_style, frame_color='#000000', frame_text='', timer: Optional[StageTimer] = None):
+    """Add frame around QR code"""
+    if not frame_style or frame_style == 'none':
+        return img
+    
+    width, height = img.size
+    frame_width = get_frame_width(width)
+    overlay = get_frame_overlay(frame_style, img.size, frame_text or '', timer)
+    
+    # Create new image with frame, QR pasted in center
+    framed_img = Image.new('RGB', overlay.size, 'white')
+    framed_img.paste(img, (frame_width, frame_width))
+    
+    # Frame shape and text in one paste through the cached overlay
+    framed_img.paste(frame_color, (0, 0), overlay)
+    
+    return framed_img
+
+def decode_logo_data(logo_data):
+    """Logo bytes from a data URL; anything else is passed through"""
+    if isinstance(logo_data, str) and logo_data.startswith('data:image'):
+        # Extract base64 part
+        return base64.b64decode(logo_data.split(',')[1])
+    return logo_data
+
+def add_logo_to_qr(img, logo_data, logo_size_percent=20, logo_key=None):
+    """Add logo to center of QR code; logo_key (its content hash) saves hashing it"""
+    try:
+        # Calculate logo size (percentage of QR size)
+        qr_width, qr_height = img.size
+        logo_max_size = int(min(qr_width, qr_height) * (logo_size_percent / 100))
+        
+        # Logo scaled and composited onto its white background once per size
+        logo_bg = get_logo_plate(logo_data, logo_max_size, logo_key)
+        
+        # Paste logo background on QR code
+        logo_bg_pos = ((qr_width - logo_bg.size[0]) // 2, (qr_height - logo_bg.size[1]) // 2)
+        img.paste(logo_bg, logo_bg_pos)
+        
+        return img
+    except Exception as e:
+        logger.error(f"Error adding logo: {e}")
+        return img
+
+# Default design values shared by every output format
+DESIGN_DEFAULTS = {
+    "foreground_color": "#000000",
+    "background_color": "#FFFFFF",
+    "error_correction": "H",
+    "pattern_style": "square",
+    "gradient_enabled": False,
+    "gradient_color1": None,
+    "gradient_color2": None,
+    "gradient_type": "linear",
+    "gradient_direction": "horizontal",
+    "frame_style": "none",
+    "frame_color": "#000000",
+    "frame_text": "",
+    "logo_data": None,
+    # Content hash of logo_data, set by logo_store.resolve_design_logo
+    "logo_key": None,
+}
+
+def parse_design(design: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Design options merged over the renderer defaults"""
+    options = dict(DESIGN_DEFAULTS)
+    if design:
+        options.update({key: design[key] for key in DESIGN_DEFAULTS if key in design})
+    return options
+
+# Rendition sizes produced by render_qr_renditions by default
+RENDITION_SIZES = (128, 256, 512, 1024, 2048)
+
+def get_box_size(modules_count: int, size: int, border: int = 4, framed: bool = False) -> int:
+    """Largest integer module size whose canvas (and frame) fits in size px"""
+    if framed:
+        # add_frame_to_qr grows the canvas by 15% on every side
+        size = int(size / 1.3)
+    box_size = size // (modules_count + border * 2)
+    if box_size < 1:
+        raise ValueError(f"{size}px is too small for a {modules_count}-module QR code")
+    return box_size
+
+def render_qr_canvas(matrix, options: Dict[str, Any], logo=None, box_size: int = 10, border: int = 4,
+                     size: Optional[int] = None, timer: Optional[StageTimer] = None):
+    """Compose modules, gradient, logo and frame into an RGB image.
+
+    With size, modules are scaled by the largest integer factor that fits and
+    the canvas is padded out to exactly size x size (no resampling). Stage
+    times are recorded on `timer` if one is given.
+    """
+    timer = timer or StageTimer()
+    fg_color = options["foreground_color"]
+    bg_color = options["background_color"]
+    pattern_style = options["pattern_style"]
+    gradient_enabled = options["gradient_enabled"]
+    gradient_color1 = options["gradient_color1"]
+    gradient_color2 = options["gradient_color2"]
+    gradient_type = options["gradient_type"]
+    gradient_direction = options["gradient_direction"]
+    frame_style = options["frame_style"]
+    frame_color = options["frame_color"]
+    frame_text = options["frame_text"]
+    framed = bool(frame_style) and frame_style != 'none'
+
+    if size:
+        box_size = get_box_size(matrix.modules_count, size, border, framed)
+    
+    # Generate image with pattern
+    if gradient_enabled and gradient_color1 and gradient_color2:
+        # Paint the gradient through the module mask onto the background
+        with timer.stage("modules"):
+            mask = get_foreground_mask(matrix, pattern_style, box_size, border)
+        with timer.stage("gradient"):
+            gradient = create_gradient_image(
+                mask.size,
+                gradient_color1,
+                gradient_color2,
+                gradient_type,
+                gradient_direction
+            )
+            background = Image.new('RGB', mask.size, bg_color)
+            pil_img = Image.composite(gradient, background, mask)
+    elif pattern_style in STAMP_STYLES:
+        # Rounded/circle/gapped modules are blitted from cached antialiased tiles
+        with timer.stage("modules"):
+            pil_img = render_stamped_modules(matrix, pattern_style, box_size, border, fg_color, bg_color)
+    else:
+        # Square modules are scaled straight from the matrix
+        with timer.stage("modules"):
+            pil_img = render_square_modules(matrix, box_size, border, fg_color, bg_color)
+    
+    # Add logo if provided
+    if logo:
+        with timer.stage("logo"):
+            pil_img = add_logo_to_qr(pil_img, logo, logo_key=options["logo_key"])
+    
+    # Add frame
+    if framed:
+        with timer.stage("frame"):
+            pil_img = add_frame_to_qr(pil_img, frame_style, frame_color, frame_text, timer)
+    
+    # Pad out to the exact requested size with extra quiet zone
+    if size and pil_img.size != (size, size):
+        canvas = Image.new('RGB', (size, size), 'white' if framed else bg_color)
+        canvas.paste(pil_img, ((size - pil_img.size[0]) // 2, (size - pil_img.size[1]) // 2))
+        pil_img = canvas
+    
+    return pil_img
+
+def create_qr_image(data: str, design: Optional[Dict[str, Any]] = None, box_size: int = 10, border: int = 4,
+                    size: Optional[int] = None, watermark: bool = False, image_format: str = "png",
+                    timer: Optional[StageTimer] = None) -> bytes:
+    """Generate QR code image with advanced customization"""
+    timer = timer or StageTimer()
+    options = parse_design(design)
+    
+    # Encoded matrix is cached by (payload, error correction), so design-only
+    # changes skip encoding entirely
+    with timer.stage("qr_encode"):
+        matrix = get_qr_matrix(data, options["error_correction"])
+    
+    logo_data = options["logo_data"]  # base64 encoded or bytes
+    if logo_data:
+        try:
+            with timer.stage("logo"):
+                logo_data = decode_logo_data(logo_data)
+        except Exception as e:
+            logger.error(f"Error processing logo: {e}")
+            logo_data = None
+    
+    pil_img = render_qr_canvas(matrix, options, logo_data, box_size, border, size, timer)
+    if watermark:
+        with timer.stage("watermark"):
+            add_watermark(pil_img)
+    with timer.stage("image_encode"):
+        return encode_image(pil_img, image_format)
+
+def render_qr_renditions(data: str, design: Optional[Dict[str, Any]] = None, sizes=RENDITION_SIZES,
+                         watermark: bool = False) -> Dict[int, bytes]:
+    """Render several sizes, sharing the encode and logo decode between them"""
+    options = parse_design(design)
+    matrix = get_qr_matrix(data, options["error_correction"])
+    
+    # Logo plates are cached per size, so the logo is decoded once for all renditions
+    logo = None
+    if options["logo_data"]:
+        try:
+            logo = decode_logo_data(options["logo_data"])
+        except Exception as e:
+            logger.error(f"Error processing logo: {e}")
+    
+    renditions = {}
+    for size in sizes:
+        pil_img = render_qr_canvas(matrix, options, logo, size=size)
+        if watermark:
+            add_watermark(pil_img)
+        renditions[size] = encode_image(pil_img)
+    return renditions
+
+WATERMARK_TEXT = "QRPlanet"
+WATERMARK_COLOR = "gray"
+
+@lru_cache(maxsize=64)
+def get_watermark_overlay(size):
+    """Pre-rendered watermark coverage for a canvas size: (mask, position).
+
+    The mask is cropped to the text, so pasting it touches only those pixels.
+    Shared between renders: never draw on the returned image.
+    """
+    w, h = size
+    mask = Image.new('L', size, 0)
+    ImageDraw.Draw(mask).text((w // 2 - 30, h - 20), WATERMARK_TEXT, fill=255)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return None
+    return mask.crop(bbox), bbox[:2]
+
+def add_watermark(img):
+    """Draw the free plan watermark onto a rendered image, in place"""
+    overlay = get_watermark_overlay(img.size)
+    if overlay is not None:
+        mask, position = overlay
+        img.paste(WATERMARK_COLOR, position, mask)
+    return img
+
+def render_qr_image(data: str, design: Optional[Dict[str, Any]] = None, watermark: bool = False,
+                    box_size: int = 10, border: int = 4, size: Optional[int] = None,
+                    image_format: str = "png") -> bytes:
+    """Full render of a QR image, including the free plan watermark"""
+    # Watermarking is a pipeline stage, so the image is encoded exactly once
+    return create_qr_image(data, design, box_size, border, size, watermark, image_format)
+
+def render_qr_image_timed(data: str, design: Optional[Dict[str, Any]] = None, watermark: bool = False,
+                          box_size: int = 10, border: int = 4, size: Optional[int] = None,
+                          image_format: str = "png") -> Tuple[bytes, Dict[str, float]]:
+    """render_qr_image plus the seconds spent in each pipeline stage"""
+    timer = StageTimer()
+    img_bytes = create_qr_image(data, design, box_size, border, size, watermark, image_format, timer)
+    return img_bytes, timer.stages
+
+def warm_up_worker():
+    """Preload fonts and logos so the first real render is not a cold one"""
+    for logo_name in PRELOADED_LOGO_NAMES:
+        logo_ref = get_preloaded_logo_ref(logo_name)
+        if logo_ref:
+            key, logo_bytes = logo_ref
+            register_logo(logo_bytes, key)
+
+    # Frame font sizes for the canvas widths of QR versions 1-10
+    for modules in range(21, 58, 4):
+        width = (modules + 8) * 10
+        get_frame_font(int(width * 0.15) // 2)
+
+    # Exercise the full pipeline once (numpy, PIL codecs, drawers)
+    create_qr_image("warm-up", {
+        "pattern_style": "rounded",
+        "frame_style": "square",
+        "frame_text": "Scan me",
+        "logo_data": get_preloaded_logo(PRELOADED_LOGO_NAMES[0]),
+    })
@@ -0,0 +1,242 @@
+"""Streaming SVG output for QR codes.
+
+The SVG is emitted straight from the cached module matrix: horizontal runs
+of square modules are merged into single path segments, gradients become
+<linearGradient>/<radialGradient>, logos are placed with <image> and frames
+are drawn as vector shapes. Geometry mirrors the PNG renderer (box_size=10,
+border=4) so both formats line up.
+"""
+import math
+from typing import Any, Dict, Iterator, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from gradients import direction_angle, parse_color
+from qr_matrix import QRMatrix, get_qr_matrix
+from qr_raster import SQUARE_TILE, STAMP_STYLES, STYLE_TILE, tile_indices
+from qr_render import parse_design
+
+SVG_BOX_SIZE = 10
+SVG_BORDER = 4
+
+# Rows of modules emitted per chunk of path data
+ROWS_PER_CHUNK = 8
+
+
+def _hex(color, fallback: str = "#000000") -> str:
+    """Normalize a user-supplied colour to #rrggbb (also keeps markup out)"""
+    try:
+        return "#{:02x}{:02x}{:02x}".format(*parse_color(color))
+    except (ValueError, TypeError, AttributeError):
+        return fallback
+
+
+def _num(value: float) -> str:
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+
+def _square_runs(row: np.ndarray, y: int) -> str:
+    """Merge horizontal runs of dark modules in one row into path segments"""
+    # Edges of runs: +1 where a run starts, -1 where it ends
+    edges = np.diff(np.concatenate(([0], row.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return "".join(f"M{x0} {y}h{x1 - x0}v1h{x0 - x1}z" for x0, x1 in zip(starts, ends))
+
+
+def _rounded_module(x: int, y: int, context: int) -> str:
+    """Module with a half-module radius on each corner not touching a neighbour"""
+    north, east, south, west = context & 1, context & 2, context & 4, context & 8
+    nw = 0 if north or west else 0.5
+    ne = 0 if north or east else 0.5
+    se = 0 if south or east else 0.5
+    sw = 0 if south or west else 0.5
+    path = f"M{_num(x + nw)} {y}H{_num(x + 1 - ne)}"
+    if ne:
+        path += "a.5 .5 0 0 1 .5 .5"
+    path += f"V{_num(y + 1 - se)}"
+    if se:
+        path += "a.5 .5 0 0 1 -.5 .5"
+    path += f"H{_num(x + sw)}"
+    if sw:
+        path += "a.5 .5 0 0 1 -.5 -.5"
+    path += f"V{_num(y + nw)}"
+    if nw:
+        path += "a.5 .5 0 0 1 .5 -.5"
+    return path + "z"
+
+
+def _module_rows(matrix: QRMatrix, pattern_style: str) -> Iterator[str]:
+    """Path data for the dark modules, one chunk per ROWS_PER_CHUNK rows"""
+    style = STAMP_STYLES.get(pattern_style)
+    modules = matrix.modules
+    indices = tile_indices(matrix, style) if style else None
+
+    chunk: List[str] = []
+    for y in range(matrix.modules_count):
+        if style is None:
+            chunk.append(_square_runs(modules[y], y))
+        else:
+            for x in np.flatnonzero(modules[y]):
+                index = indices[y, x]
+                if index == SQUARE_TILE:
+                    # Finder patterns stay square, as in the PNG renderer
+                    chunk.append(f"M{x} {y}h1v1h-1z")
+                elif style == "circle":
+                    chunk.append(f"M{x} {_num(y + 0.5)}a.5 .5 0 1 0 1 0a.5 .5 0 1 0 -1 0z")
+                elif style == "gapped":
+                    chunk.append(f"M{_num(x + 0.1)} {_num(y + 0.1)}h.8v.8h-.8z")
+                else:
+                    chunk.append(_rounded_module(int(x), y, int(index) - STYLE_TILE))
+        if (y + 1) % ROWS_PER_CHUNK == 0:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def _gradient_def(options: Dict[str, Any], size: int) -> str:
+    """Gradient spanning the whole QR canvas, matching the raster gradients"""
+    color1 = _hex(options["gradient_color1"])
+    color2 = _hex(options["gradient_color2"])
+    # Gradient coordinates are canvas pixels; the module path they fill is
+    # drawn in module units inside the quiet zone
+    transform = f'gradientTransform="translate(-{SVG_BORDER} -{SVG_BORDER}) scale({_num(1 / SVG_BOX_SIZE)})"'
+    stops = f'<stop offset="0" stop-color="{color1}"/><stop offset="1" stop-color="{color2}"/>'
+
+    if options["gradient_type"] == "radial":
+        center = size // 2
+        radius = math.hypot(center, center)
+        return (
+            f'<radialGradient id="qr-fill" gradientUnits="userSpaceOnUse" {transform} '
+            f'cx="{center}" cy="{center}" r="{_num(radius)}">{stops}</radialGradient>'
+        )
+
+    theta = math.radians(direction_angle(options["gradient_direction"]))
+    cos_t, sin_t = math.cos(theta), math.sin(theta)
+    start_x = 0 if cos_t >= 0 else size
+    start_y = 0 if sin_t >= 0 else size
+    extent = size * (abs(cos_t) + abs(sin_t))
+    # Run the axis from the corner with the smallest projection across the
+    # projected extent of the canvas, like gradients._linear_ratio
+    end_x = start_x + cos_t * extent
+    end_y = start_y + sin_t * extent
+    return (
+        f'<linearGradient id="qr-fill" gradientUnits="userSpaceOnUse" {transform} '
+        f'x1="{_num(start_x)}" y1="{_num(start_y)}" x2="{_num(end_x)}" y2="{_num(end_y)}">'
+        f'{stops}</linearGradient>'
+    )
+
+
+def _frame_shapes(options: Dict[str, Any], size: int, frame_width: int) -> str:
+    frame_style = options["frame_style"]
+    color = _hex(options["frame_color"])
+    total = size + frame_width * 2
+    stroke = frame_width // 2
+    inset = stroke / 2
+    extent = total - 1 - stroke
+
+    shapes = ""
+    if frame_style == "square":
+        shapes = (
+            f'<rect x="{_num(inset)}" y="{_num(inset)}" width="{_num(extent)}" height="{_num(extent)}" '
+            f'fill="none" stroke="{color}" stroke-width="{stroke}"/>'
+        )
+    elif frame_style == "rounded":
+        shapes = (
+            f'<rect x="{_num(inset)}" y="{_num(inset)}" width="{_num(extent)}" height="{_num(extent)}" '
+            f'rx="{frame_width}" fill="none" stroke="{color}" stroke-width="{stroke}"/>'
+        )
+    elif frame_style == "circle":
+        shapes = (
+            f'<ellipse cx="{_num((total - 1) / 2)}" cy="{_num((total - 1) / 2)}" '
+            f'rx="{_num(extent / 2)}" ry="{_num(extent / 2)}" '
+            f'fill="none" stroke="{color}" stroke-width="{stroke}"/>'
+        )
+
+    if options["frame_text"]:
+        shapes += (
+            f'<text x="{_num(total / 2)}" y="{_num(total - frame_width / 2)}" text-anchor="middle" '
+            f'dominant-baseline="central" font-family="DejaVu Sans, Arial, sans-serif" '
+            f'font-weight="bold" font-size="{frame_width // 2}" fill="{color}">'
+            f'{escape(str(options["frame_text"]))}</text>'
+        )
+    return shapes
+
+
+def iter_qr_svg(
+    data: str,
+    design: Optional[Dict[str, Any]] = None,
+    watermark: bool = False,
+    logo_href: Optional[str] = None,
+) -> Iterator[str]:
+    """Stream an SVG document for a QR code in chunks.
+
+    logo_href is referenced from an <image> element instead of rasterizing
+    the logo; when omitted, a data: URL in design["logo_data"] is used.
+    """
+    options = parse_design(design)
+    matrix = get_qr_matrix(data, options["error_correction"])
+
+    size = (matrix.modules_count + SVG_BORDER * 2) * SVG_BOX_SIZE
+    framed = bool(options["frame_style"]) and options["frame_style"] != "none"
+    frame_width = int(size * 0.15) if framed else 0
+    total = size + frame_width * 2
+
+    gradient = bool(options["gradient_enabled"] and options["gradient_color1"] and options["gradient_color2"])
+    fill = "url(#qr-fill)" if gradient else _hex(options["foreground_color"])
+    background = _hex(options["background_color"], "#ffffff")
+
+    yield (
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="{total}" height="{total}" viewBox="0 0 {total} {total}">'
+    )
+    if gradient:
+        yield f"<defs>{_gradient_def(options, size)}</defs>"
+    if framed:
+        yield f'<rect width="{total}" height="{total}" fill="#ffffff"/>'
+
+    yield f'<g transform="translate({frame_width} {frame_width})">'
+    yield f'<rect width="{size}" height="{size}" fill="{background}"/>'
+
+    rendering = ' shape-rendering="crispEdges"' if options["pattern_style"] not in STAMP_STYLES else ""
+    yield (
+        f'<path transform="scale({SVG_BOX_SIZE}) translate({SVG_BORDER} {SVG_BORDER})" '
+        f'fill="{fill}"{rendering} d="'
+    )
+    yield from _module_rows(matrix, options["pattern_style"])
+    yield '"/>'
+
+    if logo_href is None:
+        logo_data = options["logo_data"]
+        if isinstance(logo_data, str) and logo_data.startswith("data:image"):
+            logo_href = logo_data
+    if logo_href:
+        # Same proportions as add_logo_to_qr: 20% logo on a 1.2x white plate
+        logo_size = size * 0.2
+        plate_size = logo_size * 1.2
+        yield (
+            f'<rect x="{_num((size - plate_size) / 2)}" y="{_num((size - plate_size) / 2)}" '
+            f'width="{_num(plate_size)}" height="{_num(plate_size)}" fill="#ffffff"/>'
+            f'<image x="{_num((size - logo_size) / 2)}" y="{_num((size - logo_size) / 2)}" '
+            f'width="{_num(logo_size)}" height="{_num(logo_size)}" '
+            f'preserveAspectRatio="xMidYMid meet" href={quoteattr(logo_href)}/>'
+        )
+    yield "</g>"
+
+    if framed:
+        yield _frame_shapes(options, size, frame_width)
+
+    if watermark:
+        yield (
+            f'<text x="{total // 2}" y="{total - 10}" text-anchor="middle" '
+            'font-family="sans-serif" font-size="11" fill="gray">QRPlanet</text>'
+        )
+    yield "</svg>"
+
+
+def create_qr_svg(data: str, design: Optional[Dict[str, Any]] = None, watermark: bool = False,
+                  logo_href: Optional[str] = None) -> bytes:
+    """Whole SVG document as bytes"""
+    return "".join(iter_qr_svg(data, design, watermark, logo_href)).encode("utf-8")
@@ -0,0 +1,202 @@
+"""Realtime event fan-out to /ws connections.
+
+Events are routed by their user_id to that user's connections only, and a
+connection may narrow its subscription to some qr_ids. publish() never
+waits on a socket: every connection has its own bounded queue drained by
+its own writer task. A slow consumer's queue coalesces repeated events
+(scans of one QR code become one event with a count, job progress keeps
+only the latest) and, when still full, drops its oldest message. A socket
+that does not accept a message within send_timeout is closed.
+
+Events travel through an event bus (see event_bus), so a scan handled by
+one worker reaches the connections held by every worker.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+
+from event_bus import EventBus
+
+logger = logging.getLogger(__name__)
+
+_sequence = count()
+
+# More QR codes than one subscription may name
+MAX_SUBSCRIBED_QR_IDS = 1000
+
+
+def subscription(qr_ids: Any) -> Optional[Set[str]]:
+    """The qr_ids a client asked for (None or empty: all of the user's).
+
+    Clients send this as JSON; anything but a list of strings, or a list
+    longer than MAX_SUBSCRIBED_QR_IDS, raises ValueError.
+    """
+    if qr_ids is None:
+        return None
+    if not isinstance(qr_ids, list) or not all(isinstance(qr_id, str) for qr_id in qr_ids):
+        raise ValueError("qr_ids must be a list of strings")
+    if len(qr_ids) > MAX_SUBSCRIBED_QR_IDS:
+        raise ValueError(f"qr_ids may name at most {MAX_SUBSCRIBED_QR_IDS} QR codes")
+    return set(qr_ids) or None
+
+
+def coalesce_key(event: Dict[str, Any]):
+    """Events with the same key replace each other while queued"""
+    event_type = event.get("type")
+    if event_type == "qr_scan":
+        return (event_type, event.get("qr_id"))
+    if event_type == "render_job_progress":
+        return (event_type, event.get("job_id"))
+    # Everything else is delivered individually
+    return next(_sequence)
+
+
+class Connection:
+    """One authenticated socket with its subscription and send queue"""
+
+    def __init__(self, ws: WebSocket, user_id: str, qr_ids: Optional[Iterable[str]] = None,
+                 max_queue: int = 100, send_timeout: float = 5.0):
+        self.ws = ws
+        self.user_id = user_id
+        self.qr_ids: Optional[Set[str]] = set(qr_ids) if qr_ids else None
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.dropped = 0
+        self.coalesced = 0
+        self._queue: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def subscribe(self, qr_ids: Any) -> None:
+        """Limit events to the QR codes of a client's subscribe message (None
+        or empty: all of the user's); raises ValueError, keeping the current
+        subscription, if they are not a list of strings"""
+        self.qr_ids = subscription(qr_ids)
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        if self.qr_ids is None or "qr_id" not in event:
+            return True
+        return event["qr_id"] in self.qr_ids
+
+    def offer(self, event: Dict[str, Any]) -> None:
+        key = coalesce_key(event)
+        queued = self._queue.get(key)
+        if queued is not None:
+            self.coalesced += 1
+            if event.get("type") == "qr_scan":
+                queued["count"] = queued.get("count", 1) + event.get("count", 1)
+            else:
+                self._queue[key] = dict(event)
+            return
+        if len(self._queue) >= self.max_queue:
+            self._queue.popitem(last=False)
+            self.dropped += 1
+        self._queue[key] = dict(event)
+        self._ready.set()
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._write())
+
+    async def stop(self) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+
+    async def _write(self) -> None:
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue:
+                _, message = self._queue.popitem(last=False)
+                try:
+                    await asyncio.wait_for(self.ws.send_json(message), self.send_timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.info(f"Closing realtime connection of {self.user_id}: {type(e).__name__} {e}")
+                    self._queue.clear()
+                    try:
+                        await self.ws.close(code=1011)
+                    except Exception:
+                        pass
+                    return
+
+
+class Broadcaster:
+    """Routes events to the connections of the user they belong to"""
+
+    def __init__(self, max_queue: int = 100, send_timeout: float = 5.0, bus: Optional[EventBus] = None):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.bus = bus if bus is not None else EventBus()
+        self._connections: Dict[str, Set[Connection]] = {}
+        self.published = 0
+        self.delivered = 0
+        # Totals of connections that have closed
+        self._closed_dropped = 0
+        self._closed_coalesced = 0
+
+    def __len__(self) -> int:
+        return sum(len(connections) for connections in self._connections.values())
+
+    def connect(self, ws: WebSocket, user_id: str, qr_ids: Optional[Iterable[str]] = None) -> Connection:
+        connection = Connection(ws, user_id, qr_ids, self.max_queue, self.send_timeout)
+        self._connections.setdefault(user_id, set()).add(connection)
+        connection.start()
+        return connection
+
+    async def disconnect(self, connection: Connection) -> None:
+        connections = self._connections.get(connection.user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._connections[connection.user_id]
+        self._closed_dropped += connection.dropped
+        self._closed_coalesced += connection.coalesced
+        await connection.stop()
+
+    async def start(self) -> None:
+        await self.bus.start(self.deliver)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Queue an event for its owner's connections on every worker; never
+        waits on a socket"""
+        self.published += 1
+        if self.bus.running:
+            self.bus.publish(event)
+        else:
+            self.deliver([event])
+
+    def deliver(self, events: List[Dict[str, Any]]) -> None:
+        """Hand events (from this worker or another) to local connections"""
+        for event in events:
+            self._dispatch(event)
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        for connection in self._connections.get(event.get("user_id"), ()):
+            if connection.wants(event):
+                connection.offer(event)
+                self.delivered += 1
+
+    async def stop(self) -> None:
+        await self.bus.stop()
+        connections = [c for group in self._connections.values() for c in group]
+        self._connections.clear()
+        await asyncio.gather(*(c.stop() for c in connections), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        connections = [c for group in self._connections.values() for c in group]
+        return {
+            "connections": len(connections),
+            "users": len(self._connections),
+            "published": self.published,
+            "delivered": self.delivered,
+            "queued": sum(len(c._queue) for c in connections),
+            "coalesced": self._closed_coalesced + sum(c.coalesced for c in connections),
+            "dropped": self._closed_dropped + sum(c.dropped for c in connections),
+        }
@@ -0,0 +1,131 @@
+"""In-process cache of redirect token resolutions.
+
+/api/r/{token} only needs a few fields of the QR document (owner, type and
+where to send the scanner), so the cache keeps that compact record instead
+of the document with its design. Records expire after a TTL and are tagged
+(qr_id, user_id) so write paths can drop them at once; unknown tokens are
+cached too, for a shorter TTL, so scans of a dead or mistyped token do not
+each cost a query. Each process has its own cache, so a write handled by
+another worker becomes visible here within the TTL.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+# load(token) -> record, or None if no QR code has this token
+Loader = Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class RedirectCache:
+    """LRU of token -> record (or None for unknown tokens) with per-entry expiry"""
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Bumped by every invalidation; loads that started before one are not cached
+        self._generation = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def resolve(self, token: str, load: Loader) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(token)
+        if entry is not None:
+            expires_at, record = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(token)
+                if record is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return record
+            self._remove(token)
+
+        self.misses += 1
+        # Concurrent scans of the same token share one query
+        pending = self._loading.get(token)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(token, load))
+            self._loading[token] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(token, None))
+        return await asyncio.shield(pending)
+
+    def invalidate(self, *tags: str) -> int:
+        """Drop every record tagged with any of the given qr_ids / user_ids"""
+        self._generation += 1
+        removed = 0
+        for tag in tags:
+            for token in list(self._tags.get(tag, ())):
+                self._remove(token)
+                removed += 1
+        self.invalidations += removed
+        return removed
+
+    def discard(self, *tokens: str) -> None:
+        """Forget tokens, e.g. a newly issued one that may be cached as unknown"""
+        self._generation += 1
+        for token in tokens:
+            if token in self._entries:
+                self._remove(token)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self._tags.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    async def _load(self, token: str, load: Loader) -> Optional[Dict[str, Any]]:
+        generation = self._generation
+        record = await load(token)
+        if generation == self._generation:
+            self._put(token, record)
+        return record
+
+    def _put(self, token: str, record: Optional[Dict[str, Any]]) -> None:
+        if token in self._entries:
+            self._remove(token)
+        ttl = self.negative_ttl if record is None else self.ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[token] = (time.monotonic() + ttl, record)
+        for tag in self._record_tags(record):
+            self._tags.setdefault(tag, set()).add(token)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, token: str) -> None:
+        _, record = self._entries.pop(token)
+        for tag in self._record_tags(record):
+            tokens = self._tags.get(tag)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tags[tag]
+
+    @staticmethod
+    def _record_tags(record: Optional[Dict[str, Any]]) -> Iterable[str]:
+        if record is None:
+            return ()
+        return tuple(tag for tag in (record.get("qr_id"), record.get("user_id")) if tag)
@@ -0,0 +1,130 @@
+"""Process-pool executor for CPU-bound QR rendering.
+
+Rendering (matrix encode, PIL drawing, PNG encode) holds the GIL for tens of
+milliseconds, so running it inside an async handler stalls every other
+request on the worker. Jobs are shipped to a pool of spawned processes
+instead, behind a bounded admission count so overload turns into fast 503s
+rather than an unbounded backlog.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    """Raised when the executor already has max_pending jobs in flight"""
+
+
+class RenderTimeout(Exception):
+    """Raised when a render job does not finish within the job timeout"""
+
+
+class RenderWorkerCrashed(Exception):
+    """Raised when the worker process running a job died; the pool is restarted"""
+
+
+class RenderExecutor:
+    """Bounded process pool that async handlers can await render jobs on"""
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        timeout: float = 10.0,
+        initializer: Optional[Callable[[], Any]] = None,
+    ):
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self.max_pending = max_pending if max_pending is not None else max(self.max_workers, 1) * 8
+        self.timeout = timeout
+        self.initializer = initializer
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        if self._pool is not None or self.max_workers <= 0:
+            return
+        # Spawn rather than fork: the parent holds an event loop and Mongo
+        # client sockets that must not be duplicated into workers
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer,
+        )
+        logger.info(f"Render executor started with {self.max_workers} workers")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) in a worker process and await its result"""
+        if self.max_workers <= 0:
+            # Inline mode (QR_RENDER_WORKERS=0), mainly for local development
+            return fn(*args)
+
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise RenderQueueFull(f"{self.pending} render jobs already pending")
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            future = loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # A worker died since the last job; this one never ran, so it is
+            # safe to submit it again to a fresh pool
+            pool = self._restart(pool)
+            future = loop.run_in_executor(pool, fn, *args)
+        self.pending += 1
+        # A timed-out job keeps its worker busy until it finishes, so only
+        # release the admission slot once the underlying job is done
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise RenderTimeout(f"Render did not finish within {self.timeout}s")
+        except BrokenProcessPool:
+            # The job itself may have killed the worker, so it is not retried
+            self.crashes += 1
+            logger.error("Render worker died, restarting pool")
+            self._restart(pool)
+            raise RenderWorkerCrashed("Render worker died")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+        }
+
+    def _release(self, future) -> None:
+        self.pending -= 1
+        if not future.cancelled():
+            # Retrieve the exception so abandoned (timed-out) jobs don't log
+            # "exception was never retrieved"
+            future.exception()
+
+    def _restart(self, broken: Optional[ProcessPoolExecutor]) -> ProcessPoolExecutor:
+        """Replace a broken pool, unless another job already replaced it"""
+        if self._pool is broken:
+            self._pool = None
+            if broken is not None:
+                broken.shutdown(wait=False, cancel_futures=True)
+            self.start()
+        return self._pool
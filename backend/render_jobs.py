@@ -0,0 +1,374 @@
+"""Persistent background render jobs.
+
+Jobs live in the `render_jobs` collection, so they survive restarts. Workers
+claim the oldest runnable job with an atomic find_one_and_update that also
+takes a lease. While a job runs, its worker renews the lease every third of
+lease_seconds, however long its items take; if the worker dies, the lease
+lapses and another worker claims the job again, up to max_attempts. A user with per_user_limit jobs already running is skipped
+while claiming, so one tenant's backlog cannot starve everyone else.
+
+Results go to a directory on disk: the image itself for a single QR code,
+otherwise a ZIP with a manifest.csv.
+"""
+import asyncio
+import csv
+import io
+import logging
+import os
+import socket
+import uuid
+import zipfile
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from bulk import map_unordered
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_EXPIRED = "expired"
+
+# render_item(job, index, qr_id) -> (file name, bytes)
+RenderItem = Callable[[Dict[str, Any], int, str], Awaitable[Tuple[str, bytes]]]
+# notify(user_id, event): deliver a job event to the job owner only
+Notify = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+# Fields of a job document exposed through the API
+PUBLIC_JOB_FIELDS = (
+    "job_id", "status", "total", "completed", "failed", "attempts", "options",
+    "created_at", "started_at", "finished_at", "error", "result_bytes",
+)
+
+
+class LeaseLost(Exception):
+    """Raised when another worker has reclaimed the job this worker was running"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class RenderJobQueue:
+    """Mongo-backed render job queue processed by in-process async workers"""
+
+    def __init__(
+        self,
+        db,
+        render_item: RenderItem,
+        storage_dir,
+        workers: int = 2,
+        per_user_limit: int = 1,
+        item_concurrency: int = 4,
+        lease_seconds: float = 60.0,
+        max_attempts: int = 3,
+        poll_interval: float = 2.0,
+        result_ttl: float = 24 * 3600,
+        notify: Optional[Notify] = None,
+    ):
+        self.collection = db.render_jobs
+        self.render_item = render_item
+        self.storage_dir = Path(storage_dir)
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.item_concurrency = item_concurrency
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.notify = notify
+        self._tasks: List[asyncio.Task] = []
+        self._worker_ids: List[str] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    # ----- API side -----
+
+    async def enqueue(self, user_id: str, qr_ids: List[str], options: Dict[str, Any]) -> Dict[str, Any]:
+        now = _now().isoformat()
+        job = {
+            "job_id": f"job_{uuid.uuid4().hex[:12]}",
+            "user_id": user_id,
+            "status": JOB_QUEUED,
+            "qr_ids": qr_ids,
+            "options": options,
+            "total": len(qr_ids),
+            "completed": 0,
+            "failed": 0,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.collection.insert_one(job)
+        job.pop("_id", None)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"job_id": job_id, "user_id": user_id}, {"_id": 0, "qr_ids": 0})
+
+    def result_path(self, job: Dict[str, Any]) -> Optional[Path]:
+        if job.get("status") != JOB_DONE or not job.get("result_file"):
+            return None
+        return self.storage_dir / job["result_file"]
+
+    # ----- lifecycle -----
+
+    def start(self) -> None:
+        if self._tasks or self.workers <= 0:
+            return
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self._wakeup = asyncio.Event()
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        for n in range(self.workers):
+            worker_id = f"{prefix}-{n}"
+            self._worker_ids.append(worker_id)
+            self._tasks.append(asyncio.create_task(self._worker(worker_id, purge=n == 0)))
+        logger.info(f"Render job queue started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._worker_ids:
+            # Hand interrupted jobs straight back to the queue without using up an attempt
+            await self.collection.update_many(
+                {"status": JOB_RUNNING, "worker_id": {"$in": self._worker_ids}},
+                {"$set": {"status": JOB_QUEUED, "updated_at": _now().isoformat()}, "$inc": {"attempts": -1}}
+            )
+            self._worker_ids = []
+
+    # ----- workers -----
+
+    async def _worker(self, worker_id: str, purge: bool) -> None:
+        last_purge = None
+        while True:
+            try:
+                if purge and (last_purge is None or (_now() - last_purge).total_seconds() > 600):
+                    last_purge = _now()
+                    await self._purge_expired()
+
+                job = await self._claim(worker_id)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job, worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Render job worker {worker_id} error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        now = _now()
+        busy = await self.collection.aggregate([
+            {"$match": {"status": JOB_RUNNING, "lease_expires_at": {"$gte": now.isoformat()}}},
+            {"$group": {"_id": "$user_id", "running": {"$sum": 1}}},
+        ]).to_list(length=None)
+        saturated = [entry["_id"] for entry in busy if entry["running"] >= self.per_user_limit]
+
+        job = await self.collection.find_one_and_update(
+            {
+                "user_id": {"$nin": saturated},
+                "$or": [
+                    {"status": JOB_QUEUED},
+                    # Lease ran out: the worker running it died
+                    {"status": JOB_RUNNING, "lease_expires_at": {"$lt": now.isoformat()}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "worker_id": worker_id,
+                    "lease_expires_at": self._lease_deadline(),
+                    "started_at": now.isoformat(),
+                    "updated_at": now.isoformat(),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            return None
+        job.pop("_id", None)
+        if job["attempts"] > self.max_attempts:
+            await self._finish(job, JOB_FAILED, error=f"Gave up after {self.max_attempts} attempts")
+            return None
+        return job
+
+    def _lease_deadline(self) -> str:
+        return (_now() + timedelta(seconds=self.lease_seconds)).isoformat()
+
+    async def _run(self, job: Dict[str, Any], worker_id: str) -> None:
+        """Render a claimed job, keeping its lease alive until it is done"""
+        render = asyncio.create_task(self._render(job, worker_id))
+        lease = asyncio.create_task(self._keep_lease(job, worker_id, render))
+        try:
+            await render
+        except asyncio.CancelledError:
+            if lease.done() and not lease.cancelled():
+                # The lease was lost and the render stopped; the job is someone else's now
+                return
+            raise
+        finally:
+            lease.cancel()
+
+    async def _keep_lease(self, job: Dict[str, Any], worker_id: str, render: asyncio.Task) -> None:
+        """Renew the lease on a timer; items can wait in the render queue for
+        longer than lease_seconds without the job looking abandoned"""
+        job_id = job["job_id"]
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                result = await self.collection.update_one(
+                    {"job_id": job_id, "worker_id": worker_id},
+                    {"$set": {"lease_expires_at": self._lease_deadline()}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of render job {job_id}: {e}")
+                continue
+            if result.matched_count == 0:
+                logger.warning(f"Render job {job_id} was reclaimed by another worker")
+                render.cancel()
+                return
+
+    async def _render(self, job: Dict[str, Any], worker_id: str) -> None:
+        job_id = job["job_id"]
+        qr_ids = job["qr_ids"]
+        single = len(qr_ids) == 1
+        part_path = self.storage_dir / f"{job_id}.part"
+        completed = failed = 0
+        result_file = None
+        item_error: Optional[BaseException] = None
+        last_report = asyncio.get_running_loop().time()
+
+        try:
+            # An interrupted render closes its archive before the file under it
+            with open(part_path, "wb") as part, \
+                    (nullcontext() if single else zipfile.ZipFile(part, "w", zipfile.ZIP_STORED)) as archive:
+                manifest = io.StringIO()
+                manifest_writer = csv.writer(manifest)
+                manifest_writer.writerow(["row", "qr_id", "file", "error"])
+
+                async for index, item, error in map_unordered(
+                    lambda i: self.render_item(job, i, qr_ids[i]), len(qr_ids), self.item_concurrency
+                ):
+                    completed += 1
+                    if error is not None:
+                        failed += 1
+                        item_error = error
+                        manifest_writer.writerow([index + 1, qr_ids[index], "", str(error) or type(error).__name__])
+                    else:
+                        filename, data = item
+                        if single:
+                            part.write(data)
+                            result_file = f"{job_id}{Path(filename).suffix}"
+                        else:
+                            archive.writestr(filename, data)
+                        manifest_writer.writerow([index + 1, qr_ids[index], filename, ""])
+
+                    loop_time = asyncio.get_running_loop().time()
+                    if loop_time - last_report >= 0.5 or completed == len(qr_ids):
+                        last_report = loop_time
+                        await self._report_progress(job, worker_id, completed, failed)
+
+                if archive is not None:
+                    archive.writestr("manifest.csv", manifest.getvalue())
+                    archive.close()
+                    result_file = f"{job_id}.zip"
+
+            if result_file is None:
+                # The only QR code failed to render; retrying would fail the same way
+                part_path.unlink(missing_ok=True)
+                error = (str(item_error) or type(item_error).__name__) if item_error else "Render failed"
+                await self._finish(job, JOB_FAILED, error=error, worker_id=worker_id)
+                return
+            os.replace(part_path, self.storage_dir / result_file)
+            await self._finish(job, JOB_DONE, result_file=result_file, worker_id=worker_id)
+        except LeaseLost:
+            logger.warning(f"Render job {job_id} was reclaimed by another worker")
+            part_path.unlink(missing_ok=True)
+        except asyncio.CancelledError:
+            part_path.unlink(missing_ok=True)
+            raise
+        except Exception as e:
+            part_path.unlink(missing_ok=True)
+            logger.error(f"Render job {job_id} failed: {e}")
+            if job["attempts"] < self.max_attempts:
+                await self.collection.update_one(
+                    {"job_id": job_id, "worker_id": worker_id},
+                    {"$set": {"status": JOB_QUEUED, "error": str(e), "updated_at": _now().isoformat()}}
+                )
+            else:
+                await self._finish(job, JOB_FAILED, error=str(e), worker_id=worker_id)
+
+    async def _report_progress(self, job: Dict[str, Any], worker_id: str, completed: int, failed: int) -> None:
+        result = await self.collection.update_one(
+            {"job_id": job["job_id"], "worker_id": worker_id, "status": JOB_RUNNING},
+            {"$set": {
+                "completed": completed,
+                "failed": failed,
+                "lease_expires_at": self._lease_deadline(),
+                "updated_at": _now().isoformat(),
+            }}
+        )
+        if result.matched_count == 0:
+            raise LeaseLost(job["job_id"])
+        await self._notify(job, {
+            "type": "render_job_progress",
+            "job_id": job["job_id"],
+            "completed": completed,
+            "failed": failed,
+            "total": job["total"],
+        })
+
+    async def _finish(self, job: Dict[str, Any], status: str, result_file: Optional[str] = None,
+                      error: Optional[str] = None, worker_id: Optional[str] = None) -> None:
+        update = {"status": status, "finished_at": _now().isoformat(), "updated_at": _now().isoformat()}
+        if result_file:
+            update["result_file"] = result_file
+            update["result_bytes"] = (self.storage_dir / result_file).stat().st_size
+        if error:
+            update["error"] = error
+        query = {"job_id": job["job_id"]}
+        if worker_id:
+            query["worker_id"] = worker_id
+        await self.collection.update_one(query, {"$set": update})
+        await self._notify(job, {"type": "render_job_done", "job_id": job["job_id"], "status": status})
+
+    async def _notify(self, job: Dict[str, Any], event: Dict[str, Any]) -> None:
+        if self.notify is None:
+            return
+        try:
+            await self.notify(job["user_id"], event)
+        except Exception as e:
+            logger.warning(f"Render job event not delivered: {e}")
+
+    async def _purge_expired(self) -> None:
+        """Delete result files older than result_ttl"""
+        cutoff = (_now() - timedelta(seconds=self.result_ttl)).isoformat()
+        async for job in self.collection.find(
+            {"status": JOB_DONE, "finished_at": {"$lt": cutoff}}, {"_id": 0, "job_id": 1, "result_file": 1}
+        ):
+            if job.get("result_file"):
+                (self.storage_dir / job["result_file"]).unlink(missing_ok=True)
+            await self.collection.update_one(
+                {"job_id": job["job_id"]},
+                {"$set": {"status": JOB_EXPIRED}, "$unset": {"result_file": ""}}
+            )
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: job[field] for field in PUBLIC_JOB_FIELDS if field in job}
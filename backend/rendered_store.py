@@ -0,0 +1,223 @@
+"""Persistent store of canonical rendered QR images (render-on-write).
+
+A QR code's default image (PNG, default size, stored design) only changes
+when the document is written or the owner's plan changes the watermark, so
+write paths render it once in the background and image endpoints serve the
+file directly. Files live at
+root/v<render version>/<qr_id>/<updated_at digits>_<variant>.png: a newer
+version of a QR code replaces the older ones, the least recently served
+files are pruned when the store grows past its byte budget, and files of
+other render versions (from before a renderer change) are purged at startup.
+"""
+import asyncio
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Hits refresh a file's mtime (the pruning order) at most this often
+TOUCH_INTERVAL = 3600
+
+# Pruning frees space down to this fraction of max_bytes
+PRUNE_TARGET = 0.9
+
+
+def _version(updated_at: str) -> str:
+    """Sortable file-name form of an updated_at isoformat timestamp"""
+    return re.sub(r"[^0-9]", "", str(updated_at))
+
+
+class RenderedImageStore:
+    """Canonical PNGs on disk, one current version per QR code and watermark variant"""
+
+    def __init__(self, root, max_bytes: int, render_version):
+        self.base = Path(root)
+        self.root = self.base / f"v{render_version}"
+        self.max_bytes = max_bytes
+        self.current_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.pruned = 0
+
+    def path(self, qr_id: str, updated_at: str, watermark: bool) -> Path:
+        variant = "wm" if watermark else "clean"
+        return self.root / qr_id / f"{_version(updated_at)}_{variant}.png"
+
+    def get(self, qr_id: str, updated_at: str, watermark: bool) -> Optional[Path]:
+        path = self.path(qr_id, updated_at, watermark)
+        try:
+            mtime = path.stat().st_mtime
+        except (FileNotFoundError, NotADirectoryError):
+            self.misses += 1
+            return None
+        now = time.time()
+        if now - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                pass
+        self.hits += 1
+        return path
+
+    async def put(self, qr_id: str, updated_at: str, watermark: bool, data: bytes) -> Path:
+        return await asyncio.to_thread(self._write, self.path(qr_id, updated_at, watermark), data)
+
+    async def discard(self, qr_id: str) -> None:
+        """Drop every stored version of a QR code (it was deleted)"""
+        await asyncio.to_thread(self._discard, qr_id)
+
+    async def purge_stale_versions(self) -> int:
+        """Delete images rendered by other render versions; returns directories removed"""
+        return await asyncio.to_thread(self._purge_stale_versions)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "pruned": self.pruned,
+        }
+
+    def _write(self, path: Path, data: bytes) -> Path:
+        if self.current_bytes is None:
+            self.current_bytes = self._scan()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.writes += 1
+        self.current_bytes += len(data)
+
+        # Older versions, and the other variant of this version, are stale
+        version = path.name.split("_")[0]
+        for sibling in path.parent.glob("*.png"):
+            if sibling != path and sibling.name.split("_")[0] <= version:
+                self.current_bytes -= self._unlink(sibling)
+
+        if self.current_bytes > self.max_bytes:
+            self._prune()
+        return path
+
+    def _discard(self, qr_id: str) -> None:
+        directory = self.root / qr_id
+        if not directory.is_dir():
+            return
+        if self.current_bytes is not None:
+            self.current_bytes -= sum(f.stat().st_size for f in directory.glob("*.png"))
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def _purge_stale_versions(self) -> int:
+        if not self.base.is_dir():
+            return 0
+        # Everything beside the current version directory, including the
+        # unversioned <qr_id> directories of the original layout
+        stale = [entry for entry in self.base.iterdir() if entry.is_dir() and entry != self.root]
+        for entry in stale:
+            shutil.rmtree(entry, ignore_errors=True)
+        if stale:
+            logger.info(f"Purged {len(stale)} stale directories from the rendered image store")
+        return len(stale)
+
+    def _unlink(self, path: Path) -> int:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def _scan(self) -> int:
+        if not self.root.is_dir():
+            return 0
+        return sum(f.stat().st_size for f in self.root.glob("*/*.png"))
+
+    def _prune(self) -> None:
+        """Delete least recently served files until under PRUNE_TARGET of the budget"""
+        files = []
+        for f in self.root.glob("*/*.png"):
+            try:
+                stat = f.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, f))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * PRUNE_TARGET
+        for _, size, f in files:
+            if total <= target:
+                break
+            total -= self._unlink(f)
+            self.pruned += 1
+            try:
+                f.parent.rmdir()
+            except OSError:
+                pass
+        self.current_bytes = total
+        logger.info(f"Pruned rendered image store to {total} bytes")
+
+
+class Prerenderer:
+    """Background render-on-write tasks, run one at a time per key.
+
+    A key is a QR code, or a user whose QR codes all need rendering again.
+    A write that lands while that key is already rendering schedules exactly
+    one more render, so the newest version always ends up stored.
+    """
+
+    def __init__(self, render: Callable[[str], Awaitable[None]], concurrency: int = 2):
+        self.render = render
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._again: set = set()
+
+    def __len__(self) -> int:
+        return len(self._running)
+
+    def schedule(self, qr_id: str) -> None:
+        if qr_id in self._running:
+            self._again.add(qr_id)
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        task = asyncio.create_task(self._run(qr_id))
+        self._running[qr_id] = task
+        task.add_done_callback(lambda _: self._done(qr_id))
+
+    async def stop(self) -> None:
+        self._again.clear()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, qr_id: str) -> None:
+        async with self._semaphore:
+            try:
+                await self.render(qr_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The image endpoints fall back to rendering on request
+                logger.warning(f"Prerender failed for {qr_id}: {e}")
+
+    def _done(self, qr_id: str) -> None:
+        self._running.pop(qr_id, None)
+        if qr_id in self._again:
+            self._again.discard(qr_id)
+            self.schedule(qr_id)
@@ -0,0 +1,393 @@
+"""Batched, asynchronous scan event writes.
+
+Scan handlers hand their event to ScanWriter.submit() and respond at once. A
+background task flushes queued events every batch_size events or every
+flush_interval seconds: one insert_many for the events and one unordered
+bulk_write of coalesced scan_count increments.
+
+If a flush fails (Mongo unreachable, say) the batch is appended to a JSON
+lines spill file and replayed once writes succeed again. Replays upsert
+events by scan_id, so a batch that was partly written before the failure is
+not duplicated. Events that arrive while the queue is full are spilled too,
+from a background thread. stop() drains the queue before shutdown.
+
+Every writer (one per server process) spills to a file of its own beside
+the configured spill path, and holds an flock on a matching lock file while
+it runs. A writer replays its own file plus those of writers that have
+exited, claiming each by taking that writer's lock, so no spill file is
+ever replayed by two processes.
+
+on_written(events) is called with each batch once it is stored and its
+scan_counts incremented, replayed batches included, so anything it
+announces is already visible to readers. Events whose increments had to be
+spilled are not passed to it.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class ScanWriter:
+    def __init__(
+        self,
+        db,
+        spill_path,
+        max_queue: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 0.25,
+        retry_interval: float = 5.0,
+        drain_timeout: float = 10.0,
+        flush_seconds: Optional[Histogram] = None,
+        on_written: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ):
+        self.events = db.scan_events
+        self.qr_codes = db.qr_codes
+        self.spill_path = Path(spill_path)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.drain_timeout = drain_timeout
+        self.flush_seconds = flush_seconds
+        self.on_written = on_written
+        self._queue: Deque[Dict[str, Any]] = deque()
+        # Events that found the queue full, waiting for _spilling to write them
+        self._overflow: List[Dict[str, Any]] = []
+        self._spilling: Optional[asyncio.Task] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._spill_lock = threading.Lock()
+        self._last_spill = 0.0
+        self._last_replay = 0.0
+        self.owner = self._new_owner()
+        # Held (flock) while this writer may still append to its spill file
+        self._owner_lock: Optional[int] = None
+        self.written = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.failed_flushes = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def submit(self, event: Dict[str, Any]) -> None:
+        """Queue a scan event (a scan_events document); never blocks on Mongo or disk.
+
+        Events submitted while the writer is stopped wait for the next start().
+        """
+        if len(self._queue) >= self.max_queue:
+            # Mongo is not keeping up: keep the event on disk
+            self._overflow.append(event)
+            if self._spilling is None:
+                self._spilling = asyncio.create_task(self._spill_overflow())
+            return
+        self._queue.append(event)
+        if self._task is not None and len(self._queue) >= self.batch_size:
+            self._batch_ready.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "written": self.written,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "failed_flushes": self.failed_flushes,
+        }
+
+    # ----- lifecycle -----
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._stopping = False
+        if self._owner_lock is None:
+            # A fresh identity per run: files of an earlier run are replayed
+            # like any other exited writer's
+            self.owner = self._new_owner()
+        self._last_replay = 0.0
+        self._batch_ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything queued, then stop the background task"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._batch_ready.set()
+        try:
+            await asyncio.wait_for(self._task, self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Scan writer did not drain in time, spilling the rest to disk")
+        finally:
+            self._task = None
+            if self._spilling is not None:
+                await asyncio.gather(self._spilling, return_exceptions=True)
+            if self._queue or self._overflow:
+                # Flushing was interrupted; nothing queued is lost
+                events = list(self._queue) + self._overflow
+                self._queue.clear()
+                self._overflow = []
+                await asyncio.to_thread(self._spill, events, [])
+            await asyncio.to_thread(self._release_owner_lock)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._stopping:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+
+            try:
+                while self._queue:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                    try:
+                        await self._flush(batch)
+                    except asyncio.CancelledError:
+                        self._queue.extendleft(reversed(batch))
+                        raise
+                if self._should_replay():
+                    await self._replay()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scan writer error: {e}")
+
+            if self._stopping and not self._queue:
+                return
+
+    # ----- writing -----
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            await self._write(batch)
+            self.written += len(batch)
+        except _IncrementsSpilled:
+            outcome = "spilled"
+            self.failed_flushes += 1
+            self.written += len(batch)
+            logger.warning(f"Scan count update for {len(batch)} events failed, spilled to disk")
+        except Exception as e:
+            outcome = "spilled"
+            self.failed_flushes += 1
+            logger.warning(f"Scan flush of {len(batch)} events failed, spilling to disk: {e}")
+            await asyncio.to_thread(self._spill, batch, [])
+        finally:
+            if self.flush_seconds is not None:
+                self.flush_seconds.observe(time.perf_counter() - start, outcome=outcome)
+
+    async def _write(self, batch: List[Dict[str, Any]], replay: bool = False) -> None:
+        if replay:
+            # Some of these may have been written before the failure that spilled them
+            await self.events.bulk_write(
+                [ReplaceOne({"scan_id": event["scan_id"]}, event, upsert=True) for event in batch], ordered=False
+            )
+        else:
+            # insert_many adds an _id to each document; keep the caller's dicts clean
+            await self.events.insert_many([dict(event) for event in batch], ordered=False)
+        try:
+            await self._increment(Counter(event["qr_id"] for event in batch))
+        except Exception:
+            # Events are stored; only their counts still need applying
+            await asyncio.to_thread(self._spill, [], [event["qr_id"] for event in batch])
+            raise _IncrementsSpilled()
+        if self.on_written is not None:
+            try:
+                self.on_written(batch)
+            except Exception as e:
+                # The batch is stored; failing here would spill and count it twice
+                logger.error(f"Scan writer on_written callback failed: {e}")
+
+    async def _increment(self, counts: Counter) -> None:
+        if counts:
+            await self.qr_codes.bulk_write(
+                [UpdateOne({"qr_id": qr_id}, {"$inc": {"scan_count": n}}) for qr_id, n in counts.items()],
+                ordered=False,
+            )
+
+    # ----- spill files -----
+
+    async def _spill_overflow(self) -> None:
+        try:
+            while self._overflow:
+                events, self._overflow = self._overflow, []
+                try:
+                    await asyncio.to_thread(self._spill, events, [])
+                except Exception as e:
+                    logger.error(f"Could not spill {len(events)} scan events: {e}")
+        finally:
+            self._spilling = None
+
+    def _spill(self, events: List[Dict[str, Any]], increments: List[str]) -> None:
+        lines = [json.dumps({"scan": event}, default=str) for event in events]
+        lines += [json.dumps({"inc": qr_id}) for qr_id in increments]
+        if not lines:
+            return
+        with self._spill_lock:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            if self._owner_lock is None:
+                # Taken before the file exists, so no other writer can claim it
+                self._owner_lock = self._lock(self.owner, blocking=True)
+            with open(self._spill_file(self.owner), "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        self.spilled += len(events)
+        self._last_spill = time.monotonic()
+
+    def _should_replay(self) -> bool:
+        # Shutdown only drains the queue; spill files keep until the next start
+        now = time.monotonic()
+        if self._stopping or now - max(self._last_spill, self._last_replay) < self.retry_interval:
+            return False
+        self._last_replay = now
+        return True
+
+    @staticmethod
+    def _new_owner() -> str:
+        return f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def _spill_file(self, owner: str) -> Path:
+        return self.spill_path.with_name(f"{self.spill_path.stem}.{owner}{self.spill_path.suffix}")
+
+    def _lock_file(self, owner: str) -> Path:
+        return self.spill_path.with_name(f"{self.spill_path.stem}.{owner}.lock")
+
+    @staticmethod
+    def _replay_file(spill_file: Path) -> Path:
+        return spill_file.with_name(spill_file.name + ".replaying")
+
+    def _lock(self, owner: str, blocking: bool = False) -> Optional[int]:
+        """An fd holding owner's lock file exclusively, or None if a live writer holds it"""
+        fd = os.open(self._lock_file(owner), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _release_owner_lock(self) -> None:
+        with self._spill_lock:
+            if self._owner_lock is None:
+                return
+            spill_file = self._spill_file(self.owner)
+            if not spill_file.exists() and not self._replay_file(spill_file).exists():
+                self._lock_file(self.owner).unlink(missing_ok=True)
+            # Anything left is replayed by whichever writer claims the lock next
+            os.close(self._owner_lock)
+            self._owner_lock = None
+
+    def _take_spill(self) -> Tuple[List[Dict[str, Any]], List[Tuple[str, Optional[int]]]]:
+        """Read this writer's spill file and those of exited writers.
+
+        Returns the records and the claims to release once they are stored:
+        (owner, lock fd) for every writer whose files were read, with no fd
+        for this writer's own.
+        """
+        records: List[Dict[str, Any]] = []
+        claims: List[Tuple[str, Optional[int]]] = []
+        own = self._spill_file(self.owner)
+        own_replay = self._replay_file(own)
+        with self._spill_lock:
+            # Move the file aside so new spills start a fresh one
+            if own.exists() and not own_replay.exists():
+                os.replace(own, own_replay)
+        if own_replay.exists():
+            records += self._read(own_replay)
+            claims.append((self.owner, None))
+
+        prefix, suffix = f"{self.spill_path.stem}.", ".lock"
+        for lock_file in self.spill_path.parent.glob(f"{prefix}*{suffix}"):
+            owner = lock_file.name[len(prefix):-len(suffix)]
+            if owner == self.owner:
+                continue
+            fd = self._lock(owner)
+            if fd is None:
+                # That writer is still running
+                continue
+            spill_file = self._spill_file(owner)
+            # A replay file left by a crash mid-replay goes first
+            for path in (self._replay_file(spill_file), spill_file):
+                if path.exists():
+                    records += self._read(path)
+            claims.append((owner, fd))
+        return records, claims
+
+    @staticmethod
+    def _read(path: Path) -> List[Dict[str, Any]]:
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line torn by a crash during a spill
+                    logger.warning("Skipping unreadable line in scan spill file")
+        return records
+
+    def _release(self, claims: List[Tuple[str, Optional[int]]]) -> None:
+        """Delete replayed files; their records are stored or back in this writer's own file"""
+        for owner, fd in claims:
+            spill_file = self._spill_file(owner)
+            self._replay_file(spill_file).unlink(missing_ok=True)
+            if fd is None:
+                # New spills may already be waiting in this writer's own file
+                continue
+            spill_file.unlink(missing_ok=True)
+            self._lock_file(owner).unlink(missing_ok=True)
+            os.close(fd)
+
+    async def _replay(self) -> None:
+        records, claims = await asyncio.to_thread(self._take_spill)
+        if not claims:
+            return
+        events = [record["scan"] for record in records if "scan" in record]
+        counts = Counter(record["inc"] for record in records if "inc" in record)
+
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            try:
+                await self._write(batch, replay=True)
+            except _IncrementsSpilled:
+                # Stored; their increments went back to the spill file
+                pass
+            except Exception as e:
+                logger.warning(f"Scan spill replay failed, retrying in {self.retry_interval}s: {e}")
+                await asyncio.to_thread(self._spill, events[start:], list(counts.elements()))
+                await asyncio.to_thread(self._release, claims)
+                return
+            self.replayed += len(batch)
+
+        try:
+            await self._increment(counts)
+        except Exception as e:
+            logger.warning(f"Scan count replay failed, retrying in {self.retry_interval}s: {e}")
+            await asyncio.to_thread(self._spill, [], list(counts.elements()))
+        await asyncio.to_thread(self._release, claims)
+        if events:
+            logger.info(f"Replayed {len(events)} spilled scan events")
+
+
+class _IncrementsSpilled(Exception):
+    """The events were stored but their scan_count increments were spilled"""
@@ -1,10 +1,11 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, WebSocket
-from fastapi.responses import StreamingResponse, RedirectResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, RedirectResponse, HTMLResponse, FileResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
 from typing import Optional, List, Dict, Any
+from collections import Counter
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 import os
@@ -12,18 +13,38 @@ import logging
 import uuid
 import bcrypt
 import jwt
-import qrcode
-from qrcode.image.styledpil import StyledPilImage
-from qrcode.image.styles.moduledrawers import RoundedModuleDrawer, CircleModuleDrawer, GappedSquareModuleDrawer
-from PIL import Image, ImageDraw, ImageFont
+from image_cache import ImageCache, make_cache_key
+from image_encoding import IMAGE_MEDIA_TYPES, image_format_supported
+from logos import InvalidLogo, logo_media_type, register_logo
+from logo_store import create_logo_store, is_logo_id, resolve_design_logo, store_design_logo
+from render_executor import RenderExecutor, RenderQueueFull, RenderTimeout, RenderWorkerCrashed
+from qr_render import (
+    FRAME_TEXT_STAGES, PRELOADED_LOGO_NAMES, PRELOADED_LOGO_DIR, RENDER_VERSION, RENDITION_SIZES, get_preloaded_logo, parse_design,
+    render_qr_image_timed, render_qr_renditions, warm_up_worker
+)
+from qr_raster import STAMP_STYLES
+from metrics import StageTimer, registry as metrics
+from qr_svg import create_qr_svg, iter_qr_svg
+from bulk import BulkInputError, BulkInputTooLarge, ZipStream, archive_name, iter_bulk_rows, map_unordered
+from render_jobs import RenderJobQueue, public_job
+from rendered_store import Prerenderer, RenderedImageStore
+from redirect_cache import RedirectCache
+from scan_writer import ScanWriter
+from user_agents import classify_user_agent
+from realtime import Broadcaster, subscription
+from event_bus import create_event_bus
 import io
+import csv
+import json
+import asyncio
+import zipfile
 import stripe
 import hmac
 import hashlib
+import time
 from urllib.parse import quote
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
-import base64
 from pathlib import Path
 
 ROOT_DIR = Path(__file__).parent
@@ -44,8 +65,151 @@ STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 stripe.api_key = STRIPE_API_KEY
 
+# ================= RENDERED IMAGE CACHE =================
+QR_IMAGE_CACHE_BYTES = int(os.environ.get('QR_IMAGE_CACHE_BYTES', 64 * 1024 * 1024))
+image_cache = ImageCache(QR_IMAGE_CACHE_BYTES)
+
+# ================= RENDERED IMAGE STORE =================
+# Canonical PNG of every QR code, rendered when the QR code is written
+rendered_images = RenderedImageStore(
+    os.environ.get('RENDERED_IMAGE_DIR') or ROOT_DIR / "data" / "rendered",
+    int(os.environ.get('RENDERED_IMAGE_STORE_BYTES', 1024 * 1024 * 1024)),
+    RENDER_VERSION,
+)
+
+# ================= REDIRECT TOKEN CACHE =================
+# Resolved /api/r/{token} targets; unknown tokens are remembered for less time
+redirect_cache = RedirectCache(
+    int(os.environ.get('REDIRECT_CACHE_SIZE', 100_000)),
+    ttl=float(os.environ.get('REDIRECT_CACHE_TTL', 60)),
+    negative_ttl=float(os.environ.get('REDIRECT_CACHE_NEGATIVE_TTL', 10)),
+)
+
+# ================= LOGO BLOB STORE =================
+logo_store = create_logo_store(db)
+
+# ================= RENDER EXECUTOR =================
+render_executor = RenderExecutor(
+    max_workers=int(os.environ['QR_RENDER_WORKERS']) if os.environ.get('QR_RENDER_WORKERS') else None,
+    max_pending=int(os.environ['QR_RENDER_QUEUE_SIZE']) if os.environ.get('QR_RENDER_QUEUE_SIZE') else None,
+    timeout=float(os.environ.get('QR_RENDER_TIMEOUT', 10)),
+    initializer=warm_up_worker,
+)
+
+# ================= METRICS =================
+# Per-stage timings of image requests in a Server-Timing response header
+SERVER_TIMING = os.environ.get('QR_SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+# Bearer token required to scrape /api/metrics; without one the endpoint is disabled
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+render_stage_seconds = metrics.histogram(
+    "qr_render_stage_seconds", "Time spent in each render pipeline stage",
+    ("stage", "pattern_style", "gradient", "logo", "frame", "watermark")
+)
+image_request_seconds = metrics.histogram(
+    "qr_image_request_stage_seconds", "Time spent in each stage of an image request", ("endpoint", "stage")
+)
+frame_text_renders = metrics.counter(
+    "qr_frame_text_renders_total", "Frame texts drawn onto a frame overlay, by outcome", ("outcome",)
+)
+metrics.gauge("qr_image_cache_bytes", "Bytes held by the in-memory rendered image cache",
+              lambda: image_cache.current_bytes)
+metrics.gauge("qr_image_cache_hits", "Rendered image cache hits since start", lambda: image_cache.hits)
+metrics.gauge("qr_image_cache_misses", "Rendered image cache misses since start", lambda: image_cache.misses)
+metrics.gauge("qr_image_cache_evictions", "Rendered images evicted from the cache to stay under its size since start",
+              lambda: image_cache.evictions)
+metrics.gauge("qr_render_pending", "Render jobs submitted and not yet finished", lambda: render_executor.pending)
+metrics.gauge("qr_redirect_cache_entries", "Redirect tokens held by the redirect cache", lambda: len(redirect_cache))
+metrics.gauge("qr_rendered_store_bytes", "Bytes in the rendered image store (0 until first write)",
+              lambda: rendered_images.current_bytes or 0)
+
+# ================= SCAN EVENT WRITER =================
+def announce_scans(events: List[Dict[str, Any]]) -> None:
+    """One qr_scan event (with its count of scans, as realtime coalesces them)
+    per QR code in a batch the scan writer has stored and counted, so
+    dashboards that refetch on it see the new scans"""
+    for (qr_id, user_id), n in Counter((e["qr_id"], e["user_id"]) for e in events).items():
+        realtime.publish({"type": "qr_scan", "qr_id": qr_id, "user_id": user_id, "count": n})
+
+# Scan events and scan_count increments are written in batches off the request path
+scan_writer = ScanWriter(
+    db,
+    os.environ.get('SCAN_SPILL_PATH') or ROOT_DIR / "data" / "scan_spill.jsonl",
+    max_queue=int(os.environ.get('SCAN_QUEUE_SIZE', 10_000)),
+    batch_size=int(os.environ.get('SCAN_BATCH_SIZE', 500)),
+    flush_interval=float(os.environ.get('SCAN_FLUSH_INTERVAL_MS', 250)) / 1000,
+    flush_seconds=metrics.histogram(
+        "qr_scan_flush_seconds", "Time to write one batch of scan events", ("outcome",)
+    ),
+    on_written=announce_scans,
+)
+metrics.gauge("qr_scan_queue_depth", "Scan events waiting to be written", lambda: len(scan_writer))
+metrics.gauge("qr_scan_events_spilled", "Scan events written to the spill file since start",
+              lambda: scan_writer.spilled)
+
+def render_labels(design: Optional[Dict[str, Any]], watermark: bool) -> Dict[str, str]:
+    """Bounded histogram labels describing which design features a render used"""
+    options = parse_design(design)
+    pattern_style = options["pattern_style"]
+    return {
+        "pattern_style": pattern_style if pattern_style in STAMP_STYLES or pattern_style == "square" else "other",
+        "gradient": str(bool(options["gradient_enabled"])).lower(),
+        "logo": str(bool(options["logo_data"])).lower(),
+        "frame": str(options["frame_style"] not in (None, "", "none")).lower(),
+        "watermark": str(bool(watermark)).lower(),
+    }
+
+def observe_render_stages(stages: Dict[str, float], design: Optional[Dict[str, Any]], watermark: bool) -> None:
+    labels = render_labels(design, watermark)
+    for stage, seconds in stages.items():
+        render_stage_seconds.observe(seconds, stage=stage, **labels)
+    # Frame texts are only drawn when their overlay is not cached yet
+    if "frame_text" in stages:
+        frame_text_renders.inc(outcome="ok")
+    if "frame_text_failed" in stages:
+        frame_text_renders.inc(outcome="failed")
+
+def finish_request_timing(response: Response, timer: StageTimer, endpoint: str) -> Response:
+    """Record an image request's stage timings, and expose them if SERVER_TIMING is on"""
+    timer.add("total", timer.elapsed())
+    for stage, seconds in timer.stages.items():
+        image_request_seconds.observe(seconds, endpoint=endpoint, stage=stage)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timer.server_timing()
+    return response
+
 # ================= REALTIME WS STORAGE =================
-active_connections: set[WebSocket] = set()
+# How events reach /ws clients of other workers: memory (single worker),
+# unix (workers on one host) or mongo (workers on several hosts)
+REALTIME_BUS = os.environ.get('REALTIME_BUS', 'memory')
+
+# Per-connection send queues; events only reach their owner's sockets
+realtime = Broadcaster(
+    max_queue=int(os.environ.get('WS_SEND_QUEUE_SIZE', 100)),
+    send_timeout=float(os.environ.get('WS_SEND_TIMEOUT', 5)),
+    bus=create_event_bus(
+        REALTIME_BUS,
+        db=db,
+        tick=int(os.environ.get('REALTIME_BUS_TICK_MS', 50)) / 1000,
+        directory=os.environ.get('REALTIME_BUS_DIR', '/tmp/qr-realtime-bus'),
+        collection=os.environ.get('REALTIME_BUS_COLLECTION', 'realtime_events'),
+        size=int(os.environ.get('REALTIME_BUS_SIZE_MB', 16)) * 1024 * 1024,
+    ),
+)
+# Seconds a /ws client without a session cookie has to send its auth message
+WS_AUTH_TIMEOUT = float(os.environ.get('WS_AUTH_TIMEOUT', 10))
+
+metrics.gauge("qr_ws_connections", "Open /ws connections", lambda: len(realtime))
+metrics.gauge("qr_ws_dropped_messages", "Realtime messages dropped for slow /ws clients since start",
+              lambda: realtime.stats()["dropped"])
+metrics.gauge("qr_realtime_bus_received_events", "Realtime events received from other workers since start",
+              lambda: realtime.bus.received)
+metrics.gauge("qr_realtime_bus_dropped_events", "Realtime events not sent to other workers since start",
+              lambda: realtime.bus.dropped)
+
+async def notify_user(user_id: str, message: dict) -> None:
+    """Queue an event for one user's /ws clients"""
+    realtime.publish({**message, "user_id": user_id})
 
 # Create the main app
 app = FastAPI()
@@ -62,44 +226,6 @@ allow_origins = os.environ.get('CORS_ORIGINS', '*').split(',')
 # Add to imports
 
 
-# Define available preloaded logos (match frontend)
-PRELOADED_LOGO_NAMES = [
-    "applemusic", "bitcoinsv", "carrd", "facebook", "gmail", 
-    "indeed", "instagram", "pinterest", "readthedocs", "reddit",
-    "spotify", "tiktok", "unitednations", "wechat", "whatsapp",
-    "wikiquote", "x", "youtube"
-]
-
-# Cache for logo data
-LOGO_DATA_CACHE = {}
-
-def get_preloaded_logo(logo_name):
-    """Get base64 encoded logo data"""
-    if logo_name not in PRELOADED_LOGO_NAMES:
-        return None
-    
-    if logo_name in LOGO_DATA_CACHE:
-        return LOGO_DATA_CACHE[logo_name]
-    
-    try:
-        # Assuming logos are in project_root/static/assets/logos/
-        logo_path = Path(__file__).parent / "static" / "assets" / "logos" / f"{logo_name}.png"
-        
-        if logo_path.exists():
-            with open(logo_path, "rb") as f:
-                logo_bytes = f.read()
-            
-            # Convert to base64 data URL
-            logo_b64 = base64.b64encode(logo_bytes).decode('utf-8')
-            logo_data_url = f"data:image/png;base64,{logo_b64}"
-            
-            LOGO_DATA_CACHE[logo_name] = logo_data_url
-            return logo_data_url
-    except Exception as e:
-        logger.error(f"Error loading logo {logo_name}: {e}")
-    
-    return None
-
 # In public_qr_image function:
 
 
@@ -156,6 +282,12 @@ class QRCode(BaseModel):
     updated_at: datetime
     signature: Optional[str] = None
 
+class RenderJobCreate(BaseModel):
+    qr_ids: List[str]
+    format: str = "png"
+    size: Optional[int] = None
+    scale: Optional[int] = None
+
 class ScanEvent(BaseModel):
     model_config = ConfigDict(extra="ignore")
     scan_id: str
@@ -220,6 +352,10 @@ async def get_current_user(request: Request) -> dict:
         if auth_header and auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
     
+    return await get_session_user(token)
+
+async def get_session_user(token: Optional[str]) -> dict:
+    """User owning a session token; raises 401 for missing, unknown or expired sessions"""
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -283,6 +419,12 @@ END:VCARD"""
     else:
         return content.get("url", "")
 
+def get_qr_payload(qr: dict) -> str:
+    """What a QR code encodes: its redirect URL if dynamic, else its content"""
+    if qr["is_dynamic"]:
+        return f"{os.getenv('API_BASE_URL')}/api/r/{qr['redirect_token']}"
+    return generate_qr_content(qr["qr_type"], qr["content"])
+
 async def get_user_from_cookie(request: Request) -> dict:
     token = request.cookies.get("session_token")
     if not token:
@@ -298,260 +440,165 @@ async def get_user_from_cookie(request: Request) -> dict:
 
     return user
 
-def create_gradient_image(size, color1, color2, gradient_type='linear', direction='horizontal'):
-    """Create a gradient image"""
-    img = Image.new('RGB', size)
-    draw = ImageDraw.Draw(img)
-    
-    if gradient_type == 'linear':
-        if direction == 'horizontal':
-            for x in range(size[0]):
-                ratio = x / size[0]
-                r = int(int(color1[1:3], 16) * (1 - ratio) + int(color2[1:3], 16) * ratio)
-                g = int(int(color1[3:5], 16) * (1 - ratio) + int(color2[3:5], 16) * ratio)
-                b = int(int(color1[5:7], 16) * (1 - ratio) + int(color2[5:7], 16) * ratio)
-                draw.line([(x, 0), (x, size[1])], fill=(r, g, b))
-        else:  # vertical
-            for y in range(size[1]):
-                ratio = y / size[1]
-                r = int(int(color1[1:3], 16) * (1 - ratio) + int(color2[1:3], 16) * ratio)
-                g = int(int(color1[3:5], 16) * (1 - ratio) + int(color2[3:5], 16) * ratio)
-                b = int(int(color1[5:7], 16) * (1 - ratio) + int(color2[5:7], 16) * ratio)
-                draw.line([(0, y), (size[0], y)], fill=(r, g, b))
-    elif gradient_type == 'radial':
-        center_x, center_y = size[0] // 2, size[1] // 2
-        max_distance = ((center_x ** 2 + center_y ** 2) ** 0.5)
-        for y in range(size[1]):
-            for x in range(size[0]):
-                distance = ((x - center_x) ** 2 + (y - center_y) ** 2) ** 0.5
-                ratio = min(distance / max_distance, 1.0)
-                r = int(int(color1[1:3], 16) * (1 - ratio) + int(color2[1:3], 16) * ratio)
-                g = int(int(color1[3:5], 16) * (1 - ratio) + int(color2[3:5], 16) * ratio)
-                b = int(int(color1[5:7], 16) * (1 - ratio) + int(color2[5:7], 16) * ratio)
-                draw.point((x, y), fill=(r, g, b))
-    
-    return img
-
-def apply_pattern_style(qr, pattern_style):
-    """Apply pattern style to QR code"""
-    module_drawer = None
-    
-    if pattern_style == 'rounded':
-        module_drawer = RoundedModuleDrawer()
-    elif pattern_style == 'circle' or pattern_style == 'dots':
-        module_drawer = CircleModuleDrawer()
-    elif pattern_style == 'gapped':
-        module_drawer = GappedSquareModuleDrawer()
-    # Default is square (no module_drawer)
-    
-    return module_drawer
-
-def add_frame_to_qr(img, frame_style, frame_color='#000000', frame_text=''):
-    """Add frame around QR code"""
-    if not frame_style or frame_style == 'none':
-        return img
-    
-    width, height = img.size
-    frame_width = int(width * 0.15)  # 15% frame
-    
-    # Create new image with frame
-    new_size = (width + frame_width * 2, height + frame_width * 2)
-    framed_img = Image.new('RGB', new_size, 'white')
-    
-    # Paste QR in center
-    framed_img.paste(img, (frame_width, frame_width))
-    
-    # Draw frame based on style
-    draw = ImageDraw.Draw(framed_img)
-    
-    if frame_style == 'square':
-        draw.rectangle([0, 0, new_size[0]-1, new_size[1]-1], outline=frame_color, width=frame_width//2)
-    elif frame_style == 'rounded':
-        # Draw rounded rectangle frame
-        radius = frame_width
-        draw.rounded_rectangle([0, 0, new_size[0]-1, new_size[1]-1], radius=radius, outline=frame_color, width=frame_width//2)
-    elif frame_style == 'circle':
-        # Draw circular frame
-        draw.ellipse([0, 0, new_size[0]-1, new_size[1]-1], outline=frame_color, width=frame_width//2)
-    
-    # Add frame text if provided
-    if frame_text:
-        try:
-            font_size = frame_width // 2
-            try:
-                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-            
-            # Get text bounding box
-            bbox = draw.textbbox((0, 0), frame_text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            # Draw text at bottom center
-            text_x = (new_size[0] - text_width) // 2
-            text_y = new_size[1] - frame_width + (frame_width - text_height) // 2
-            
-            draw.text((text_x, text_y), frame_text, fill=frame_color, font=font)
-        except:
-            pass
-    
-    return framed_img
-
-def add_logo_to_qr(img, logo_data, logo_size_percent=20):
-    """Add logo to center of QR code"""
+# Bounds for the size (px) and scale (px per module) image query params
+MIN_IMAGE_SIZE = 64
+MAX_IMAGE_SIZE = 4096
+MAX_IMAGE_SCALE = 50
+
+def get_render_size(size: Optional[int], scale: Optional[int]) -> Dict[str, int]:
+    """Validate size/scale query params into render_qr_image keyword args"""
+    if size is not None and scale is not None:
+        raise HTTPException(status_code=400, detail="Use either size or scale, not both")
+    if size is not None:
+        if not MIN_IMAGE_SIZE <= size <= MAX_IMAGE_SIZE:
+            raise HTTPException(status_code=400, detail=f"size must be between {MIN_IMAGE_SIZE} and {MAX_IMAGE_SIZE}")
+        return {"size": size}
+    if scale is not None:
+        if not 1 <= scale <= MAX_IMAGE_SCALE:
+            raise HTTPException(status_code=400, detail=f"scale must be between 1 and {MAX_IMAGE_SCALE}")
+        return {"box_size": scale}
+    return {}
+
+def get_image_format(format: str) -> str:
+    """Validate a raster format query param (svg is handled separately)"""
+    if not image_format_supported(format):
+        raise HTTPException(status_code=400, detail=f"Unsupported image format: {format}")
+    return format
+
+async def submit_render(fn, *args):
+    """Run a render job on the executor, mapping overload to HTTP errors"""
     try:
-        # Open logo image
-        logo = Image.open(io.BytesIO(logo_data))
-        
-        # Calculate logo size (percentage of QR size)
-        qr_width, qr_height = img.size
-        logo_max_size = int(min(qr_width, qr_height) * (logo_size_percent / 100))
-        
-        # Resize logo maintaining aspect ratio
-        logo.thumbnail((logo_max_size, logo_max_size), Image.Resampling.LANCZOS)
-        
-        # Create white background for logo
-        logo_bg_size = int(logo.size[0] * 1.2), int(logo.size[1] * 1.2)
-        logo_bg = Image.new('RGB', logo_bg_size, 'white')
-        
-        # Paste logo on white background
-        logo_pos = ((logo_bg_size[0] - logo.size[0]) // 2, (logo_bg_size[1] - logo.size[1]) // 2)
-        if logo.mode == 'RGBA':
-            logo_bg.paste(logo, logo_pos, logo)
-        else:
-            logo_bg.paste(logo, logo_pos)
-        
-        # Paste logo background on QR code
-        logo_bg_pos = ((qr_width - logo_bg_size[0]) // 2, (qr_height - logo_bg_size[1]) // 2)
-        img.paste(logo_bg, logo_bg_pos)
-        
-        return img
-    except Exception as e:
-        logger.error(f"Error adding logo: {e}")
-        return img
-
-def create_qr_image(data: str, design: Optional[Dict[str, Any]] = None) -> bytes:
-    """Generate QR code image with advanced customization"""
-    
-    # Default design values
-    fg_color = "#000000"
-    bg_color = "#FFFFFF"
-    error_correction_level = "H"
-    pattern_style = "square"
-    gradient_enabled = False
-    gradient_color1 = None
-    gradient_color2 = None
-    gradient_type = "linear"
-    gradient_direction = "horizontal"
-    frame_style = "none"
-    frame_color = "#000000"
-    frame_text = ""
-    logo_data = None
-    
-    # Parse design options
-    if design:
-        fg_color = design.get("foreground_color", fg_color)
-        bg_color = design.get("background_color", bg_color)
-        error_correction_level = design.get("error_correction", "H")
-        pattern_style = design.get("pattern_style", "square")
-        gradient_enabled = design.get("gradient_enabled", False)
-        gradient_color1 = design.get("gradient_color1")
-        gradient_color2 = design.get("gradient_color2")
-        gradient_type = design.get("gradient_type", "linear")
-        gradient_direction = design.get("gradient_direction", "horizontal")
-        frame_style = design.get("frame_style", "none")
-        frame_color = design.get("frame_color", "#000000")
-        frame_text = design.get("frame_text", "")
-        logo_data = design.get("logo_data")  # base64 encoded or bytes
-    
-    # Map error correction level
-    error_correction_map = {
-        "L": qrcode.constants.ERROR_CORRECT_L,
-        "M": qrcode.constants.ERROR_CORRECT_M,
-        "Q": qrcode.constants.ERROR_CORRECT_Q,
-        "H": qrcode.constants.ERROR_CORRECT_H
-    }
-    error_correction = error_correction_map.get(error_correction_level, qrcode.constants.ERROR_CORRECT_H)
-    
-    # Create QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=error_correction,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    # Apply pattern style
-    module_drawer = apply_pattern_style(qr, pattern_style)
-    
-    # Generate image with pattern
-    if module_drawer:
-        img = qr.make_image(
-            image_factory=StyledPilImage,
-            module_drawer=module_drawer,
-            fill_color=fg_color,
-            back_color=bg_color
+        return await render_executor.submit(fn, *args)
+    except RenderQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Image renderer is busy, please retry",
+            headers={"Retry-After": "1"}
         )
-    else:
-        img = qr.make_image(fill_color=fg_color, back_color=bg_color)
-    
-    # Convert to PIL Image
-    if not isinstance(img, Image.Image):
-        pil_img = img.convert('RGB')
-    else:
-        pil_img = img
-    
-    # Apply gradient if enabled
-    if gradient_enabled and gradient_color1 and gradient_color2:
-        # Create gradient mask
-        gradient_mask = create_gradient_image(
-            pil_img.size, 
-            gradient_color1, 
-            gradient_color2, 
-            gradient_type, 
-            gradient_direction
+    except RenderWorkerCrashed:
+        raise HTTPException(
+            status_code=503,
+            detail="Image renderer restarted, please retry",
+            headers={"Retry-After": "1"}
         )
-        
-        # Apply gradient only to foreground (black parts)
-        qr_pixels = pil_img.load()
-        grad_pixels = gradient_mask.load()
-        result_img = Image.new('RGB', pil_img.size, bg_color)
-        result_pixels = result_img.load()
-        
-        for y in range(pil_img.size[1]):
-            for x in range(pil_img.size[0]):
-                if qr_pixels[x, y] != (255, 255, 255):  # If not white (background)
-                    result_pixels[x, y] = grad_pixels[x, y]
-                else:
-                    result_pixels[x, y] = qr_pixels[x, y]
-        
-        pil_img = result_img
-    
-    # Add logo if provided
-    if logo_data:
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail="Image rendering timed out")
+    except ValueError as e:
+        # Requested size cannot hold this QR code at one pixel per module
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def submit_render_when_ready(fn, *args):
+    """Run a batch render job, waiting out a full queue instead of failing"""
+    while True:
+        try:
+            return await render_executor.submit(fn, *args)
+        except RenderQueueFull:
+            # Leave room for interactive renders
+            await asyncio.sleep(0.05)
+
+async def get_rendered_qr_image(qr: dict, qr_content: str, design: Optional[Dict[str, Any]], watermark: bool,
+                                render_size: Optional[Dict[str, int]] = None, image_format: str = "png",
+                                timer: Optional[StageTimer] = None) -> bytes:
+    """Return final image bytes for a QR code, rendering only on a cache miss"""
+    render_size = render_size or {}
+    timer = timer or StageTimer()
+    cache_key = make_cache_key(qr_content, design, watermark, image_format=image_format, **render_size)
+    img_bytes = image_cache.get(cache_key)
+    if img_bytes is not None:
+        return img_bytes
+
+    # Designs reference logos by logo_id; load the bytes only when rendering
+    with timer.stage("logo_load"):
+        render_design = await resolve_design_logo(design, logo_store)
+    started = time.perf_counter()
+    img_bytes, stages = await submit_render(
+        render_qr_image_timed, qr_content, render_design, watermark,
+        render_size.get("box_size", 10), 4, render_size.get("size"), image_format
+    )
+    render_seconds = time.perf_counter() - started
+
+    observe_render_stages(stages, render_design, watermark)
+    for stage, seconds in stages.items():
+        timer.add(stage, seconds)
+    # Whatever the worker did not spend rendering went to queueing and IPC
+    # (frame text stages are part of the frame stage's time)
+    worker_seconds = sum(seconds for stage, seconds in stages.items() if stage not in FRAME_TEXT_STAGES)
+    timer.add("render_queue", max(render_seconds - worker_seconds, 0.0))
+
+    image_cache.put(cache_key, img_bytes, tags=(qr["qr_id"], qr["user_id"]))
+    return img_bytes
+
+async def qr_image_response(qr: dict, qr_content: str, design: Optional[Dict[str, Any]], watermark: bool,
+                            render_size: Optional[Dict[str, int]] = None, image_format: str = "png",
+                            canonical: bool = True, headers: Optional[Dict[str, str]] = None,
+                            timer: Optional[StageTimer] = None) -> Response:
+    """Serve the stored canonical image as a file if there is one, else render.
+
+    `canonical` means the design is the QR code's stored one; the default PNG
+    of such a request is what render-on-write keeps in rendered_images.
+    """
+    canonical = canonical and image_format == "png" and not render_size
+    if canonical:
+        path = rendered_images.get(qr["qr_id"], qr["updated_at"], watermark)
+        if path is not None:
+            return FileResponse(path, media_type="image/png", headers=headers)
+
+    img_bytes = await get_rendered_qr_image(qr, qr_content, design, watermark, render_size, image_format, timer)
+    if canonical:
+        # Not rendered on write yet (older QR code, or the prerender is still queued)
         try:
-            # If logo_data is base64 string, decode it
-            if isinstance(logo_data, str) and logo_data.startswith('data:image'):
-                # Extract base64 part
-                logo_data = logo_data.split(',')[1]
-                import base64
-                logo_data = base64.b64decode(logo_data)
-            pil_img = add_logo_to_qr(pil_img, logo_data)
+            await rendered_images.put(qr["qr_id"], qr["updated_at"], watermark, img_bytes)
+        except OSError as e:
+            logger.warning(f"Could not store rendered image for {qr['qr_id']}: {e}")
+    return Response(content=img_bytes, media_type=IMAGE_MEDIA_TYPES[image_format], headers=headers)
+
+async def prerender_qr_image(qr_id: str) -> None:
+    """Render-on-write: store the canonical image of a QR code's current version"""
+    qr = await db.qr_codes.find_one({"qr_id": qr_id}, {"_id": 0})
+    if not qr:
+        return
+    user_doc = await db.users.find_one({"user_id": qr["user_id"]}, {"_id": 0, "plan": 1})
+    watermark = bool(user_doc and user_doc.get("plan") == "free")
+    if rendered_images.get(qr_id, qr["updated_at"], watermark) is not None:
+        return
+    design = await resolve_design_logo(qr.get("design"), logo_store)
+    img_bytes, stages = await submit_render_when_ready(render_qr_image_timed, get_qr_payload(qr), design, watermark)
+    observe_render_stages(stages, design, watermark)
+    await rendered_images.put(qr_id, qr["updated_at"], watermark, img_bytes)
+
+prerenderer = Prerenderer(prerender_qr_image, concurrency=int(os.environ.get('QR_PRERENDER_CONCURRENCY', 2)))
+
+async def prerender_user_qr_images(user_id: str) -> None:
+    """Render-on-write for all of a user's QR codes (their plan changed), one at a time"""
+    async for qr in db.qr_codes.find({"user_id": user_id}, {"_id": 0, "qr_id": 1}):
+        try:
+            await prerender_qr_image(qr["qr_id"])
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Error processing logo: {e}")
-    
-    # Add frame
-    if frame_style and frame_style != 'none':
-        pil_img = add_frame_to_qr(pil_img, frame_style, frame_color, frame_text)
-    
-    # Convert to bytes
-    img_byte_arr = io.BytesIO()
-    pil_img.save(img_byte_arr, format='PNG', quality=95)
-    img_byte_arr.seek(0)
-    return img_byte_arr.getvalue()
+            logger.warning(f"Prerender failed for {qr['qr_id']}: {e}")
+
+# One background job per user, so a plan change never fans out into a task
+# per QR code; it shares the render executor with the per-QR prerenderer
+user_prerenderer = Prerenderer(prerender_user_qr_images, concurrency=1)
+
+def get_logo_href(design: Optional[Dict[str, Any]]) -> Optional[str]:
+    """URL an SVG can reference a design's logo by, if it has one"""
+    if not design:
+        return None
+    logo_name = design.get("template_logo")
+    if design.get("logo_type") == "preloaded" and logo_name in PRELOADED_LOGO_NAMES:
+        return f"{os.getenv('API_BASE_URL', '')}/api/logos/preloaded/{logo_name}"
+    if design.get("logo_type") != "none" and not design.get("logo_data") and is_logo_id(design.get("logo_id")):
+        return f"{os.getenv('API_BASE_URL', '')}/api/logos/{design['logo_id']}"
+    return None
+
+async def store_qr_design(design: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Design as persisted: inline logos moved to the logo store"""
+    try:
+        return await store_design_logo(design, logo_store)
+    except InvalidLogo:
+        raise HTTPException(status_code=400, detail="Invalid logo image")
 
 # ========== AUTH ROUTES ==========
 
@@ -756,6 +803,29 @@ async def get_design_templates():
     """Get all available design templates"""
     return {"templates": DESIGN_TEMPLATES}
 
+@api_router.get("/logos/preloaded/{logo_name}")
+async def get_preloaded_logo_file(logo_name: str):
+    """Serve a bundled logo so SVG output can reference it by URL"""
+    if logo_name not in PRELOADED_LOGO_NAMES:
+        raise HTTPException(status_code=404, detail="Logo not found")
+    return FileResponse(
+        PRELOADED_LOGO_DIR / f"{logo_name}.png",
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
+
+@api_router.get("/logos/{logo_id}")
+async def get_logo_file(logo_id: str):
+    """Serve an uploaded logo from the blob store; content-addressed, so immutable"""
+    logo_bytes = await logo_store.get(logo_id)
+    if logo_bytes is None:
+        raise HTTPException(status_code=404, detail="Logo not found")
+    return Response(
+        content=logo_bytes,
+        media_type=logo_media_type(logo_bytes),
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
 @api_router.post("/upload-logo")
 async def upload_logo(request: Request, user: dict = Depends(get_current_user)):
     """Upload logo for QR code"""
@@ -769,19 +839,17 @@ async def upload_logo(request: Request, user: dict = Depends(get_current_user)):
         # Read file content
         logo_content = await logo_file.read()
         
-        # Validate image
+        # Validate through the logo pipeline; render workers decode and cache it
+        # themselves, keyed by the logo_id
         try:
-            img = Image.open(io.BytesIO(logo_content))
-            img.verify()
-        except:
+            register_logo(logo_content)
+        except InvalidLogo:
             raise HTTPException(status_code=400, detail="Invalid image file")
         
-        # Convert to base64
-        import base64
-        logo_base64 = base64.b64encode(logo_content).decode('utf-8')
-        logo_data_url = f"data:image/png;base64,{logo_base64}"
+        # Stored once by content hash; designs reference it by logo_id
+        logo_id = await logo_store.put(logo_content)
         
-        return {"logo_data": logo_data_url}
+        return {"logo_id": logo_id, "logo_url": f"/api/logos/{logo_id}"}
     except HTTPException:
         raise
     except Exception as e:
@@ -793,46 +861,160 @@ async def upload_logo(request: Request, user: dict = Depends(get_current_user)):
 
 # ========== QR CODE ROUTES ==========
 
-@api_router.post("/qr-codes", response_model=QRCode)
-async def create_qr_code(qr_data: QRCodeCreate, user: dict = Depends(get_current_user)):
-    plan = user.get("plan", "free")
-    qr_count = user.get("qr_code_count", 0)
-
-    if plan == "free" and qr_count >= 5:
+FREE_PLAN_QR_LIMIT = 5
+
+# Bulk generation limits
+BULK_MAX_ROWS = int(os.environ.get('QR_BULK_MAX_ROWS', 100000))
+BULK_MAX_BYTES = int(os.environ.get('QR_BULK_MAX_BYTES', 64 * 1024 * 1024))
+BULK_INSERT_BATCH = 1000
+BULK_RENDER_CONCURRENCY = int(os.environ.get('QR_BULK_RENDER_CONCURRENCY', 0)) or max(render_executor.max_workers, 1) * 2
+
+async def reserve_qr_quota(user: dict, count: int) -> None:
+    """Atomically count `count` new QR codes against the user's plan, or raise 403"""
+    query = {"user_id": user["user_id"]}
+    if user.get("plan", "free") == "free":
+        # Check and increment in one update so concurrent creates cannot overshoot
+        query["qr_code_count"] = {"$lte": FREE_PLAN_QR_LIMIT - count}
+    result = await db.users.update_one(query, {"$inc": {"qr_code_count": count}})
+    if result.matched_count == 0:
         raise HTTPException(status_code=403, detail="Free plan limit reached")
 
-    qr_id = f"qr_{uuid.uuid4().hex[:12]}"
-
-    # ✅ BACKEND IS SOURCE OF TRUTH
-    is_dynamic = plan != "free"
-    redirect_token = f"r_{uuid.uuid4().hex[:8]}" if is_dynamic else None
+async def release_qr_quota(user: dict, count: int) -> None:
+    await db.users.update_one({"user_id": user["user_id"]}, {"$inc": {"qr_code_count": -count}})
 
-    qr_doc = {
-        "qr_id": qr_id,
+def new_qr_doc(user: dict, qr_data: dict, design: Optional[Dict[str, Any]]) -> dict:
+    is_dynamic = user.get("plan", "free") != "free"
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "qr_id": f"qr_{uuid.uuid4().hex[:12]}",
         "user_id": user["user_id"],
-        "name": qr_data.name,
-        "qr_type": qr_data.qr_type,
-        "content": qr_data.content,
+        "name": qr_data["name"],
+        "qr_type": qr_data["qr_type"],
+        "content": qr_data["content"],
         "is_dynamic": is_dynamic,
-        "redirect_token": redirect_token,
-        "design": qr_data.design,
+        "redirect_token": f"r_{uuid.uuid4().hex[:8]}" if is_dynamic else None,
+        "design": design,
         "scan_count": 0,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "created_at": now,
+        "updated_at": now
     }
 
-    await db.qr_codes.insert_one(qr_doc)
+@api_router.post("/qr-codes", response_model=QRCode)
+async def create_qr_code(qr_data: QRCodeCreate, user: dict = Depends(get_current_user)):
+    # ✅ BACKEND IS SOURCE OF TRUTH (dynamic for paid plans, see new_qr_doc)
+    qr_doc = new_qr_doc(user, qr_data.model_dump(), await store_qr_design(qr_data.design))
 
-    await db.users.update_one(
-        {"user_id": user["user_id"]},
-        {"$inc": {"qr_code_count": 1}}
-    )
+    await reserve_qr_quota(user, 1)
+    try:
+        await db.qr_codes.insert_one(qr_doc)
+    except Exception:
+        await release_qr_quota(user, 1)
+        raise
+    prerenderer.schedule(qr_doc["qr_id"])
 
     qr_doc["created_at"] = datetime.fromisoformat(qr_doc["created_at"])
     qr_doc["updated_at"] = datetime.fromisoformat(qr_doc["updated_at"])
 
     return QRCode(**qr_doc)
 
+@api_router.post("/qr-codes/bulk")
+async def bulk_create_qr_codes(request: Request, format: str = "png", user: dict = Depends(get_current_user)):
+    """Create QR codes from CSV/NDJSON rows and stream back a ZIP of their images.
+
+    CSV needs a name,qr_type,content[,design] header with JSON objects in the
+    content/design cells; NDJSON takes one such object per line. Entries are
+    written as soon as each image renders, followed by a manifest.csv mapping
+    files to qr_ids (and listing any rows that failed to render).
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        input_format = "csv"
+    elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        input_format = "ndjson"
+    else:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+    image_format = format if format == "svg" else get_image_format(format)
+    too_large = HTTPException(status_code=413, detail=f"Bulk input must be at most {BULK_MAX_BYTES} bytes")
+    if int(request.headers.get("content-length") or 0) > BULK_MAX_BYTES:
+        raise too_large
+
+    # Rows usually share a handful of designs: store each distinct one (and its logo) once
+    stored_designs = {}
+    docs = []
+    # Rows are parsed as the upload streams in. Their QR documents are kept
+    # until the insert (bounded by QR_BULK_MAX_ROWS): the request creates all
+    # of them or none, against one quota reservation.
+    try:
+        async for row in iter_bulk_rows(request.stream(), input_format, BULK_MAX_ROWS, BULK_MAX_BYTES):
+            design_key = json.dumps(row["design"], sort_keys=True, default=str)
+            if design_key not in stored_designs:
+                stored_designs[design_key] = await store_qr_design(row["design"])
+            docs.append(new_qr_doc(user, row, stored_designs[design_key]))
+    except BulkInputTooLarge:
+        raise too_large
+    except BulkInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await reserve_qr_quota(user, len(docs))
+    try:
+        for start in range(0, len(docs), BULK_INSERT_BATCH):
+            await db.qr_codes.insert_many(docs[start:start + BULK_INSERT_BATCH])
+    except Exception:
+        await db.qr_codes.delete_many({"qr_id": {"$in": [doc["qr_id"] for doc in docs]}})
+        await release_qr_quota(user, len(docs))
+        raise
+
+    watermark = user.get("plan", "free") == "free"
+    resolved_designs = {}
+
+    async def render_row(index: int) -> bytes:
+        qr = docs[index]
+        payload = get_qr_payload(qr)
+        if image_format == "svg":
+            # SVG building is pure Python and takes milliseconds per code, so it
+            # runs on the render workers too rather than on the event loop
+            return await submit_render_when_ready(
+                create_qr_svg, payload, qr["design"], watermark, get_logo_href(qr["design"])
+            )
+        # Docs sharing a design share the dict, so resolve each logo once
+        design_ref = id(qr["design"])
+        if design_ref not in resolved_designs:
+            resolved_designs[design_ref] = await resolve_design_logo(qr["design"], logo_store)
+        img_bytes, stages = await submit_render_when_ready(
+            render_qr_image_timed, payload, resolved_designs[design_ref], watermark, 10, 4, None, image_format
+        )
+        observe_render_stages(stages, resolved_designs[design_ref], watermark)
+        return img_bytes
+
+    async def archive():
+        sink = ZipStream()
+        manifest = io.StringIO()
+        manifest_writer = csv.writer(manifest)
+        manifest_writer.writerow(["row", "qr_id", "name", "file", "error"])
+        # Images are already compressed, so store them as-is
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+            async for index, img_bytes, error in map_unordered(render_row, len(docs), BULK_RENDER_CONCURRENCY):
+                qr = docs[index]
+                if error is not None:
+                    logger.error(f"Bulk render failed for {qr['qr_id']}: {error}")
+                    manifest_writer.writerow([index + 1, qr["qr_id"], qr["name"], "", str(error) or type(error).__name__])
+                    continue
+                filename = archive_name(index, qr["name"], image_format)
+                zf.writestr(filename, img_bytes)
+                manifest_writer.writerow([index + 1, qr["qr_id"], qr["name"], filename, ""])
+                yield sink.drain()
+            zf.writestr("manifest.csv", manifest.getvalue())
+        yield sink.drain()
+
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": 'attachment; filename="qr_codes.zip"',
+            "X-QR-Created": str(len(docs))
+        }
+    )
+
 @api_router.get("/qr-codes", response_model=List[QRCode])
 async def get_qr_codes(user: dict = Depends(get_current_user)):
     qr_codes = await db.qr_codes.find({"user_id": user["user_id"]}, {"_id": 0}).to_list(1000)
@@ -921,11 +1103,14 @@ async def update_qr_code(qr_id: str, update_data: QRCodeUpdate, user: dict = Dep
     if update_data.content:
         update_fields["content"] = update_data.content
     if update_data.design:
-        update_fields["design"] = update_data.design
+        update_fields["design"] = await store_qr_design(update_data.design)
     
     update_fields["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     await db.qr_codes.update_one({"qr_id": qr_id}, {"$set": update_fields})
+    image_cache.invalidate(qr_id)
+    redirect_cache.invalidate(qr_id)
+    prerenderer.schedule(qr_id)
     
     updated_qr = await db.qr_codes.find_one({"qr_id": qr_id}, {"_id": 0})
     
@@ -941,6 +1126,9 @@ async def delete_qr_code(qr_id: str, user: dict = Depends(get_current_user)):
     result = await db.qr_codes.delete_one({"qr_id": qr_id, "user_id": user["user_id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="QR code not found")
+    image_cache.invalidate(qr_id)
+    redirect_cache.invalidate(qr_id)
+    await rendered_images.discard(qr_id)
     
     # Decrement count
     await db.users.update_one(
@@ -951,8 +1139,17 @@ async def delete_qr_code(qr_id: str, user: dict = Depends(get_current_user)):
     return {"message": "QR code deleted"}
 
 @api_router.get("/qr-codes/{qr_id}/image")
-async def get_qr_image(qr_id: str, format: str = "png", user: dict = Depends(get_current_user)):
-    qr = await db.qr_codes.find_one({"qr_id": qr_id, "user_id": user["user_id"]}, {"_id": 0})
+async def get_qr_image(
+    qr_id: str,
+    format: str = "png",
+    size: Optional[int] = None,
+    scale: Optional[int] = None,
+    user: dict = Depends(get_current_user)
+):
+    timer = StageTimer()
+    render_size = get_render_size(size, scale)
+    with timer.stage("db"):
+        qr = await db.qr_codes.find_one({"qr_id": qr_id, "user_id": user["user_id"]}, {"_id": 0})
     if not qr:
         raise HTTPException(status_code=404, detail="QR code not found")
     
@@ -964,26 +1161,148 @@ async def get_qr_image(qr_id: str, format: str = "png", user: dict = Depends(get
     else:
         qr_content = generate_qr_content(qr["qr_type"], qr["content"])
     
+    # Check if free plan - add watermark
+    with timer.stage("db"):
+        user_doc = await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0})
+    watermark = user_doc.get("plan") == "free"
+    
+    if format == "svg":
+        # Vector output is streamed straight from the module matrix
+        design = qr.get("design")
+        response = StreamingResponse(
+            iter_qr_svg(qr_content, design, watermark, get_logo_href(design)),
+            media_type="image/svg+xml"
+        )
+        return finish_request_timing(response, timer, "qr_image")
+    
     # Generate image with advanced customization
-    img_bytes = create_qr_image(qr_content, qr.get("design"))
+    image_format = get_image_format(format)
+    response = await qr_image_response(
+        qr, qr_content, qr.get("design"), watermark, render_size, image_format, timer=timer
+    )
+    return finish_request_timing(response, timer, "qr_image")
+
+@api_router.get("/qr-codes/{qr_id}/renditions")
+async def get_qr_renditions(qr_id: str, sizes: Optional[str] = None, user: dict = Depends(get_current_user)):
+    """ZIP of PNG renditions (default 128-2048 px) rendered from a single encode"""
+    if sizes:
+        try:
+            size_list = sorted({int(s) for s in sizes.split(",") if s.strip()})
+        except ValueError:
+            raise HTTPException(status_code=400, detail="sizes must be a comma-separated list of integers")
+        if not size_list or len(size_list) > len(RENDITION_SIZES):
+            raise HTTPException(status_code=400, detail=f"Request between 1 and {len(RENDITION_SIZES)} sizes")
+        for s in size_list:
+            get_render_size(s, None)
+    else:
+        size_list = list(RENDITION_SIZES)
+
+    qr = await db.qr_codes.find_one({"qr_id": qr_id, "user_id": user["user_id"]}, {"_id": 0})
+    if not qr:
+        raise HTTPException(status_code=404, detail="QR code not found")
+    
+    qr_content = get_qr_payload(qr)
     
-    # Check if free plan - add watermark
     user_doc = await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0})
-    if user_doc.get("plan") == "free":
-        # Add simple watermark text
-        img = Image.open(io.BytesIO(img_bytes))
-        draw = ImageDraw.Draw(img)
-        text = "QRPlanet"
-        # Add text at bottom
-        width, height = img.size
-        draw.text((width//2 - 30, height - 20), text, fill="gray")
-        
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        img_bytes = img_byte_arr.getvalue()
+    watermark = user_doc.get("plan") == "free"
     
-    return StreamingResponse(io.BytesIO(img_bytes), media_type="image/png")
+    # One job: the matrix encode and logo decode are shared by every size
+    design = await resolve_design_logo(qr.get("design"), logo_store)
+    renditions = await submit_render(render_qr_renditions, qr_content, design, size_list, watermark)
+    
+    archive = io.BytesIO()
+    # PNGs are already deflated, so store them as-is
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+        for s, img_bytes in renditions.items():
+            zf.writestr(f"{qr_id}_{s}.png", img_bytes)
+    archive.seek(0)
+    
+    return StreamingResponse(
+        archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{qr_id}_renditions.zip"'}
+    )
+
+# ========== RENDER JOB ROUTES ==========
+
+RENDER_JOB_MAX_QR_CODES = int(os.environ.get('RENDER_JOB_MAX_QR_CODES', 10000))
+
+async def render_job_item(job: dict, index: int, qr_id: str) -> tuple:
+    """Render one QR code of a background job: (archive file name, bytes)"""
+    qr = await db.qr_codes.find_one({"qr_id": qr_id, "user_id": job["user_id"]}, {"_id": 0})
+    if not qr:
+        raise LookupError("QR code not found")
+    options = job["options"]
+    image_format = options["format"]
+    payload = get_qr_payload(qr)
+    if image_format == "svg":
+        # Pure Python and milliseconds per code: keep it off the event loop
+        data = await submit_render_when_ready(
+            create_qr_svg, payload, qr.get("design"), options["watermark"], get_logo_href(qr.get("design"))
+        )
+    else:
+        design = await resolve_design_logo(qr.get("design"), logo_store)
+        data, stages = await submit_render_when_ready(
+            render_qr_image_timed, payload, design, options["watermark"],
+            options.get("box_size", 10), 4, options.get("size"), image_format
+        )
+        observe_render_stages(stages, design, options["watermark"])
+    return archive_name(index, qr["name"], image_format), data
+
+render_jobs = RenderJobQueue(
+    db,
+    render_job_item,
+    os.environ.get('RENDER_JOB_DIR') or ROOT_DIR / "data" / "render_jobs",
+    workers=int(os.environ.get('RENDER_JOB_WORKERS', 2)),
+    per_user_limit=int(os.environ.get('RENDER_JOB_USER_CONCURRENCY', 1)),
+    item_concurrency=BULK_RENDER_CONCURRENCY,
+    result_ttl=float(os.environ.get('RENDER_JOB_RESULT_TTL', 24 * 3600)),
+    notify=notify_user,
+)
+
+@api_router.post("/render-jobs", status_code=202)
+async def create_render_job(job_data: RenderJobCreate, user: dict = Depends(get_current_user)):
+    """Queue a render of one or more QR codes; progress is pushed over /ws"""
+    qr_ids = list(dict.fromkeys(job_data.qr_ids))
+    if not 1 <= len(qr_ids) <= RENDER_JOB_MAX_QR_CODES:
+        raise HTTPException(status_code=400, detail=f"Request between 1 and {RENDER_JOB_MAX_QR_CODES} QR codes")
+    image_format = job_data.format if job_data.format == "svg" else get_image_format(job_data.format)
+    render_size = get_render_size(job_data.size, job_data.scale)
+
+    owned = await db.qr_codes.count_documents({"qr_id": {"$in": qr_ids}, "user_id": user["user_id"]})
+    if owned != len(qr_ids):
+        raise HTTPException(status_code=404, detail="QR code not found")
+
+    user_doc = await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0})
+    options = {"format": image_format, "watermark": user_doc.get("plan") == "free", **render_size}
+    job = await render_jobs.enqueue(user["user_id"], qr_ids, options)
+    return public_job(job)
+
+@api_router.get("/render-jobs/{job_id}")
+async def get_render_job(job_id: str, user: dict = Depends(get_current_user)):
+    job = await render_jobs.get(job_id, user["user_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Render job not found")
+    return public_job(job)
+
+@api_router.get("/render-jobs/{job_id}/download")
+async def download_render_job(job_id: str, user: dict = Depends(get_current_user)):
+    job = await render_jobs.get(job_id, user["user_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Render job not found")
+    path = render_jobs.result_path(job)
+    if path is None:
+        raise HTTPException(status_code=409, detail=f"Render job is {job['status']}")
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Render job result has expired")
+
+    if path.suffix == ".zip":
+        media_type = "application/zip"
+    elif path.suffix == ".svg":
+        media_type = "image/svg+xml"
+    else:
+        media_type = IMAGE_MEDIA_TYPES[path.suffix[1:]]
+    return FileResponse(path, media_type=media_type, filename=path.name)
 
 @api_router.post("/qr-codes/{qr_id}/make-dynamic")
 async def make_qr_dynamic(qr_id: str, user: dict = Depends(get_current_user)):
@@ -1014,6 +1333,10 @@ async def make_qr_dynamic(qr_id: str, user: dict = Depends(get_current_user)):
             }
         }
     )
+    image_cache.invalidate(qr_id)
+    redirect_cache.invalidate(qr_id)
+    redirect_cache.discard(redirect_token)
+    prerenderer.schedule(qr_id)
 
     return {
         "message": "QR converted to dynamic",
@@ -1086,9 +1409,16 @@ async def public_qr_image(
     logo_type: Optional[str] = None,
     logo_name: Optional[str] = None,
     logo_data: Optional[str] = None,
-    template_key: Optional[str] = None
+    logo_id: Optional[str] = None,
+    template_key: Optional[str] = None,
+    format: str = "png",
+    size: Optional[int] = None,
+    scale: Optional[int] = None
 ):
-    qr = await db.qr_codes.find_one({"qr_id": qr_id}, {"_id": 0})
+    timer = StageTimer()
+    render_size = get_render_size(size, scale)
+    with timer.stage("db"):
+        qr = await db.qr_codes.find_one({"qr_id": qr_id}, {"_id": 0})
     if not qr:
         raise HTTPException(status_code=404, detail="QR code not found")
 
@@ -1108,8 +1438,8 @@ async def public_qr_image(
     else:
         qr_content = generate_qr_content(qr["qr_type"], qr["content"])
 
-    # Start with stored design, or empty dict
-    design = qr.get("design") or {}
+    # Start with a copy of the stored design, or empty dict
+    design = dict(qr.get("design") or {})
     
     # ========== HANDLE DESIGN PARAMETERS FROM QUERY ==========
     
@@ -1157,8 +1487,12 @@ async def public_qr_image(
     if ftext:
         design["frame_text"] = ftext
     
-    # Handle custom logo from parameters
-    if logo_type == "custom" and logo_data:
+    # Handle custom logo from parameters; prefer a stored logo_id over inline data
+    if logo_type == "custom" and logo_id:
+        design.pop("logo_data", None)
+        design["logo_id"] = logo_id
+        design["logo_type"] = "custom"
+    elif logo_type == "custom" and logo_data:
         try:
             design["logo_data"] = logo_data
             design["logo_type"] = "custom"
@@ -1171,129 +1505,60 @@ async def public_qr_image(
     
     # ========== END OF DESIGN PARAMETERS ==========
 
-    # Generate image with customization
-    img_bytes = create_qr_image(qr_content, design)
-
     # Watermark for free plan
-    user_doc = await db.users.find_one({"user_id": qr["user_id"]}, {"_id": 0})
-    if user_doc and user_doc.get("plan") == "free":
-        img = Image.open(io.BytesIO(img_bytes))
-        draw = ImageDraw.Draw(img)
-        w, h = img.size
-        draw.text((w // 2 - 30, h - 20), "QRPlanet", fill="gray")
-
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        buf.seek(0)
-        img_bytes = buf.getvalue()
-
-    return StreamingResponse(
-        io.BytesIO(img_bytes),
-        media_type="image/png",
-        headers={"Cache-Control": "public, max-age=3600"}
-    )
-
-@api_router.get("/r/{token}")
-async def redirect_qr(token: str, request: Request):
-    qr = await db.qr_codes.find_one({"redirect_token": token}, {"_id": 0})
-
-    if not qr:
-        return HTMLResponse("<h1>QR not found</h1>", status_code=404)
-
-    # ================= ANALYTICS =================
-    scan_id = f"scan_{uuid.uuid4().hex[:12]}"
-    user_agent = request.headers.get("user-agent", "")
-
-    # More detailed user agent parsing
-    device = "desktop"
-    if any(x in user_agent.lower() for x in ["mobile", "android", "iphone", "ipad"]):
-        device = "mobile"
-    elif "tablet" in user_agent.lower():
-        device = "tablet"
-    
-    # Browser detection
-    browser = "unknown"
-    if "chrome" in user_agent.lower():
-        browser = "Chrome"
-    elif "firefox" in user_agent.lower():
-        browser = "Firefox"
-    elif "safari" in user_agent.lower():
-        browser = "Safari"
-    elif "edge" in user_agent.lower():
-        browser = "Edge"
-    
-    # OS detection
-    os_type = "unknown"
-    if "windows" in user_agent.lower():
-        os_type = "Windows"
-    elif "mac" in user_agent.lower():
-        os_type = "macOS"
-    elif "linux" in user_agent.lower():
-        os_type = "Linux"
-    elif "android" in user_agent.lower():
-        os_type = "Android"
-    elif "ios" in user_agent.lower() or "iphone" in user_agent.lower():
-        os_type = "iOS"
-
-    scan_doc = {
-        "scan_id": scan_id,
-        "qr_id": qr["qr_id"],
-        "user_id": qr["user_id"],
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "device": device,
-        "browser": browser,
-        "os": os_type,
-        "ip_address": request.client.host if request.client else None,
-        "country": None,
-        "city": None,
-        "user_agent": user_agent
-    }
-
-    await db.scan_events.insert_one(scan_doc)
+    with timer.stage("db"):
+        user_doc = await db.users.find_one({"user_id": qr["user_id"]}, {"_id": 0})
+    watermark = bool(user_doc and user_doc.get("plan") == "free")
+
+    if format == "svg":
+        response = StreamingResponse(
+            iter_qr_svg(qr_content, design, watermark, get_logo_href(design)),
+            media_type="image/svg+xml",
+            headers={"Cache-Control": "public, max-age=3600"}
+        )
+        return finish_request_timing(response, timer, "public_qr_image")
 
-    await db.qr_codes.update_one(
-        {"qr_id": qr["qr_id"]},
-        {"$inc": {"scan_count": 1}}
+    # Generate image with customization
+    image_format = get_image_format(format)
+    response = await qr_image_response(
+        qr, qr_content, design, watermark, render_size, image_format,
+        canonical=design == (qr.get("design") or {}),
+        headers={"Cache-Control": "public, max-age=3600"},
+        timer=timer
     )
+    return finish_request_timing(response, timer, "public_qr_image")
 
-    # ================= REALTIME PUSH =================
-    for ws in list(active_connections):
-        try:
-            await ws.send_json({
-                "type": "qr_scan",
-                "qr_id": qr["qr_id"]
-            })
-        except:
-            active_connections.remove(ws)
-
-    qr_type = qr.get("qr_type")
-    content = qr.get("content") or {}
+# Only what /api/r/{token} needs, not the design (or an inline logo)
+REDIRECT_FIELDS = {"_id": 0, "qr_id": 1, "user_id": 1, "name": 1, "qr_type": 1, "content": 1}
+LANDING_PAGE_FIELDS = ("text", "ssid", "password", "name", "phone", "email")
 
+def redirect_target(qr_type: Optional[str], content: Dict[str, Any]) -> Optional[str]:
+    """Where a scan of this QR code redirects, or None for a landing page"""
     # ===== SAFE REDIRECT TYPES =====
     if qr_type == "url":
-        return RedirectResponse(str(content.get("url", "")))
+        return str(content.get("url", ""))
 
     if qr_type == "payment":
-        return RedirectResponse(str(content.get("payment_url", "")))
+        return str(content.get("payment_url", ""))
 
     if qr_type == "phone":
-        return RedirectResponse(f"tel:{content.get('phone','')}")
+        return f"tel:{content.get('phone','')}"
 
     if qr_type == "email":
-        return RedirectResponse(
+        return (
             f"mailto:{content.get('email','')}?"
             f"subject={quote(str(content.get('subject','')))}&"
             f"body={quote(str(content.get('body','')))}"
         )
 
     if qr_type == "sms":
-        return RedirectResponse(
+        return (
             f"sms:{content.get('phone','')}?"
             f"body={quote(str(content.get('message','')))}"
         )
 
     if qr_type == "whatsapp":
-        return RedirectResponse(
+        return (
             f"https://wa.me/{content.get('phone','')}?"
             f"text={quote(str(content.get('message','')))}"
         )
@@ -1301,21 +1566,81 @@ async def redirect_qr(token: str, request: Request):
     if qr_type == "location":
         lat = content.get("latitude")
         lng = content.get("longitude")
-        return RedirectResponse(f"https://maps.google.com/?q={lat},{lng}")
+        return f"https://maps.google.com/?q={lat},{lng}"
+
+    return None
+
+def redirect_record(qr: dict) -> dict:
+    """Compact redirect cache record for a QR code document"""
+    qr_type = qr.get("qr_type")
+    content = qr.get("content") or {}
+    record = {
+        "qr_id": qr["qr_id"],
+        "user_id": qr["user_id"],
+        "qr_type": qr_type,
+        "target": redirect_target(qr_type, content),
+    }
+    if record["target"] is None:
+        record["landing"] = {
+            "title": qr.get("name", "QR Code"),
+            **{field: str(content.get(field, "")) for field in LANDING_PAGE_FIELDS},
+        }
+    return record
+
+async def load_redirect_record(token: str) -> Optional[dict]:
+    qr = await db.qr_codes.find_one({"redirect_token": token}, REDIRECT_FIELDS)
+    return redirect_record(qr) if qr else None
+
+@api_router.get("/r/{token}")
+async def redirect_qr(token: str, request: Request):
+    record = await redirect_cache.resolve(token, load_redirect_record)
+
+    if not record:
+        return HTMLResponse("<h1>QR not found</h1>", status_code=404)
+
+    # ================= ANALYTICS =================
+    scan_id = f"scan_{uuid.uuid4().hex[:12]}"
+    user_agent = request.headers.get("user-agent", "")
+    ua = classify_user_agent(user_agent)
+
+    scan_doc = {
+        "scan_id": scan_id,
+        "qr_id": record["qr_id"],
+        "user_id": record["user_id"],
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "device": ua.device,
+        "browser": ua.browser,
+        "browser_version": ua.browser_version,
+        "os": ua.os,
+        "os_version": ua.os_version,
+        "ip_address": request.client.host if request.client else None,
+        "country": None,
+        "city": None,
+        "user_agent": user_agent
+    }
+
+    # Stored, counted and announced to the owner's dashboards by the next batch
+    scan_writer.submit(scan_doc)
+
+    if record["target"] is not None:
+        return RedirectResponse(record["target"])
 
     # ===== LANDING PAGE (SAFE) =====
-    text = str(content.get("text", ""))
-    ssid = str(content.get("ssid", ""))
-    password = str(content.get("password", ""))
-    name = str(content.get("name", ""))
-    phone = str(content.get("phone", ""))
-    email = str(content.get("email", ""))
+    qr_type = record["qr_type"]
+    landing = record["landing"]
+    title = landing["title"]
+    text = landing["text"]
+    ssid = landing["ssid"]
+    password = landing["password"]
+    name = landing["name"]
+    phone = landing["phone"]
+    email = landing["email"]
 
     return HTMLResponse(
         f"""
         <html>
           <head>
-            <title>{qr.get("name","QR Code")}</title>
+            <title>{title}</title>
             <meta name="viewport" content="width=device-width, initial-scale=1" />
             <style>
               body {{ font-family: Arial; padding: 24px; }}
@@ -1324,7 +1649,7 @@ async def redirect_qr(token: str, request: Request):
           </head>
           <body>
             <div class="card">
-              <h2>{qr.get("name","QR Code")}</h2>
+              <h2>{title}</h2>
 
               {f"<p>{text}</p>" if qr_type=="text" else ""}
               {f"<p><b>WiFi:</b> {ssid}</p><p>Password: {password}</p>" if qr_type=="wifi" else ""}
@@ -1429,37 +1754,7 @@ async def track_qr_scan(qr_id: str, request: Request):
         
         # Parse user agent
         user_agent = request.headers.get("user-agent", "")
-        
-        # Basic device detection
-        device = "desktop"
-        if any(x in user_agent.lower() for x in ["mobile", "android", "iphone", "ipad"]):
-            device = "mobile"
-        elif "tablet" in user_agent.lower():
-            device = "tablet"
-        
-        # Browser detection
-        browser = "unknown"
-        if "chrome" in user_agent.lower():
-            browser = "Chrome"
-        elif "firefox" in user_agent.lower():
-            browser = "Firefox"
-        elif "safari" in user_agent.lower():
-            browser = "Safari"
-        elif "edge" in user_agent.lower():
-            browser = "Edge"
-        
-        # OS detection
-        os_type = "unknown"
-        if "windows" in user_agent.lower():
-            os_type = "Windows"
-        elif "mac" in user_agent.lower():
-            os_type = "macOS"
-        elif "linux" in user_agent.lower():
-            os_type = "Linux"
-        elif "android" in user_agent.lower():
-            os_type = "Android"
-        elif "ios" in user_agent.lower() or "iphone" in user_agent.lower():
-            os_type = "iOS"
+        ua = classify_user_agent(user_agent)
         
         # Get IP address
         ip_address = request.client.host if request.client else None
@@ -1475,19 +1770,19 @@ async def track_qr_scan(qr_id: str, request: Request):
             "qr_id": qr_id,
             "user_id": qr["user_id"],
             "timestamp": datetime.now(timezone.utc).isoformat(),
-            "device": device,
-            "browser": browser,
-            "os": os_type,
+            "device": ua.device,
+            "browser": ua.browser,
+            "browser_version": ua.browser_version,
+            "os": ua.os,
+            "os_version": ua.os_version,
             "ip_address": ip_address,
             "country": country,
             "city": city,
             "user_agent": user_agent
         }
         
-        await db.scan_events.insert_one(scan_doc)
-        
-        # Increment scan count
-        await db.qr_codes.update_one({"qr_id": qr_id}, {"$inc": {"scan_count": 1}})
+        # Stored, counted and announced to the owner's dashboards by the next batch
+        scan_writer.submit(scan_doc)
         
         return {"status": "success", "scan_id": scan_id}
     except Exception as e:
@@ -1585,6 +1880,9 @@ async def checkout_status(session_id: str, user: dict = Depends(get_current_user
                 "updated_at": datetime.now(timezone.utc).isoformat()
             }}
         )
+        image_cache.invalidate(user_id)
+        redirect_cache.invalidate(user_id)
+        user_prerenderer.schedule(user_id)
 
     return {
         "status": session.status,
@@ -1628,20 +1926,58 @@ async def stripe_webhook(request: Request):
                 }
             }
         )
+        image_cache.invalidate(user_id)
+        redirect_cache.invalidate(user_id)
+        user_prerenderer.schedule(user_id)
 
     return {"status": "success"}
 
+async def authenticate_websocket(ws: WebSocket):
+    """(user, qr_ids) from the session cookie, or else from a first message
+    {"type": "auth", "token": ..., "qr_ids": [...]}; qr_ids that are not a
+    list of strings raise ValueError"""
+    token = ws.cookies.get("session_token")
+    qr_ids = None
+    if not token:
+        message = json.loads(await asyncio.wait_for(ws.receive_text(), WS_AUTH_TIMEOUT))
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        token = message.get("token")
+        qr_ids = subscription(message.get("qr_ids"))
+    return await get_session_user(token), qr_ids
+
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws.accept()
-    active_connections.add(ws)
+    try:
+        user, qr_ids = await authenticate_websocket(ws)
+    except Exception:
+        try:
+            await ws.close(code=1008)
+        except Exception:
+            pass
+        return
+
+    connection = realtime.connect(ws, user["user_id"], qr_ids)
     try:
         while True:
-            await ws.receive_text()
+            # {"type": "subscribe", "qr_ids": [...]} narrows the events sent
+            # (an empty list means all of the user's). Clients authenticated
+            # by cookie still send their auth message, whose qr_ids count the
+            # same way. Anything else, malformed qr_ids included, is ignored.
+            try:
+                message = json.loads(await ws.receive_text())
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get("type") in ("subscribe", "auth"):
+                try:
+                    connection.subscribe(message.get("qr_ids"))
+                except ValueError:
+                    continue
     except:
         pass
     finally:
-        active_connections.remove(ws)
+        await realtime.disconnect(connection)
 
 # ========== MAIN APP ==========
 
@@ -1649,6 +1985,18 @@ async def websocket_endpoint(ws: WebSocket):
 async def root():
     return {"message": "QR Code SaaS API"}
 
+@api_router.get("/metrics")
+async def get_metrics(request: Request):
+    """Prometheus text exposition of the in-process metrics"""
+    if not METRICS_TOKEN:
+        # Fail closed: metrics stay private unless a scrape token is configured
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(api_router)
 
 app.add_middleware(
@@ -1659,6 +2007,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_render_executor():
+    render_executor.start()
+
+@app.on_event("startup")
+async def start_render_jobs():
+    await db.render_jobs.create_index("job_id", unique=True)
+    await db.render_jobs.create_index([("status", 1), ("created_at", 1)])
+    render_jobs.start()
+
+@app.on_event("startup")
+async def create_redirect_token_index():
+    # Redirect cache misses look QR codes up by token
+    await db.qr_codes.create_index("redirect_token", sparse=True)
+
+@app.on_event("startup")
+async def purge_stale_rendered_images():
+    await rendered_images.purge_stale_versions()
+
+@app.on_event("startup")
+async def start_realtime():
+    await realtime.start()
+
+@app.on_event("startup")
+async def start_scan_writer():
+    # Replaying spilled scans upserts them by scan_id
+    await db.scan_events.create_index("scan_id")
+    scan_writer.start()
+
+@app.on_event("shutdown")
+async def shutdown_render_jobs():
+    await render_jobs.stop()
+
+@app.on_event("shutdown")
+async def shutdown_prerenderer():
+    await user_prerenderer.stop()
+    await prerenderer.stop()
+
+@app.on_event("shutdown")
+async def shutdown_realtime():
+    await realtime.stop()
+
+@app.on_event("shutdown")
+async def shutdown_scan_writer():
+    await scan_writer.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+
+@app.on_event("shutdown")
+async def shutdown_render_executor():
+    render_executor.shutdown()
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""User-agent classification for scan analytics.
+
+The OS, browser and device class are each decided by literal tokens checked
+in precedence order. Precedence matters because UAs pile up tokens: Edge and
+Opera UAs also say Chrome and Safari, iOS UAs say "like Mac OS X", Android
+UAs say Linux. Tokens are found with plain substring checks, and only the
+browser tokens the UA's platform can carry are looked for. A version is read
+only for the winning token, with a case-sensitive regex that starts with the
+token's literal (so re jumps straight to it) and backtracks over a bounded
+stretch at most. Scanner UAs are extremely repetitive (a few phone models
+and browser builds dominate), so results are memoized on the raw string.
+"""
+import os
+import re
+from functools import lru_cache, partial
+from typing import NamedTuple, Optional
+
+UA_CACHE_SIZE = int(os.environ.get("UA_CACHE_SIZE", 4096))
+
+# Longer strings are junk or abuse; the tokens we need come early anyway
+MAX_UA_LENGTH = 512
+
+# (token, browser, version pattern) in precedence order. A token only counts
+# if its pattern, where there is one, matches; group 1 is the major version.
+BROWSERS = (
+    ("Instagram ", "Instagram", re.compile(r"Instagram (\d+)")),
+    ("FBA", "Facebook", re.compile(r"FBA[NV]/(\d+)?")),
+    ("Edg", "Edge", re.compile(r"Edg(?:e|A|iOS)?/(\d+)")),
+    ("OP", "Opera", re.compile(r"OP(?:R|iOS|T)/(\d+)")),
+    ("Opera", "Opera", None),
+    ("SamsungBrowser/", "Samsung Internet", re.compile(r"SamsungBrowser/(\d+)")),
+    ("Firefox/", "Firefox", re.compile(r"Firefox/(\d+)")),
+    ("FxiOS/", "Firefox", re.compile(r"FxiOS/(\d+)")),
+    ("Chrome/", "Chrome", re.compile(r"Chrome/(\d+)")),
+    ("CriOS/", "Chrome", re.compile(r"CriOS/(\d+)")),
+    ("MSIE ", "Internet Explorer", re.compile(r"MSIE (\d+)")),
+    # IE 11 has rv: in the same comment as Trident, a few fields later
+    ("Trident/", "Internet Explorer", re.compile(r"Trident/[^)]{0,64}?rv:(\d+)")),
+)
+SAFARI_VERSION = re.compile(r"Version/(\d+)")
+
+# The browser tokens each platform's UAs can carry; the others are not
+# looked for, as every check is a pass over the UA. Other platforms (and
+# UAs without one) are checked for all of them.
+PLATFORM_BROWSER_TOKENS = {
+    "iOS": ("Instagram ", "FBA", "Edg", "OP", "Opera", "FxiOS/", "CriOS/"),
+    "Android": ("Instagram ", "FBA", "Edg", "OP", "Opera", "SamsungBrowser/", "Firefox/", "Chrome/"),
+    "Windows": ("Edg", "OP", "Opera", "Firefox/", "Chrome/", "MSIE ", "Trident/"),
+    "macOS": ("Edg", "OP", "Opera", "Firefox/", "Chrome/"),
+}
+BROWSERS_BY_OS = {
+    os_name: tuple(entry for entry in BROWSERS if entry[0] in tokens)
+    for os_name, tokens in PLATFORM_BROWSER_TOKENS.items()
+}
+
+# Group 1 is the major.minor version (iOS and macOS separate them with "_")
+IOS_VERSION = re.compile(r"(?:iPhone|CPU) OS (\d+(?:_\d+)?)")
+ANDROID_VERSION = re.compile(r"Android (\d+(?:\.\d+)?)")
+WINDOWS_VERSION = re.compile(r"Windows NT (\d+\.\d+)")
+MACOS_VERSION = re.compile(r"Mac OS X (\d+(?:[_.]\d+)?)")
+
+WINDOWS_VERSIONS = {"10.0": "10", "6.3": "8.1", "6.2": "8", "6.1": "7", "6.0": "Vista", "5.1": "XP"}
+
+
+class UserAgent(NamedTuple):
+    device: str  # mobile, tablet or desktop
+    browser: str
+    browser_version: Optional[str]  # major version
+    os: str
+    os_version: Optional[str]
+
+
+# UserAgent(...) goes through a generated Python __new__; this builds the
+# same tuple without that extra frame, which shows on a cache miss
+_user_agent = partial(tuple.__new__, UserAgent)
+
+
+def _os_version(pattern: "re.Pattern", ua: str) -> Optional[str]:
+    match = pattern.search(ua)
+    return match.group(1).replace("_", ".") if match else None
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def _classify(ua: str) -> UserAgent:
+    # Each substring check costs a pass over the UA, so rarer tokens are
+    # only looked for once a shorter one they contain is present
+    iphone = ipad = False
+    if "iP" in ua:
+        iphone = "iPhone" in ua or "iPod" in ua
+        ipad = "iPad" in ua
+    windows = "Windows" in ua
+
+    # ----- OS -----
+    if windows and "Windows Phone" in ua:
+        os_name, os_version = "Windows Phone", None
+    elif iphone or ipad:
+        os_name, os_version = "iOS", _os_version(IOS_VERSION, ua)
+    elif "Android" in ua:
+        os_name, os_version = "Android", _os_version(ANDROID_VERSION, ua)
+    elif windows:
+        version = _os_version(WINDOWS_VERSION, ua)
+        os_name, os_version = "Windows", WINDOWS_VERSIONS.get(version, version)
+    elif "CrOS" in ua:
+        os_name, os_version = "ChromeOS", None
+    elif "Mac OS X" in ua or "Macintosh" in ua:
+        os_name, os_version = "macOS", _os_version(MACOS_VERSION, ua)
+    elif "Linux" in ua:
+        os_name, os_version = "Linux", None
+    else:
+        os_name, os_version = "unknown", None
+
+    # ----- browser -----
+    for token, browser, pattern in BROWSERS_BY_OS.get(os_name, BROWSERS):
+        if token in ua:
+            if pattern is None:
+                browser_version = None
+                break
+            match = pattern.search(ua)
+            if match is not None:
+                browser_version = match.group(1)
+                break
+    else:
+        match = SAFARI_VERSION.search(ua) if "Version/" in ua else None
+        if "Safari/" in ua or (os_name == "iOS" and match is not None):
+            browser, browser_version = "Safari", match and match.group(1)
+        else:
+            browser, browser_version = "unknown", None
+
+    # ----- device -----
+    if ipad or "Tablet" in ua:
+        device = "tablet"
+    elif iphone or os_name == "Windows Phone" or "Mobile" in ua:
+        device = "mobile"
+    elif os_name == "Android":
+        # Android tablets leave "Mobile" out of the UA
+        device = "tablet"
+    else:
+        device = "desktop"
+
+    return _user_agent((device, browser, browser_version, os_name, os_version))
+
+
+def classify_user_agent(ua: Optional[str]) -> UserAgent:
+    """Device, browser and OS (with versions) of a User-Agent header"""
+    return _classify((ua or "")[:MAX_UA_LENGTH])
+
+
+def ua_cache_info():
+    return _classify.cache_info()
@@ -30,6 +30,7 @@ import AccountPage from './pages/AccountPage';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 export const API = `${BACKEND_URL}/api`;
+export const WS_URL = `${BACKEND_URL.replace(/^http/, 'ws')}/ws`;
 axios.defaults.withCredentials = true;
 
 function App() {
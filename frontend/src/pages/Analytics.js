@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { useParams, useNavigate, useLocation } from 'react-router-dom';
 import axios from 'axios';
-import { API } from '../App';
+import { API, WS_URL } from '../App';
 import Navbar from '../components/Navbar';
 import { Card } from '../components/ui/card';
 import { Button } from '../components/ui/button';
@@ -116,7 +116,16 @@ const Analytics = ({ user }) => {
     fetchAnalytics();
 
     // ✅ REALTIME WEBSOCKET
-    const ws = new WebSocket("ws://localhost:8000/ws");
+    const ws = new WebSocket(WS_URL);
+
+    // The server only sends this user's events, narrowed to this QR code
+    ws.onopen = () => {
+      ws.send(JSON.stringify({
+        type: "auth",
+        token: localStorage.getItem("session_token"),
+        qr_ids: [qrId]
+      }));
+    };
 
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
@@ -1,7 +1,7 @@
 import React, { useState, useEffect ,useCallback} from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
-import { API } from '../App';
+import { API, WS_URL } from '../App';
 import Navbar from '../components/Navbar';
 import { Button } from '../components/ui/button';
 import { Card } from '../components/ui/card';
@@ -37,9 +37,15 @@ const Dashboard = ({ user }) => {
   
   useEffect(() => {
     // ✅ CONNECT TO BACKEND WEBSOCKET
-    const ws = new WebSocket("wss://https://qr-code-generator-enterprise-level.onrender.com/ws");
-    // for local:
-    // const ws = new WebSocket("ws://localhost:8000/ws");
+    const ws = new WebSocket(WS_URL);
+
+    // The server only sends events for this user's QR codes
+    ws.onopen = () => {
+      ws.send(JSON.stringify({
+        type: "auth",
+        token: localStorage.getItem('session_token')
+      }));
+    };
 
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
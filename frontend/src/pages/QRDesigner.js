@@ -364,6 +364,9 @@ const QRDesigner = ({ user }) => {
           // Send only part after comma for base64
           const base64Data = design.logo_data.split(',')[1] || design.logo_data;
           params.append('logo_data', encodeURIComponent(base64Data));
+        } else if (design.logo_type === 'custom' && design.logo_id) {
+          // Saved logos live in the logo store; reference them by id
+          params.append('logo_id', design.logo_id);
         }
       }
 
@@ -446,6 +449,8 @@ const QRDesigner = ({ user }) => {
         } catch (error) {
           console.warn('Could not process custom logo:', error);
         }
+      } else if (initialDesign.logo_type === 'custom' && initialDesign.logo_id) {
+        initialDesign.custom_logo_url = `${API}/logos/${initialDesign.logo_id}`;
       } else if (initialDesign.logo_type === 'preloaded' && initialDesign.template_logo) {
         const logoInfo = PRELOADED_LOGOS.find(logo => logo.id === initialDesign.template_logo);
         if (logoInfo) {
@@ -594,6 +599,7 @@ const QRDesigner = ({ user }) => {
       setDesign(prev => ({
         ...prev,
         logo_data: base64Logo,
+        logo_id: null,
         logo_type: 'custom',
         icon_logo: null,
         template_logo: null,
@@ -612,6 +618,7 @@ const QRDesigner = ({ user }) => {
     setDesign(prev => ({
       ...prev,
       logo_data: null,
+      logo_id: null,
       logo_type: 'none',
       icon_logo: null,
       template_logo: null,
@@ -0,0 +1,146 @@
+"""UnixSocketBus and MongoEventBus between two workers"""
+import asyncio
+import time
+
+from bson import ObjectId, Timestamp
+
+from event_bus import MongoEventBus, UnixSocketBus
+
+
+async def settle(seconds=0.2):
+    await asyncio.sleep(seconds)
+
+
+def test_unix_bus_skips_events_too_large_for_a_datagram(tmp_path):
+    async def main():
+        got = []
+        sender, receiver = UnixSocketBus(tmp_path, tick=0.01), UnixSocketBus(tmp_path, tick=0.01)
+        await sender.start(lambda events: None)
+        await receiver.start(got.extend)
+        sender.publish({"i": 0})
+        sender.publish({"i": 1, "pad": "x" * UnixSocketBus.MAX_DATAGRAM})
+        sender.publish({"i": 2})
+        await settle()
+        await sender.stop()
+        await receiver.stop()
+        return got, sender.stats()
+
+    got, stats = asyncio.run(main())
+    assert [event["i"] for event in got] == [0, 2]
+    assert stats["dropped"] == 1
+
+
+class FakeCursor:
+    """A tailable cursor over FakeCappedCollection, filtered on ts"""
+
+    def __init__(self, collection, after):
+        self.collection = collection
+        self.after = after
+        self.position = 0
+        self.alive = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.collection.cursor_failures:
+            self.collection.cursor_failures -= 1
+            raise RuntimeError("cursor killed")
+        while self.position < len(self.collection.documents):
+            document = self.collection.documents[self.position]
+            self.position += 1
+            if document["ts"] > self.after:
+                self.collection.read += 1
+                return document
+        await asyncio.sleep(0.01)
+        raise StopAsyncIteration
+
+
+class FakeCappedCollection:
+    """The few motor collection methods MongoEventBus uses"""
+
+    def __init__(self):
+        self.documents = []
+        self.read = 0
+        self.cursor_failures = 0
+        self._clock = 0
+
+    async def insert_one(self, document):
+        if document.get("ts") == Timestamp(0, 0):
+            self._clock += 1
+            document["ts"] = Timestamp(int(time.time()), self._clock)
+        document["_id"] = ObjectId()
+        self.documents.append(document)
+        return type("InsertOneResult", (), {"inserted_id": document["_id"]})
+
+    async def insert_many(self, documents, ordered=True):
+        for document in documents:
+            await self.insert_one(document)
+
+    async def find_one(self, query, projection=None):
+        return next(d for d in self.documents if d["_id"] == query["_id"])
+
+    def find(self, query, cursor_type=None):
+        return FakeCursor(self, query["ts"]["$gt"])
+
+
+class FakeDB:
+    def __init__(self):
+        self.realtime_events = FakeCappedCollection()
+
+    async def create_collection(self, name, **options):
+        pass
+
+    def __getitem__(self, name):
+        return self.realtime_events
+
+
+def test_mongo_bus_delivers_to_other_workers_once():
+    db = FakeDB()
+
+    async def main():
+        local, remote = [], []
+        sender = MongoEventBus(db, tick=0.01, retry_interval=0.05)
+        receiver = MongoEventBus(db, tick=0.01, retry_interval=0.05)
+        await sender.start(local.extend)
+        await receiver.start(remote.extend)
+        await settle()
+        for n in range(5):
+            sender.publish({"i": n})
+        await settle()
+        await sender.stop()
+        await receiver.stop()
+        return local, remote
+
+    local, remote = asyncio.run(main())
+    assert [event["i"] for event in local] == list(range(5))
+    assert [event["i"] for event in remote] == list(range(5))
+
+
+def test_mongo_bus_resumes_after_a_failed_cursor():
+    db = FakeDB()
+
+    async def main():
+        remote = []
+        sender = MongoEventBus(db, tick=0.01, retry_interval=0.05)
+        receiver = MongoEventBus(db, tick=0.01, retry_interval=0.05)
+        await sender.start(lambda events: None)
+        await receiver.start(remote.extend)
+        await settle()
+        for n in range(3):
+            sender.publish({"i": n})
+        await settle()
+        read = db.realtime_events.read
+        # Killed on its next read; the events meanwhile must still arrive
+        db.realtime_events.cursor_failures = 1
+        for n in range(3, 6):
+            sender.publish({"i": n})
+        await settle()
+        await sender.stop()
+        await receiver.stop()
+        return remote, db.realtime_events.read - read
+
+    remote, read_after_reopen = asyncio.run(main())
+    assert [event["i"] for event in remote] == list(range(6))
+    # The reopened cursors only read what was new, not the collection again
+    assert read_after_reopen <= 2 * 3
@@ -0,0 +1,82 @@
+"""qr_encoder must produce exactly the symbols qrcode does"""
+import random
+import string
+
+import numpy as np
+import pytest
+import qrcode
+
+import qr_encoder
+from qr_matrix import ERROR_CORRECTION_LEVELS
+
+ALPHABETS = {
+    "numeric": string.digits,
+    "alphanumeric": qr_encoder.ALPHA_NUM.decode(),
+    "byte": string.ascii_letters + string.digits + "-._~:/?#[]@!$&'()*+,;=% \n",
+    "utf8": "aéüß漢字😀 -",
+}
+LEVELS = list(ERROR_CORRECTION_LEVELS)
+
+
+def reference(payload, error_correction):
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECTION_LEVELS[error_correction], border=0)
+    qr.add_data(payload)
+    qr.best_fit()
+    mask_pattern = qr.best_mask_pattern()
+    qr.makeImpl(False, mask_pattern)
+    return qr.version, mask_pattern, np.array(qr.modules, dtype=bool)
+
+
+def byte_capacity(version, error_correction):
+    count_bits = qr_encoder.LENGTH_BITS[qr_encoder._size_class(version)][qr_encoder.MODE_BYTE]
+    return (qr_encoder.BIT_LIMITS[error_correction][version] - 4 - count_bits) // 8
+
+
+def assert_matches(payload, error_correction):
+    version, mask_pattern, modules = qr_encoder.encode(payload, error_correction)
+    expected_version, expected_mask, expected_modules = reference(payload, error_correction)
+    assert (version, mask_pattern) == (expected_version, expected_mask)
+    assert np.array_equal(modules, expected_modules)
+    return version
+
+
+@pytest.mark.parametrize("error_correction", LEVELS)
+@pytest.mark.parametrize("version", [1, 2, 6, 7, 9, 10, 14, 20, 26, 27, 33, 40])
+def test_version_boundaries(version, error_correction):
+    rng = random.Random(version)
+    payload = "".join(rng.choice(string.ascii_lowercase) for _ in range(byte_capacity(version, error_correction)))
+    assert assert_matches(payload, error_correction) == version
+    if version < 40:
+        assert assert_matches(payload + "z", error_correction) == version + 1
+
+
+@pytest.mark.parametrize("error_correction", LEVELS)
+@pytest.mark.parametrize("mode", list(ALPHABETS) + ["mixed"])
+def test_modes(mode, error_correction):
+    rng = random.Random(f"{mode}-{error_correction}")
+    for length in (1, 19, 20, 57, 300, 1200):
+        if mode == "mixed":
+            # Runs long enough to get their own numeric/alphanumeric segments
+            parts = []
+            while sum(map(len, parts)) < length:
+                alphabet = ALPHABETS[rng.choice(list(ALPHABETS))]
+                parts.append("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 60))))
+            payload = "".join(parts)[:length]
+        else:
+            payload = "".join(rng.choice(ALPHABETS[mode]) for _ in range(length))
+        if len(payload.encode()) > byte_capacity(40, error_correction):
+            continue
+        assert_matches(payload, error_correction)
+
+
+def test_bytes_payload():
+    assert_matches(b"\x00\xff binary \x80", "M")
+
+
+@pytest.mark.parametrize("error_correction", LEVELS)
+def test_too_long(error_correction):
+    payload = "x" * (byte_capacity(40, error_correction) + 1)
+    with pytest.raises(ValueError):
+        reference(payload, error_correction)
+    with pytest.raises(ValueError):
+        qr_encoder.encode(payload, error_correction)
@@ -0,0 +1,23 @@
+"""Subscriptions sent by /ws clients"""
+import pytest
+
+from realtime import MAX_SUBSCRIBED_QR_IDS, Connection, subscription
+
+
+def test_subscription_is_a_set_of_qr_ids():
+    assert subscription(["qr_a", "qr_b", "qr_a"]) == {"qr_a", "qr_b"}
+    assert subscription(None) is None
+    assert subscription([]) is None
+
+
+@pytest.mark.parametrize("qr_ids", ["qr_abc", 7, {"qr_a": 1}, ["qr_a", 7], ["qr"] * (MAX_SUBSCRIBED_QR_IDS + 1)])
+def test_malformed_subscriptions_are_rejected(qr_ids):
+    with pytest.raises(ValueError):
+        subscription(qr_ids)
+
+
+def test_rejected_subscribe_keeps_the_current_one():
+    connection = Connection(None, "user_a", ["qr_a"])
+    with pytest.raises(ValueError):
+        connection.subscribe("qr_b")
+    assert connection.wants({"qr_id": "qr_a"}) and not connection.wants({"qr_id": "qr_b"})
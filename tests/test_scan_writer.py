@@ -0,0 +1,287 @@
+"""ScanWriter: batched flushes, spilling, replay across writers and draining"""
+import asyncio
+
+from scan_writer import ScanWriter
+
+
+class FakeCollection:
+    """The few motor collection methods ScanWriter uses, over plain dicts"""
+
+    def __init__(self):
+        self.documents = {}
+        self.down = False
+        self.bulk_writes = 0
+
+    async def insert_many(self, documents, ordered=True):
+        self._check()
+        for document in documents:
+            self.documents[document["scan_id"]] = document
+
+    async def bulk_write(self, requests, ordered=True):
+        self._check()
+        self.bulk_writes += 1
+        for request in requests:
+            key = next(iter(request._filter.values()))
+            if "$inc" in request._doc:
+                document = self.documents.setdefault(key, {"scan_count": 0})
+                for field, n in request._doc["$inc"].items():
+                    document[field] = document.get(field, 0) + n
+            else:
+                self.documents[key] = request._doc
+
+    def _check(self):
+        if self.down:
+            raise RuntimeError("mongo down")
+
+
+class FakeDB:
+    def __init__(self):
+        self.scan_events = FakeCollection()
+        self.qr_codes = FakeCollection()
+
+    def scan_count(self, qr_id):
+        return self.qr_codes.documents.get(qr_id, {}).get("scan_count", 0)
+
+
+def scan(n, qr_id="qr_a"):
+    return {"scan_id": f"scan_{qr_id}_{n}", "qr_id": qr_id}
+
+
+def writer(db, tmp_path, **options):
+    options = {"flush_interval": 0.01, "retry_interval": 0.05, **options}
+    return ScanWriter(db, tmp_path / "scan_spill.jsonl", **options)
+
+
+async def settle(seconds=0.2):
+    await asyncio.sleep(seconds)
+
+
+def spill_files(tmp_path):
+    return sorted(p.name for p in tmp_path.iterdir())
+
+
+def test_flush_batches_and_coalesces_counts(tmp_path):
+    db = FakeDB()
+
+    async def main():
+        w = writer(db, tmp_path, batch_size=4)
+        w.start()
+        for n in range(6):
+            w.submit(scan(n))
+        w.submit(scan(0, "qr_b"))
+        await settle()
+        await w.stop()
+        return w
+
+    w = asyncio.run(main())
+    assert len(db.scan_events.documents) == 7
+    assert db.scan_count("qr_a") == 6 and db.scan_count("qr_b") == 1
+    assert w.stats()["written"] == 7 and w.stats()["spilled"] == 0
+    assert spill_files(tmp_path) == []
+
+
+def test_failed_flush_spills_and_replays(tmp_path):
+    db = FakeDB()
+
+    async def main():
+        w = writer(db, tmp_path)
+        w.start()
+        db.scan_events.down = True
+        for n in range(3):
+            w.submit(scan(n))
+        await settle()
+        spilled = spill_files(tmp_path)
+        db.scan_events.down = False
+        await settle()
+        await w.stop()
+        return w, spilled
+
+    w, spilled = asyncio.run(main())
+    assert any(name.endswith(".jsonl") for name in spilled)
+    assert len(db.scan_events.documents) == 3 and db.scan_count("qr_a") == 3
+    assert w.stats()["replayed"] == 3
+    assert spill_files(tmp_path) == []
+
+
+def test_failed_increments_are_replayed_once(tmp_path):
+    db = FakeDB()
+
+    async def main():
+        w = writer(db, tmp_path)
+        w.start()
+        db.qr_codes.down = True
+        w.submit(scan(0))
+        w.submit(scan(1))
+        await settle()
+        db.qr_codes.down = False
+        await settle()
+        await w.stop()
+
+    asyncio.run(main())
+    assert len(db.scan_events.documents) == 2 and db.scan_count("qr_a") == 2
+
+
+def test_full_queue_spills_without_blocking(tmp_path):
+    db = FakeDB()
+
+    async def main():
+        w = writer(db, tmp_path, max_queue=2, flush_interval=60)
+        w.start()
+        for n in range(5):
+            w.submit(scan(n))
+        assert len(w) == 2
+        await settle(0.05)
+        spilled = w.stats()["spilled"]
+        await w.stop()
+        return spilled
+
+    assert asyncio.run(main()) == 3
+    # Drained and spilled events are all written by the next run's replay
+    db2 = FakeDB()
+
+    async def again():
+        w = writer(db2, tmp_path)
+        w.start()
+        await settle()
+        await w.stop()
+
+    asyncio.run(again())
+    assert len(db.scan_events.documents) + len(db2.scan_events.documents) == 5
+
+
+def test_stop_drains_the_queue(tmp_path):
+    db = FakeDB()
+
+    async def main():
+        w = writer(db, tmp_path, flush_interval=60)
+        w.start()
+        for n in range(10):
+            w.submit(scan(n))
+        await w.stop()
+
+    asyncio.run(main())
+    assert len(db.scan_events.documents) == 10 and db.scan_count("qr_a") == 10
+    assert spill_files(tmp_path) == []
+
+
+def test_stop_spills_what_it_cannot_write(tmp_path):
+    db = FakeDB()
+    db.scan_events.down = True
+
+    async def main():
+        w = writer(db, tmp_path, flush_interval=60, drain_timeout=1)
+        w.start()
+        for n in range(4):
+            w.submit(scan(n))
+        await w.stop()
+
+    asyncio.run(main())
+    assert db.scan_events.documents == {}
+    assert any(name.endswith(".jsonl") for name in spill_files(tmp_path))
+
+    db.scan_events.down = False
+
+    async def restart():
+        w = writer(db, tmp_path)
+        w.start()
+        await settle()
+        await w.stop()
+
+    asyncio.run(restart())
+    assert len(db.scan_events.documents) == 4 and db.scan_count("qr_a") == 4
+    assert spill_files(tmp_path) == []
+
+
+def test_exited_writer_is_replayed_by_exactly_one_other(tmp_path):
+    db = FakeDB()
+
+    async def main():
+        # One writer per server process, all sharing the spill directory
+        exited = writer(db, tmp_path, flush_interval=60)
+        exited.start()
+        db.scan_events.down = True
+        for n in range(3):
+            exited.submit(scan(n))
+        await exited.stop()
+        db.scan_events.down = False
+
+        others = [writer(db, tmp_path) for _ in range(3)]
+        for w in others:
+            w.start()
+        await settle()
+        for w in others:
+            await w.stop()
+        return [w.stats()["replayed"] for w in others]
+
+    assert sorted(asyncio.run(main())) == [0, 0, 3]
+    assert len(db.scan_events.documents) == 3 and db.scan_count("qr_a") == 3
+    assert spill_files(tmp_path) == []
+
+
+def test_running_writer_keeps_its_spill_file(tmp_path):
+    down, up = FakeDB(), FakeDB()
+    down.scan_events.down = True
+
+    async def main():
+        running = writer(down, tmp_path)
+        running.start()
+        running.submit(scan(0))
+        other = writer(up, tmp_path)
+        other.start()
+        await settle()
+        await other.stop()
+        files = spill_files(tmp_path)
+        down.scan_events.down = False
+        await settle()
+        await running.stop()
+        return files
+
+    files = asyncio.run(main())
+    assert any(name.endswith(".jsonl") for name in files)
+    assert up.scan_events.documents == {}
+    assert len(down.scan_events.documents) == 1 and down.scan_count("qr_a") == 1
+    assert spill_files(tmp_path) == []
+
+
+def test_on_written_runs_after_the_counts_are_stored(tmp_path):
+    db = FakeDB()
+    seen = []
+
+    def on_written(events):
+        # What a dashboard refetching now would read
+        seen.append(([e["scan_id"] for e in events], db.qr_codes.bulk_writes, db.scan_count("qr_a")))
+
+    async def main():
+        w = writer(db, tmp_path, on_written=on_written)
+        w.start()
+        w.submit(scan(0))
+        await settle()
+        db.qr_codes.down = True
+        w.submit(scan(1))
+        await settle()
+        assert len(seen) == 1
+        await w.stop()
+
+    asyncio.run(main())
+    assert seen == [(["scan_qr_a_0"], 1, 1)]
+
+
+def test_on_written_runs_for_replayed_events(tmp_path):
+    db = FakeDB()
+    seen = []
+
+    async def main():
+        w = writer(db, tmp_path, on_written=lambda events: seen.append((
+            [e["scan_id"] for e in events], db.scan_count("qr_a"))))
+        w.start()
+        db.scan_events.down = True
+        for n in range(2):
+            w.submit(scan(n))
+        await settle()
+        assert seen == []
+        db.scan_events.down = False
+        await settle()
+        await w.stop()
+
+    asyncio.run(main())
+    assert seen == [(["scan_qr_a_0", "scan_qr_a_1"], 2)]
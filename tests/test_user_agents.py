@@ -0,0 +1,121 @@
+"""classify_user_agent on real UA strings, versions included"""
+import pytest
+
+from user_agents import UserAgent, _classify, classify_user_agent
+
+# (UA, device, browser, browser major version, OS, OS version)
+CORPUS = [
+    # iOS
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_1_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Version/17.1.2 Mobile/15E148 Safari/604.1",
+     "mobile", "Safari", "17", "iOS", "17.1"),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "CriOS/120.0.6099.119 Mobile/15E148 Safari/604.1",
+     "mobile", "Chrome", "120", "iOS", "17.2"),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "FxiOS/119.0 Mobile/15E148 Safari/605.1.15",
+     "mobile", "Firefox", "119", "iOS", "16.6"),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Version/17.0 EdgiOS/119.2151.96 Mobile/15E148 Safari/605.1.15",
+     "mobile", "Edge", "119", "iOS", "17.1"),
+    ("Mozilla/5.0 (iPad; CPU OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Version/16.6 Mobile/15E148 Safari/604.1",
+     "tablet", "Safari", "16", "iOS", "16.6"),
+    ("Mozilla/5.0 (iPod touch; CPU iPhone OS 15_7 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Version/15.6 Mobile/15E148 Safari/604.1",
+     "mobile", "Safari", "15", "iOS", "15.7"),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_1_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Mobile/15E148 Instagram 307.0.2.20.108 (iPhone15,2; iOS 17_1_1; en_US; en; scale=3.00; 1179x2556; 531233489)",
+     "mobile", "Instagram", "307", "iOS", "17.1"),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 16_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Mobile/15E148 [FBAN/FBIOS;FBDV/iPhone13,2;FBMD/iPhone;FBSN/iOS;FBSV/16.5;FBSS/3;FBID/phone;FBLC/en_US;FBOP/5]",
+     "mobile", "Facebook", None, "iOS", "16.5"),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+     "mobile", "unknown", None, "iOS", "17.0"),
+    # Android
+    ("Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Mobile Safari/537.36",
+     "mobile", "Chrome", "120", "Android", "10"),
+    ("Mozilla/5.0 (Linux; Android 8.1.0; SM-J260F) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/109.0.5414.118 Mobile Safari/537.36",
+     "mobile", "Chrome", "109", "Android", "8.1"),
+    ("Mozilla/5.0 (Linux; Android 13; SAMSUNG SM-S911B) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "SamsungBrowser/23.0 Chrome/115.0.0.0 Mobile Safari/537.36",
+     "mobile", "Samsung Internet", "23", "Android", "13"),
+    ("Mozilla/5.0 (Linux; Android 12; SAMSUNG SM-T870) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "SamsungBrowser/20.0 Chrome/106.0.5249.126 Safari/537.36",
+     "tablet", "Samsung Internet", "20", "Android", "12"),
+    ("Mozilla/5.0 (Android 14; Mobile; rv:121.0) Gecko/121.0 Firefox/121.0",
+     "mobile", "Firefox", "121", "Android", "14"),
+    ("Mozilla/5.0 (Android 13; Tablet; rv:120.0) Gecko/120.0 Firefox/120.0",
+     "tablet", "Firefox", "120", "Android", "13"),
+    ("Mozilla/5.0 (Linux; Android 13; SM-X700) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/119.0.0.0 Safari/537.36",
+     "tablet", "Chrome", "119", "Android", "13"),
+    ("Mozilla/5.0 (Linux; Android 10; HD1913) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.6099.43 Mobile Safari/537.36 EdgA/120.0.2210.84",
+     "mobile", "Edge", "120", "Android", "10"),
+    ("Mozilla/5.0 (Linux; Android 10; VOG-L29) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/119.0.0.0 Mobile Safari/537.36 OPR/79.2.4195.76643",
+     "mobile", "Opera", "79", "Android", "10"),
+    ("Mozilla/5.0 (Linux; Android 12; Pixel 6 Build/SD1A.210817.023; wv) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Version/4.0 Chrome/94.0.4606.71 Mobile Safari/537.36",
+     "mobile", "Chrome", "94", "Android", "12"),
+    ("Mozilla/5.0 (Windows Phone 10.0; Android 6.0.1; Microsoft; Lumia 950) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/52.0.2743.116 Mobile Safari/537.36 Edge/15.15063",
+     "mobile", "Edge", "15", "Windows Phone", None),
+    # Windows
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Safari/537.36",
+     "desktop", "Chrome", "120", "Windows", "10"),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Safari/537.36 Edg/120.0.2210.91",
+     "desktop", "Edge", "120", "Windows", "10"),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/70.0.3538.102 Safari/537.36 Edge/18.19045",
+     "desktop", "Edge", "18", "Windows", "10"),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+     "desktop", "Firefox", "121", "Windows", "10"),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/119.0.0.0 Safari/537.36 OPR/105.0.0.0",
+     "desktop", "Opera", "105", "Windows", "10"),
+    ("Mozilla/5.0 (Windows NT 6.1; WOW64; Trident/7.0; rv:11.0) like Gecko",
+     "desktop", "Internet Explorer", "11", "Windows", "7"),
+    ("Mozilla/5.0 (Windows NT 6.3; Trident/7.0; rv:11.0) like Gecko",
+     "desktop", "Internet Explorer", "11", "Windows", "8.1"),
+    ("Opera/9.80 (Windows NT 6.1; U; en) Presto/2.10.229 Version/11.62",
+     "desktop", "Opera", None, "Windows", "7"),
+    # macOS, Linux, ChromeOS
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+     "Version/17.1 Safari/605.1.15",
+     "desktop", "Safari", "17", "macOS", "10.15"),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Safari/537.36",
+     "desktop", "Chrome", "120", "macOS", "10.15"),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:121.0) Gecko/20100101 Firefox/121.0",
+     "desktop", "Firefox", "121", "macOS", "10.15"),
+    ("Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0",
+     "desktop", "Firefox", "121", "Linux", None),
+    ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+     "desktop", "Chrome", "120", "Linux", None),
+    ("Mozilla/5.0 (X11; CrOS x86_64 14541.0.0) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/120.0.0.0 Safari/537.36",
+     "desktop", "Chrome", "120", "ChromeOS", None),
+    # Non-browsers
+    ("", "desktop", "unknown", None, "unknown", None),
+    ("curl/8.4.0", "desktop", "unknown", None, "unknown", None),
+    ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+     "desktop", "unknown", None, "unknown", None),
+]
+
+
+@pytest.mark.parametrize("ua, device, browser, browser_version, os, os_version", CORPUS)
+def test_classifies_real_user_agents(ua, device, browser, browser_version, os, os_version):
+    expected = UserAgent(device, browser, browser_version, os, os_version)
+    assert _classify.__wrapped__(ua) == expected
+    assert classify_user_agent(ua) == expected
+
+
+def test_overlong_user_agents_are_truncated():
+    ua = CORPUS[0][0] + "x" * 10_000
+    assert classify_user_agent(ua) == classify_user_agent(CORPUS[0][0])